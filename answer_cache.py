@@ -0,0 +1,328 @@
+"""Cache of agent answers to repeated read-only questions.
+
+"how many agents are alive?" gets asked all day and every time walks the
+orchestrator / planner / controller chain again. AnswerCache remembers the
+answer together with what it was computed from:
+
+- the query, normalized and embedded (same embeddings backend as the
+  EndpointRetriever), so a rephrasing close enough in meaning also hits;
+- the spec version (CalderaSpec.key), a new spec drops everything;
+- the GETs the agent made for it, whichever tool sent them (requests_get,
+  api_batch, api_fan_out, api_pager, plan_dag's prefetch...): the
+  CalderaClient reports every request to its listeners. Each gets a
+  validator (ETag / Last-Modified, else a hash of the body), always asked
+  of the server, not of the HTTP response cache.
+
+A hit is only served when every dependency is still within its resource's
+TTL and revalidates (conditional GET, 304 or same validator). Any POST /
+PUT / PATCH / DELETE through the client invalidates every answer that read
+the same collection. Entries are evicted LRU.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+import requests
+from caldera_client import MUTATING, NO_CACHE, get_client
+from caldera_planner import current_spec
+from intent_router import normalize
+from route_index import split_path
+from endpoint_retriever import RETRY_MAX_S, RETRY_MIN_S
+
+logger = logging.getLogger(__name__)
+
+# Seconds an answer that read this kind of resource may be served without a new agent run.
+RESOURCE_TTLS = {
+    "health": 10,
+    "agents": 30,
+    "operations": 30,
+    "links": 15,
+    "result": 15,
+    "potential-links": 15,
+    "contacts": 30,
+    "facts": 60,
+    "relationships": 60,
+    "schedules": 120,
+    "abilities": 600,
+    "adversaries": 600,
+    "planners": 3600,
+    "objectives": 600,
+    "sources": 600,
+    "plugins": 3600,
+    "obfuscators": 3600,
+    "payloads": 600,
+    "config": 600,
+}
+DEFAULT_TTL = 60
+
+# Cosine similarity two query embeddings need to share an answer.
+DEFAULT_SIMILARITY = float(os.getenv("CALDERA_ANSWER_CACHE_SIMILARITY", 0.92))
+DEFAULT_MAX_ENTRIES = 256
+
+
+class Dependency(NamedTuple):
+    url: str
+    params: Optional[Dict[str, Any]]
+    validator: str  # 'etag:...', 'last-modified:...' or 'sha256:...'
+
+
+class Entry(NamedTuple):
+    text: str
+    vector: Any  # unit-norm query embedding, None when embeddings were unavailable
+    spec_key: Optional[str]
+    answer: str
+    dependencies: List[Dependency]
+    collections: frozenset
+    expires: float
+
+
+def resource_path(url):
+    """'http://host/api/v2/operations/1/links?x=1' -> ['api', 'v2', 'operations', '1', 'links']"""
+    return split_path(url)
+
+
+def collection_of(url):
+    """Top-level collection a URL belongs to: '/api/v2/operations' for any operation sub-resource."""
+    segments = resource_path(url)
+    if segments[:2] == ["api", "v2"] and len(segments) > 2:
+        return "/api/v2/" + segments[2]
+    return "/" + "/".join(segments[:1])
+
+
+def ttl_of(url):
+    """TTL of the innermost resource type in the URL ('links' for /operations/{id}/links)."""
+    for segment in reversed(resource_path(url)):
+        if segment in RESOURCE_TTLS:
+            return RESOURCE_TTLS[segment]
+    return DEFAULT_TTL
+
+
+def _params_key(params):
+    if isinstance(params, dict):
+        return tuple(sorted((str(k), str(v)) for k, v in params.items()))
+    if isinstance(params, (list, tuple)):
+        return tuple(sorted((str(k), str(v)) for k, v in params))
+    return None
+
+
+class AnswerCache:
+    """Semantic answer cache, recording each turn's requests off the CalderaClient.
+
+    Usage per turn: lookup(query) -> cached answer or None; otherwise run the
+    agent and call store(query, answer). The agent's requests in between are
+    what the answer depends on.
+    """
+
+    def __init__(self, api_spec, client=None, embeddings=None, similarity=DEFAULT_SIMILARITY,
+                 max_entries=DEFAULT_MAX_ENTRIES, timeout=10):
+        self.api_spec = api_spec
+        self.client = client or get_client()
+        self._embeddings = embeddings
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._recording = False
+        self._turn_gets: List[tuple] = []
+        self._turn_mutated = False
+        self._last_vector = None
+        self._retry_in = 0.0  # backoff after an embedding failure, as EndpointRetriever
+        self._down_until = 0.0
+        self.hits = self.misses = self.invalidations = 0
+        self.client.listeners.append(self._on_client_request)
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            try:
+                from context import embeddings
+            except Exception as e:  # no embeddings server configured: exact matches only
+                logger.warning("Answer cache without embeddings: %s", e)
+                embeddings = False
+            self._embeddings = embeddings
+        return self._embeddings
+
+    def _spec_key(self):
+        spec = current_spec(self.api_spec)
+        return getattr(spec, "key", None) or str(getattr(self.api_spec, "version", ""))
+
+    def _embed(self, text):
+        if not self.embeddings or time.monotonic() < self._down_until:
+            return None
+        try:
+            import numpy as np
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        except Exception as e:
+            self._retry_in = min(self._retry_in * 2, RETRY_MAX_S) if self._retry_in else RETRY_MIN_S
+            self._down_until = time.monotonic() + self._retry_in
+            logger.warning("Query embedding failed, exact answer cache match only for %.0f s: %s", self._retry_in, e)
+            return None
+        self._retry_in = 0.0
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    # -- per turn ---------------------------------------------------------
+
+    def lookup(self, query) -> Optional[str]:
+        """Cached answer to `query` if it is still valid, else None (and start recording)."""
+        with self._lock:
+            self._recording = False  # the revalidation below is ours, untracked anyway
+            self._turn_gets = []
+            self._turn_mutated = False
+            self._last_vector = None
+        text = normalize(query)
+        spec_key = self._spec_key()
+        candidates = self._candidates(text, spec_key)
+        for key in candidates:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry.expires < time.time() or not self._still_valid(entry):
+                self._drop(key)
+                continue
+            with self._lock:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return entry.answer
+        with self._lock:
+            self.misses += 1
+            self._recording = True
+        return None
+
+    def _candidates(self, text, spec_key):
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if e.spec_key != spec_key]
+            for key in stale:
+                del self._entries[key]
+            if text in self._entries:
+                return [text]
+            has_vectors = any(e.vector is not None for e in self._entries.values())
+        if not has_vectors:
+            return []
+        vector = self._last_vector = self._embed(text)
+        if vector is None:
+            return []
+        with self._lock:
+            scored = [
+                (float(entry.vector @ vector), key)
+                for key, entry in self._entries.items() if entry.vector is not None
+            ]
+        return [key for score, key in sorted(scored, reverse=True) if score >= self.similarity][:3]
+
+    def store(self, query, answer):
+        """Remember the answer of the agent run that followed a missed lookup()."""
+        with self._lock:
+            gets, mutated, vector = list(self._turn_gets), self._turn_mutated, self._last_vector
+            self._recording = False
+        # Answers that changed something, or did not read the API at all, are not reusable.
+        if mutated or not gets or not answer:
+            return False
+        text = normalize(query)
+        dependencies = []
+        for url, params in dict.fromkeys(gets):
+            validator = self._validator(url, params and dict(params))
+            if validator is None:
+                return False
+            dependencies.append(Dependency(url, params and dict(params), validator))
+        if vector is None:
+            vector = self._embed(text)
+        entry = Entry(
+            text, vector, self._spec_key(), answer, dependencies,
+            frozenset(collection_of(d.url) for d in dependencies),
+            time.time() + min(ttl_of(d.url) for d in dependencies),
+        )
+        with self._lock:
+            self._entries[text] = entry
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, method, url):
+        """Drop answers that read the collection a mutating call touched."""
+        collection = collection_of(url)
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if collection in e.collections]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        if stale:
+            logger.info("%s %s invalidated %d cached answer(s)", method, url, len(stale))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "invalidations": self.invalidations}
+
+    def _drop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    # -- validators ---------------------------------------------------------
+
+    def _fetch(self, url, params, headers=None):
+        # around the HTTP cache: a hash of what it holds says nothing about the server's copy
+        with self.client.untracked():
+            return self.client.get(url, params=params, headers={**NO_CACHE, **(headers or {})},
+                                   timeout=self.timeout)
+
+    def _validator(self, url, params):
+        try:
+            resp = self._fetch(url, params)
+        except requests.exceptions.RequestException as e:
+            logger.warning("Not caching, %s unreachable: %s", url, e)
+            return None
+        if resp.status_code != 200:
+            return None
+        if resp.headers.get("ETag"):
+            return "etag:" + resp.headers["ETag"]
+        if resp.headers.get("Last-Modified"):
+            return "last-modified:" + resp.headers["Last-Modified"]
+        return "sha256:" + hashlib.sha256(resp.content).hexdigest()
+
+    def _still_valid(self, entry):
+        for dep in entry.dependencies:
+            kind, _, value = dep.validator.partition(":")
+            headers = {}
+            if kind == "etag":
+                headers["If-None-Match"] = value
+            elif kind == "last-modified":
+                headers["If-Modified-Since"] = value
+            try:
+                resp = self._fetch(dep.url, dep.params, headers)
+            except requests.exceptions.RequestException:
+                return False
+            if resp.status_code == 304:
+                continue
+            if resp.status_code != 200:
+                return False
+            if kind == "etag" and resp.headers.get("ETag") == value:
+                continue
+            if kind == "last-modified" and resp.headers.get("Last-Modified") == value:
+                continue
+            if kind == "sha256" and hashlib.sha256(resp.content).hexdigest() == value:
+                continue
+            return False
+        return True
+
+    # -- requests ------------------------------------------------------------
+
+    def _on_client_request(self, method, url, params):
+        """CalderaClient listener: the turn's GETs, and mutations from anywhere."""
+        if method in MUTATING:
+            with self._lock:
+                self._turn_mutated = self._turn_mutated or self._recording
+            self.invalidate(method, url)
+        elif method == "GET":
+            with self._lock:
+                if self._recording:
+                    self._turn_gets.append((url, _params_key(params)))
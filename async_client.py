@@ -0,0 +1,337 @@
+"""asyncio access to the Caldera API with bounded-concurrency fan-out.
+
+"show the last link result for every running operation" is one GET of the
+operations and then one GET per operation. Inside the ReAct loop each of
+those is its own LLM round trip; here they are coroutines on the shared
+aiohttp session of caldera_client, run concurrently under a global limit
+and a per-host semaphore, and cancelled together when the caller gives up.
+
+Every spec operation is also available as a coroutine named after its
+method and path: GET /api/v2/operations/{id}/links is
+`await client.get_operations_links(id=...)`.
+"""
+import re
+import json
+import random
+import asyncio
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+import aiohttp
+from langchain_core.tools import Tool
+from caldera_client import BACKOFF, BACKOFF_JITTER, IDEMPOTENT, MUTATING, RETRIES, RETRY_STATUSES, cache_key, get_client
+from caldera_planner import current_spec
+from circuit_breaker import CircuitOpenError
+from route_index import RouteIndex, split_path
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 8
+
+
+class Result(NamedTuple):
+    request: str  # "GET /api/v2/operations/123/links"
+    status: int  # 0 when no response came back
+    data: Any  # parsed JSON, or text
+    error: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.error is None and 200 <= self.status < 300
+
+
+def operation_name(endpoint_name):
+    """'GET /api/v2/operations/{id}/links/{link_id}' -> 'get_operations_links_item'"""
+    method, path = endpoint_name.split(" ", 1)
+    segments = split_path(path)
+    if segments[:2] == ["api", "v2"]:
+        segments = segments[2:]
+    words = [s.replace("-", "_") for s in segments if not s.startswith("{")]
+    if segments and segments[-1].startswith("{"):
+        words.append("item")
+    return "_".join([method.lower()] + words)
+
+
+def fill_path(template, values):
+    """Path template with {params} filled from `values`; KeyError for a missing one."""
+    return re.sub(r"\{(\w+)\}", lambda m: str(values[m.group(1)]), template)
+
+
+class AsyncCalderaClient:
+    """Coroutine per spec operation plus fan-out helpers.
+
+    Sessions and semaphores belong to an event loop, so they are created
+    per loop; the object itself can be shared.
+    """
+
+    def __init__(self, api_spec, client=None, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+                 retries=RETRIES):
+        self.api_spec = api_spec
+        self.client = client or get_client()
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self._spec = None
+        self._route_index = None
+        self._operations: Dict[str, str] = {}
+        self._limits: Dict[asyncio.AbstractEventLoop, tuple] = {}
+
+    def route_index(self):
+        spec = current_spec(self.api_spec)
+        if spec is not self._spec:
+            self._route_index = RouteIndex.from_spec(spec)
+            self._operations = {operation_name(name): name for name in self._route_index.names}
+            self._spec = spec
+        return self._route_index
+
+    @property
+    def operations(self):
+        self.route_index()
+        return dict(self._operations)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        endpoint = self.operations.get(name)
+        if endpoint is None:
+            raise AttributeError(f"no spec operation {name!r}")
+
+        async def operation(params=None, body=None, **path_params):
+            return await self.call(endpoint, path_params, params=params, body=body)
+        operation.__name__ = name
+        operation.__doc__ = endpoint
+        return operation
+
+    def _semaphores(self, host):
+        loop = asyncio.get_running_loop()
+        limits = self._limits.get(loop)
+        if limits is None:
+            for stale in [l for l in self._limits if l.is_closed()]:
+                del self._limits[stale]
+            limits = self._limits[loop] = (asyncio.Semaphore(self.concurrency), {})
+        total, per_host = limits
+        if host not in per_host:
+            per_host[host] = asyncio.Semaphore(self.per_host)
+        return total, per_host[host]
+
+    async def request(self, method, path, params=None, body=None) -> Result:
+        """One call, checked against the spec; retried like the sync client."""
+        method = method.upper()
+        url = self.client.url(path)
+        route = self.route_index().match(method, url)
+        label = f"{method} /{'/'.join(split_path(url))}"
+        if route is None:
+            return Result(label, 0, None, f"{method} {urlsplit(url).path} endpoint does not exist.")
+        self.client.notify(method, url, params)
+        cache = self.client.cache
+        key = None
+        if method == "GET" and cache is not None and cache.ttl_for(url) > 0:
+            key = cache_key(url, params)
+            entry = cache.get(key)
+            if entry is not None:
+                return Result(label, entry.status, _parse(entry.content.decode(entry.encoding or "utf-8", "replace")))
+        elif method in MUTATING:
+            try:
+                return await self._send(method, url, label, params, body, None)
+            finally:
+                self.client.invalidate(url)
+        return await self._send(method, url, label, params, body, key)
+
+    async def _send(self, method, url, label, params, body, key) -> Result:
+        cache = self.client.cache
+        session = await self.client.aiosession()
+        total, host = self._semaphores(urlsplit(url).netloc)
+        timeout = aiohttp.ClientTimeout(sock_connect=self.client.timeout_for(url)[0],
+                                        sock_read=self.client.timeout_for(url)[1])
+        attempt = 0
+        while True:
+            try:
+                self.client.breaker.before()
+            except CircuitOpenError as e:
+                return Result(label, 0, None, f"{type(e).__name__}: {e}")
+            try:
+                async with total, host:
+                    async with session.request(method, url, params=params, json=body, timeout=timeout) as resp:
+                        status = resp.status
+                        content = await resp.read()
+                        encoding = resp.get_encoding()
+                        headers = resp.headers
+                        # bytes before decompression (aiohttp >= 3.12), else the Content-Length
+                        wire = getattr(resp.content, "total_raw_bytes", None) or resp.content_length or len(content)
+                self.client.breaker.record(status)
+                self.client.transfer.record(method, url, wire, len(content), headers.get("Content-Encoding"))
+                if status in RETRY_STATUSES and method in IDEMPOTENT and attempt < self.retries:
+                    raise _Retry(status)
+                if key is not None:
+                    cache.put(key, status, headers, content, url, encoding)
+                text = content.decode(encoding, "replace")
+                return Result(label, status, _parse(text), None if status < 400 else f"HTTP {status}")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError, _Retry) as e:
+                if not isinstance(e, _Retry):
+                    self.client.breaker.failure(f"{type(e).__name__}: {e}")
+                # Connection never made it (or a 5xx on a safe method): back off and retry.
+                retryable = isinstance(e, _Retry) or isinstance(e, aiohttp.ClientConnectorError) or method in IDEMPOTENT
+                if attempt >= self.retries or not retryable:
+                    return Result(label, getattr(e, "status", 0), None, f"{type(e).__name__}: {e}")
+            except BaseException:
+                self.client.breaker.release()  # cancelled, or failed on our side: says nothing about the server
+                raise
+            await asyncio.sleep(BACKOFF * 2 ** attempt + random.uniform(0, BACKOFF_JITTER))
+            attempt += 1
+
+    async def call(self, endpoint_name, path_params=None, params=None, body=None) -> Result:
+        method, template = endpoint_name.split(" ", 1)
+        return await self.request(method, fill_path(template, path_params or {}), params=params, body=body)
+
+    async def gather(self, calls: Iterable) -> List[Result]:
+        """Run coroutines concurrently, results in order; cancelling this cancels them all."""
+        tasks = [asyncio.ensure_future(c) for c in calls]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def fan_out(self, endpoint_name, values: Iterable[Dict[str, Any]], params=None) -> List[Result]:
+        """`endpoint_name` once per dict of path params, e.g. every {"id": ...} of a list."""
+        return await self.gather(self.call(endpoint_name, v, params=params) for v in values)
+
+    async def for_each(self, list_path, each_path, key="id", where=None, limit=50, params=None):
+        """GET list_path, keep items matching `where`, then GET each_path for each item's `key`.
+
+        each_path is a template whose single {param} gets the item's key:
+        for_each("/api/v2/operations", "/api/v2/operations/{id}/links",
+        where={"state": "running"}). Returns (list result, [(item, result)]).
+        """
+        names = re.findall(r"\{(\w+)\}", each_path)
+        if len(names) != 1:
+            raise ValueError(f"{each_path} needs exactly one {{param}} for the item {key}")
+        if self.route_index().match("GET", fill_path(each_path, {names[0]: "x"})) is None:
+            raise ValueError(f"GET {each_path} endpoint does not exist.")
+        listing = await self.request("GET", list_path)
+        if not listing.ok or not isinstance(listing.data, list):
+            return listing, []
+        items = [i for i in listing.data if isinstance(i, dict) and _matches(i, where)][:limit]
+        paths = [fill_path(each_path, {names[0]: _field(item, key)}) for item in items]
+        results = await self.gather(self.request("GET", path, params=params) for path in paths)
+        return listing, list(zip(items, results))
+
+
+def _parse(text):
+    try:
+        return json.loads(text) if text else None
+    except ValueError:
+        return text
+
+
+class _Retry(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def _field(item, dotted):
+    for part in dotted.split("."):
+        item = item.get(part) if isinstance(item, dict) else None
+    return item
+
+
+def _matches(item, where):
+    return all(str(_field(item, k)).lower() == str(v).lower() for k, v in (where or {}).items())
+
+
+def run_sync(coro):
+    """Run a coroutine from sync code, also when an event loop is already running here."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result = {}
+
+    def runner():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def run_closing(async_client, coro):
+    """run_sync for a coroutine using `async_client`: the loop is a new one every time, so the
+    aiohttp session it opened is closed before it ends instead of leaking its connector."""
+    async def run():
+        try:
+            return await coro
+        finally:
+            await async_client.client.aclose()
+    return run_sync(run())
+
+
+def summarize(item_key, pairs, max_chars=4000):
+    """Compact text of a for_each() fan-out for the LLM."""
+    lines = []
+    for item, result in pairs:
+        label = f"{item_key}={_field(item, item_key)}" + (f" ({item['name']})" if item.get("name") else "")
+        if not result.ok:
+            lines.append(f"{label}: {result.error}")
+            continue
+        data = result.data
+        if isinstance(data, list):
+            last = json.dumps(data[-1], default=str)[:300] if data else "-"
+            lines.append(f"{label}: {len(data)} items, last: {last}")
+        else:
+            lines.append(f"{label}: {json.dumps(data, default=str)[:300]}")
+    text = "\n".join(lines)
+    return text if len(text) <= max_chars else text[:max_chars] + f"\n… ({len(pairs)} results, truncated)"
+
+
+FAN_OUT_TOOL_NAME = "api_fan_out"
+FAN_OUT_TOOL_DESCRIPTION = (
+    "Use this to GET one sub-resource for every item of a collection in a single step, instead of "
+    "planning one call per item. Input is json: {\"list\": \"/api/v2/operations\", "
+    "\"where\": {\"state\": \"running\"}, \"each\": \"/api/v2/operations/{id}/links\", \"key\": \"id\"}. "
+    "\"where\" and \"key\" (default id) are optional. Returns one line per item."
+)
+
+
+async def afan_out_text(async_client, request):
+    """Run a fan-out described by the tool's json (str or dict) and summarize it."""
+    if isinstance(request, str):
+        request = json.loads(request.strip().strip("`").removeprefix("json"))
+    key = request.get("key", "id")
+    listing, pairs = await async_client.for_each(request["list"], request["each"], key=key,
+                                                 where=request.get("where"), limit=int(request.get("limit", 50)))
+    if not listing.ok:
+        return f"{listing.request} failed: {listing.error}"
+    if not pairs:
+        return f"{listing.request}: no matching items"
+    return summarize(key, pairs)
+
+
+def fan_out_text(async_client, request):
+    """afan_out_text from sync code."""
+    return run_closing(async_client, afan_out_text(async_client, request))
+
+
+def create_fan_out_tool(async_client) -> Tool:
+    """Single string input tool, usable by the planner's ZeroShotAgent orchestrator. Run with
+    ainvoke (chat_repl) it stays on the caller's loop and its pooled session."""
+
+    def _run(request: str) -> str:
+        try:
+            return fan_out_text(async_client, request)
+        except (ValueError, KeyError) as e:
+            return f"Invalid fan-out request: {e}"
+
+    async def _arun(request: str) -> str:
+        try:
+            return await afan_out_text(async_client, request)
+        except (ValueError, KeyError) as e:
+            return f"Invalid fan-out request: {e}"
+
+    return Tool(name=FAN_OUT_TOOL_NAME, description=FAN_OUT_TOOL_DESCRIPTION, func=_run, coroutine=_arun)
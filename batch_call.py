@@ -0,0 +1,217 @@
+"""Several Caldera requests in one tool call.
+
+Each request the agent makes through api_call costs an LLM round trip, so
+"create a source, then start an operation with it, and list the agents" is
+three. The api_batch tool takes the whole list:
+
+    [{"method": "GET", "path": "/api/v2/agents"},
+     {"method": "POST", "path": "/api/v2/sources", "body": {"name": "s1"}},
+     {"method": "POST", "path": "/api/v2/operations",
+      "body": {"name": "op", "source": {"id": "$prev[1].id"}}}]
+
+Items that reference an earlier result ($prev[1].id, $prev[0][0].paw) or
+set "after": true are dependent and run in order once everything before
+them is done; all other items run concurrently up front. As in plan_dag,
+a POST / PUT / PATCH / DELETE and every item after it are dependent too:
+the mutation waits for what came before it, and nothing after it reads
+the state from before it ([DELETE /operations/x, GET /operations]).
+Every item is checked against the spec's RouteIndex before anything is
+sent.
+"""
+import re
+import json
+from typing import Any, Dict, List, Optional
+from langchain_core.tools import Tool
+from async_client import Result, run_closing
+from caldera_client import MUTATING
+
+MAX_ITEMS = 20
+BODY_METHODS = {"POST", "PUT", "PATCH"}
+ALLOWED_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE"}
+
+_REF = re.compile(r"\$prev\[(\d+)\]((?:\.[\w-]+|\[\d+\])*)")
+_STEP = re.compile(r"\.([\w-]+)|\[(\d+)\]")
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _refs(value):
+    """Indices of the earlier items `value` refers to."""
+    if isinstance(value, str):
+        return {int(m.group(1)) for m in _REF.finditer(value)}
+    if isinstance(value, dict):
+        return set().union(*(_refs(v) for v in value.values())) if value else set()
+    if isinstance(value, list):
+        return set().union(*(_refs(v) for v in value)) if value else set()
+    return set()
+
+
+def _lookup(data, steps):
+    for key, index in _STEP.findall(steps):
+        if key:
+            if not isinstance(data, dict) or key not in data:
+                raise BatchError(f"no field {key!r}")
+            data = data[key]
+        else:
+            if not isinstance(data, list) or int(index) >= len(data):
+                raise BatchError(f"no item [{index}]")
+            data = data[int(index)]
+    return data
+
+
+def substitute(value, results):
+    """`value` with $prev[i]... references replaced by data from earlier results."""
+    if isinstance(value, dict):
+        return {k: substitute(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [substitute(v, results) for v in value]
+    if not isinstance(value, str) or "$prev[" not in value:
+        return value
+
+    def resolve(m):
+        result = results[int(m.group(1))]
+        if not result.ok:
+            raise BatchError(f"$prev[{m.group(1)}] failed: {result.error}")
+        return _lookup(result.data, m.group(2))
+
+    whole = _REF.fullmatch(value)
+    if whole:  # keep the referenced value's type: ids can be ints, bodies can embed objects
+        return resolve(whole)
+    return _REF.sub(lambda m: str(resolve(m)), value)
+
+
+def validate(items, route_index, allowed_methods=ALLOWED_METHODS) -> List[Dict[str, Any]]:
+    """Normalized items, or BatchError listing every problem; nothing is sent on error."""
+    if isinstance(items, str):
+        items = json.loads(items)
+    if isinstance(items, dict):
+        items = items.get("items", [items])
+    if not isinstance(items, list) or not items:
+        raise BatchError("expected a non-empty list of {method, path, params, body} items")
+    if len(items) > MAX_ITEMS:
+        raise BatchError(f"at most {MAX_ITEMS} items per batch, got {len(items)}")
+    normalized, problems = [], []
+    mutated = False  # an earlier item changes something
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or "path" not in item:
+            problems.append(f"[{i}] needs at least a path")
+            continue
+        method = str(item.get("method", "GET")).upper()
+        path = str(item["path"]).strip()
+        params, body = item.get("params") or None, item.get("body") or None
+        refs = _refs(path) | _refs(params) | _refs(body)
+        if method not in allowed_methods:
+            problems.append(f"[{i}] {method} is not allowed")
+        if body is not None and method not in BODY_METHODS:
+            problems.append(f"[{i}] {method} takes no body")
+        if any(r >= i for r in refs):
+            problems.append(f"[{i}] can only reference earlier items")
+        # References stand in for one path segment while checking the route.
+        if route_index.match(method, _REF.sub("x", path)) is None:
+            problems.append(f"[{i}] {method} {path} endpoint does not exist.")
+        normalized.append({
+            "method": method, "path": path, "params": params, "body": body,
+            "dependent": bool(refs) or bool(item.get("after")) or mutated or method in MUTATING,
+        })
+        mutated = mutated or method in MUTATING
+    if problems:
+        raise BatchError("; ".join(problems))
+    return normalized
+
+
+async def run_batch(async_client, items) -> List[Result]:
+    """Results in item order. Independent items run concurrently first, dependent ones in order."""
+    results: List[Optional[Result]] = [None] * len(items)
+    independent = [i for i, item in enumerate(items) if not item["dependent"]]
+    for i, result in zip(independent, await async_client.gather(
+        async_client.request(items[i]["method"], items[i]["path"], params=items[i]["params"], body=items[i]["body"])
+        for i in independent
+    )):
+        results[i] = result
+    for i, item in enumerate(items):
+        if not item["dependent"]:
+            continue
+        label = f"{item['method']} {item['path']}"
+        try:
+            path = substitute(item["path"], results)
+            params = substitute(item["params"], results)
+            body = substitute(item["body"], results)
+        except BatchError as e:
+            results[i] = Result(label, 0, None, f"skipped, {e}")
+            continue
+        results[i] = await async_client.request(item["method"], path, params=params, body=body)
+    return results
+
+
+def _compact(data, width=300):
+    if isinstance(data, list):
+        if not data:
+            return "[]"
+        first = data[0]
+        keys = f" fields {', '.join(list(first)[:8])}" if isinstance(first, dict) else ""
+        return f"{len(data)} items{keys}; first: {json.dumps(first, default=str)[:width]}"
+    text = json.dumps(data, default=str) if not isinstance(data, str) else data
+    return text if len(text) <= width else text[:width] + "…"
+
+
+def summarize(results, max_chars=4000):
+    """One observation for the whole batch."""
+    lines = []
+    for i, result in enumerate(results):
+        if result.ok:
+            lines.append(f"[{i}] {result.request} -> {result.status}: {_compact(result.data)}")
+        else:
+            lines.append(f"[{i}] {result.request} -> {result.error}")
+    ok = sum(r.ok for r in results)
+    text = f"{ok}/{len(results)} succeeded\n" + "\n".join(lines)
+    return text if len(text) <= max_chars else text[:max_chars] + "\n… (truncated)"
+
+
+def _validated(async_client, items, allowed_methods):
+    if isinstance(items, str):
+        items = json.loads(items.strip().strip("`").removeprefix("json"))
+    return validate(items, async_client.route_index(), allowed_methods)
+
+
+def batch_text(async_client, items, allowed_methods=ALLOWED_METHODS):
+    """Validate, run and summarize a batch given as a list, {"items": [...]} or json text."""
+    try:
+        normalized = _validated(async_client, items, allowed_methods)
+    except (BatchError, ValueError) as e:
+        return f"Batch rejected, nothing was sent: {e}"
+    return summarize(run_closing(async_client, run_batch(async_client, normalized)))
+
+
+async def abatch_text(async_client, items, allowed_methods=ALLOWED_METHODS):
+    """batch_text on the running loop and its pooled session."""
+    try:
+        normalized = _validated(async_client, items, allowed_methods)
+    except (BatchError, ValueError) as e:
+        return f"Batch rejected, nothing was sent: {e}"
+    return summarize(await run_batch(async_client, normalized))
+
+
+BATCH_TOOL_NAME = "api_batch"
+BATCH_TOOL_DESCRIPTION = (
+    "Use this to send several API requests in one step. Input is a json list of "
+    "{\"method\", \"path\", \"params\", \"body\"} items. Independent reads run in parallel; a POST, PUT, PATCH or "
+    "DELETE runs after the items before it, and the items after it wait for it. An item can use "
+    "a value from an earlier item's response with $prev[N].field (e.g. \"$prev[0].id\", \"$prev[1][0].paw\") "
+    "and then runs after it, or set \"after\": true to run in order. Returns one line per item."
+)
+
+
+def create_batch_tool(async_client, allowed_methods=ALLOWED_METHODS) -> Tool:
+    """Single string input tool, usable by the planner's ZeroShotAgent orchestrator."""
+
+    async def _arun(request: str) -> str:
+        return await abatch_text(async_client, request, allowed_methods)
+
+    return Tool(
+        name=BATCH_TOOL_NAME,
+        description=BATCH_TOOL_DESCRIPTION,
+        func=lambda request: batch_text(async_client, request, allowed_methods),
+        coroutine=_arun,
+    )
@@ -0,0 +1,260 @@
+"""Planner ReAct stack vs native tool calling: LLM calls, tokens and time per task.
+
+Usage: python bench_agent_engines.py [--call-ms 400] [--prompt-ms-per-1k 50] [--output-ms-per-token 4] [-v]
+
+Both engines run against a local stand-in for Caldera with the real spec
+and the same tools around them (the HTTP layer, output extraction), but
+with a scripted model: each task has the completions a model writes for
+it under each engine, in call order. The planner stack needs them at every
+hop: orchestrator -> api_planner -> orchestrator -> api_controller (a
+ReAct turn per request) -> orchestrator. One planner task has a format slip
+(no "Action Input:"), retried as handle_parsing_errors does. The tool
+calling engine needs one model turn per round of tool calls, plus the
+answer. The model sleeps --call-ms plus time per prompt / output token,
+counted with doc_render.count_tokens on what each engine actually sends
+(tool schemas included), and TurnMetrics counts calls and tokens like
+main.py does. The requests the stand-in saw are checked per task.
+"""
+import io
+import json
+import time
+import argparse
+import contextlib
+import threading
+from typing import Any, List
+from http.server import ThreadingHTTPServer
+from langchain_core.language_models.llms import LLM
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+import caldera_planner
+from bench_output_extractor import _Handler as _BaseHandler
+from caldera_client import CalderaClient
+from doc_render import count_tokens
+from load_spec import load_caldera_spec
+from metrics import TurnMetrics
+from tool_agent import create_tool_calling_agent
+
+LATENCY = {"call_s": 0.4, "prompt_s_per_token": 50e-6, "output_s_per_token": 4e-3}
+SEEN = []
+
+
+class _Handler(_BaseHandler):
+    def _serve(self):
+        SEEN.append(f"{self.command} {self.path.split('?')[0]}")
+        super()._serve()
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _serve
+
+
+def _sleep(prompt_tokens, output_tokens):
+    time.sleep(LATENCY["call_s"] + prompt_tokens * LATENCY["prompt_s_per_token"]
+               + output_tokens * LATENCY["output_s_per_token"])
+
+
+class _ScriptedLLM(LLM):
+    """Text completions for the ReAct stack, in call order."""
+
+    script: List[str] = []
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        text = self.script.pop(0)
+        _sleep(count_tokens(prompt), count_tokens(text))
+        return text
+
+
+class _ScriptedChatModel(BaseChatModel):
+    """AIMessages (tool calls or an answer) for the tool calling engine, in call order."""
+
+    script: List[Any] = []
+
+    @property
+    def _llm_type(self):
+        return "scripted-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        message = self.script.pop(0)
+        prompt = "\n".join(f"{m.content} {json.dumps(getattr(m, 'tool_calls', None) or '')}" for m in messages)
+        output = f"{message.content} {json.dumps(message.tool_calls)}"
+        _sleep(count_tokens(prompt + json.dumps(tools or [])), count_tokens(output))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _calls(*calls):
+    return AIMessage("", tool_calls=[{"name": n, "args": a, "id": f"call_{i}"} for i, (n, a) in enumerate(calls)])
+
+
+def _request(method, path, **args):
+    return "caldera_request", {"method": method, "path": path, **args}
+
+
+def _orchestrator(thought, tool, tool_input):
+    return f"Thought: {thought}\nAction: {tool}\nAction Input: {tool_input}"
+
+
+def _done(answer):
+    return f"Thought: I am finished executing the plan.\nFinal Answer: {answer}"
+
+
+def _controller(method, base, path, instructions, data=None):
+    tool_input = {"url": base + path, "params": {}, "output_instructions": instructions}
+    if data is not None:
+        tool_input["data"] = data
+    return f"Action: requests_{method.lower()}\nAction Input: {json.dumps(tool_input)}"
+
+
+def tasks(base):
+    """(query, planner script, tool calling script, requests the server must see)"""
+    agents = "Agents paw00 (ws-00) ... paw29 (ws-29), 30 in all."
+    op1 = "Operation op-1 is finished, adversary Discovery; there are 30 agents."
+    started = "Started operation nightly (op-new) with the Hunter adversary."
+    sleep = "Agent paw03 now sleeps 5-10 s."
+    exfil = "100 exfiltration abilities: ab-2, ab-5, ... ab-299."
+    plan1 = "1. GET /api/v2/agents to list the agents and their hosts"
+    plan2 = "1. GET /api/v2/operations/op-1 to get its state and adversary\n2. GET /api/v2/agents to count the agents"
+    plan3 = ("1. GET /api/v2/adversaries to find the Hunter adversary id\n"
+             "2. POST /api/v2/operations to start operation nightly with that adversary")
+    plan4 = "1. PATCH /api/v2/agents/paw03 to set sleep_min 5 and sleep_max 10"
+    plan5 = "1. GET /api/v2/abilities to list the abilities whose tactic is exfiltration"
+    return [
+        ("List the agents with their host", [
+            _orchestrator("I need a plan.", "api_planner", "list the agents with their host"),
+            plan1,
+            _orchestrator("Execute the plan.", "api_controller", plan1),
+            _controller("GET", base, "/api/v2/agents", "Extract the paw and host of each agent"),
+            f"Thought: I have the agents.\nFinal Answer: {agents}",
+            _done(agents),
+        ], [
+            _calls(_request("GET", "/api/v2/agents", fields="paw,host", limit=50)),
+            AIMessage(agents),
+        ], ["GET /api/v2/agents"]),
+        ("State and adversary of operation op-1, and how many agents are there?", [
+            _orchestrator("I need a plan.", "api_planner", "state and adversary of op-1, number of agents"),
+            plan2,
+            _orchestrator("Execute the plan.", "api_controller", plan2),
+            _controller("GET", base, "/api/v2/operations/op-1", "the state and adversary name of the operation"),
+            _controller("GET", base, "/api/v2/agents", "How many agents are there?"),
+            f"Thought: I have both.\nFinal Answer: {op1}",
+            _done(op1),
+        ], [
+            _calls(_request("GET", "/api/v2/operations/op-1", fields="state,adversary.name"),
+                   _request("GET", "/api/v2/agents", fields="paw", limit=1)),
+            AIMessage(op1),
+        ], ["GET /api/v2/operations/op-1", "GET /api/v2/agents"]),
+        ("Start an operation named nightly with the Hunter adversary", [
+            _orchestrator("I need a plan.", "api_planner", "start operation nightly with adversary Hunter"),
+            plan3,
+            _orchestrator("Execute the plan.", "api_controller", plan3),
+            _controller("GET", base, "/api/v2/adversaries", "the id of the adversary named Hunter"),
+            _controller("POST", base, "/api/v2/operations", "the id of the created operation",
+                        {"name": "nightly", "adversary": {"adversary_id": "ad-0"}}),
+            f"Thought: Done.\nFinal Answer: {started}",
+            _done(started),
+        ], [
+            _calls(_request("GET", "/api/v2/adversaries", fields="adversary_id,name")),
+            _calls(_request("POST", "/api/v2/operations",
+                            body={"name": "nightly", "adversary": {"adversary_id": "ad-0"}}, fields="id,name")),
+            AIMessage(started),
+        ], ["GET /api/v2/adversaries", "POST /api/v2/operations"]),
+        ("Set the sleep of agent paw03 to 5-10 seconds", [
+            _orchestrator("I need a plan.", "api_planner", "set the sleep of agent paw03 to 5-10 seconds"),
+            plan4,
+            _orchestrator("Execute the plan.", "api_controller", plan4),
+            _controller("PATCH", base, "/api/v2/agents/paw03", "the new sleep_min and sleep_max",
+                        {"sleep_min": 5, "sleep_max": 10}),
+            f"Thought: Done.\nFinal Answer: {sleep}",
+            _done(sleep),
+        ], [
+            _calls(("endpoint_docs", {"endpoint": "PATCH /api/v2/agents/{paw}"})),
+            _calls(_request("PATCH", "/api/v2/agents/paw03", body={"sleep_min": 5, "sleep_max": 10},
+                            fields="paw,sleep_min,sleep_max")),
+            AIMessage(sleep),
+        ], ["PATCH /api/v2/agents/paw03"]),
+        ("Which abilities are exfiltration?", [
+            "Thought: I should plan how to list exfiltration abilities.\nAction: api_planner",  # format slip
+            _orchestrator("I need a plan.", "api_planner", "list the abilities whose tactic is exfiltration"),
+            plan5,
+            _orchestrator("Execute the plan.", "api_controller", plan5),
+            _controller("GET", base, "/api/v2/abilities", "ability_id of abilities whose tactic is exfiltration"),
+            f"Thought: I have them.\nFinal Answer: {exfil}",
+            _done(exfil),
+        ], [
+            _calls(_request("GET", "/api/v2/abilities", fields="ability_id,name", limit=100,
+                            params={"tactic": "exfiltration"})),
+            AIMessage(exfil),
+        ], ["GET /api/v2/abilities"]),
+    ]
+
+
+def run(agent, model, query, script, expected, verbose):
+    model.script[:] = script
+    SEEN.clear()
+    metrics = TurnMetrics(path=None)
+    metrics.start_turn(query)
+    start = time.perf_counter()
+    # langchain's controller agent prints its chain whatever verbose says
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+        output = agent.invoke({"input": query}, config={"callbacks": [metrics]})["output"]
+    wall = time.perf_counter() - start
+    totals = metrics.end_turn()["totals"]
+    ok = sorted(SEEN) == sorted(expected) and not model.script
+    return totals["calls"], totals["prompt_tokens"], totals["completion_tokens"], wall, ok, output
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--call-ms", type=float, default=400)
+    parser.add_argument("--prompt-ms-per-1k", type=float, default=50)
+    parser.add_argument("--output-ms-per-token", type=float, default=4)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    LATENCY.update(call_s=args.call_ms / 1000, prompt_s_per_token=args.prompt_ms_per_1k / 1e6,
+                   output_s_per_token=args.output_ms_per_token / 1000)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    spec = load_caldera_spec()
+    spec.servers[0]["url"] = base
+    client = CalderaClient(base_url=base, cache=False)
+    operations = ["GET", "POST", "PUT", "DELETE", "PATCH"]
+
+    llm = _ScriptedLLM()
+    planner = caldera_planner.create_openapi_agent(
+        spec, client.requests_wrapper(), llm, verbose=args.verbose, allow_dangerous_requests=True,
+        allowed_operations=operations, agent_executor_kwargs={"handle_parsing_errors": True})
+    chat = _ScriptedChatModel()
+    native = create_tool_calling_agent(spec, chat, client, allowed_operations=operations,
+                                       allow_dangerous_requests=True, verbose=args.verbose)
+
+    print(f"model: {args.call_ms:.0f} ms per call + {args.prompt_ms_per_1k:g} ms per 1k prompt tokens "
+          f"+ {args.output_ms_per_token:g} ms per output token")
+    print(f"{'task':<44} {'engine':<8} {'calls':>5} {'prompt':>7} {'output':>6} {'time':>7}  requests")
+    totals = {"planner": [0, 0, 0, 0.0], "tools": [0, 0, 0, 0.0]}
+    for query, planner_script, tool_script, expected in tasks(base):
+        for engine, agent, model, script in (("planner", planner, llm, planner_script),
+                                             ("tools", native, chat, tool_script)):
+            calls, prompt, output, wall, ok, answer = run(agent, model, query, script, expected, args.verbose)
+            for i, v in enumerate((calls, prompt, output, wall)):
+                totals[engine][i] += v
+            print(f"{query[:44]:<44} {engine:<8} {calls:5} {prompt:7} {output:6} {wall:6.1f}s  "
+                  f"{'ok' if ok else 'MISMATCH ' + str(SEEN)}")
+    for engine, (calls, prompt, output, wall) in totals.items():
+        print(f"{'total':<44} {engine:<8} {calls:5} {prompt:7} {output:6} {wall:6.1f}s")
+    p, t = totals["planner"], totals["tools"]
+    print(f"tool calling: LLM calls -{1 - t[0] / p[0]:.0%}, prompt tokens -{1 - t[1] / p[1]:.0%}, "
+          f"time -{1 - t[3] / p[3]:.0%}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
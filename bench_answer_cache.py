@@ -0,0 +1,119 @@
+"""Answer cache hits against a local stand-in for Caldera: what a hit costs, and when it must miss.
+
+Usage: python bench_answer_cache.py [--request-ms 50] [--repeat 20]
+
+Each scenario runs a turn the way the chat loop does: lookup() misses, the
+"agent" makes its GETs through the CalderaClient (whose response cache is
+on, as in main), store() keeps the answer. Then the question is asked
+again, after the scenario changed something or not, and the lookup must
+hit or miss as listed. Reports the time of a hit (the revalidating GETs,
+each --request-ms) and ok / FAILED per scenario.
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from caldera_client import CalderaClient
+from load_spec import load_caldera_spec
+from answer_cache import AnswerCache
+
+REQUEST_S = [0.05]
+DATA = {}
+
+
+def reset_data():
+    DATA.clear()
+    DATA["/api/v2/agents"] = [{"paw": f"paw{i:02}", "host": f"ws-{i:02}", "trusted": True} for i in range(12)]
+    DATA["/api/v2/operations"] = [{"id": "op-1", "name": "nightly", "state": "running"}]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        time.sleep(REQUEST_S[0])
+        path = self.path.split("?")[0]
+        if self.command == "DELETE" and path.startswith("/api/v2/agents/"):
+            DATA["/api/v2/agents"] = [a for a in DATA["/api/v2/agents"] if a["paw"] != path.rsplit("/", 1)[1]]
+            data = {}
+        else:
+            data = DATA.get(path)
+        body = json.dumps(data if data is not None else {"error": "no route"}).encode()
+        self.send_response(200 if data is not None else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_DELETE = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+def _untrust(client):
+    # the server's copy changes, the client's response cache (agents: 5 s) still has the old one
+    DATA["/api/v2/agents"][3]["trusted"] = False
+
+
+def _delete(client):
+    client.delete("/api/v2/agents/paw05")
+
+
+# (name, change between the two asks, should the second ask hit)
+SCENARIOS = [
+    ("unchanged", None, True),
+    ("changed on the server within the HTTP cache TTL", _untrust, False),
+    ("deleted through the client", _delete, False),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--request-ms", type=float, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    REQUEST_S[0] = args.request_ms / 1000
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    spec = load_caldera_spec()
+    spec.servers[0]["url"] = base
+    client = CalderaClient(base_url=base)
+    query = "how many trusted agents are there?"
+
+    print(f"{args.request_ms:.0f} ms per request")
+    for name, change, should_hit in SCENARIOS:
+        reset_data()
+        client.cache.clear()
+        cache = AnswerCache(spec, client, embeddings=False)
+        cache.lookup(query)
+        agents = client.get("/api/v2/agents").json()
+        client.get("/api/v2/operations")
+        cache.store(query, f"{sum(a['trusted'] for a in agents)} trusted agents")
+        if change is not None:
+            change(client)
+        start = time.perf_counter()
+        hit = cache.lookup(query) is not None
+        elapsed = time.perf_counter() - start
+        if hit and should_hit:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                cache.lookup(query)
+            elapsed = (time.perf_counter() - start) / args.repeat
+        client.listeners.remove(cache._on_client_request)
+        print(f"{name:<50} {'hit ' if hit else 'miss'} in {elapsed * 1000:6.1f} ms   "
+              f"{'ok' if hit == should_hit else 'FAILED'}")
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""BM25 endpoint search: build time, query latency and recall on labelled queries.
+
+Usage: python bench_bm25.py
+"""
+import time
+import statistics
+from load_spec import load_caldera_spec
+from bm25_index import BM25Index
+
+# (query, endpoint that answers it)
+LABELLED_QUERIES = [
+    ("which endpoint sets an agent's sleep?", "PATCH /api/v2/agents/{paw}"),
+    ("list all agents", "GET /api/v2/agents"),
+    ("is the caldera server healthy", "GET /api/v2/health"),
+    ("delete an agent by paw", "DELETE /api/v2/agents/{paw}"),
+    ("show the links of an operation", "GET /api/v2/operations/{id}/links"),
+    ("get the output of a link", "GET /api/v2/operations/{id}/links/{link_id}/result"),
+    ("start a new operation", "POST /api/v2/operations"),
+    ("stop a running operation", "PATCH /api/v2/operations/{id}"),
+    ("operation report", "POST /api/v2/operations/{id}/report"),
+    ("event logs of an operation", "POST /api/v2/operations/{id}/event-logs"),
+    ("list adversary profiles", "GET /api/v2/adversaries"),
+    ("create a new adversary", "POST /api/v2/adversaries"),
+    ("find abilities for a technique", "GET /api/v2/abilities"),
+    ("update an ability", "PATCH /api/v2/abilities/{ability_id}"),
+    ("list fact sources", "GET /api/v2/sources"),
+    ("add a fact with a trait and value", "POST /api/v2/facts"),
+    ("facts collected in an operation", "GET /api/v2/facts/{operation_id}"),
+    ("relationships between facts", "GET /api/v2/relationships"),
+    ("list planners", "GET /api/v2/planners"),
+    ("available obfuscators", "GET /api/v2/obfuscators"),
+    ("list c2 contacts", "GET /api/v2/contacts"),
+    ("upload a payload file", "POST /api/v2/payloads"),
+    ("list payloads", "GET /api/v2/payloads"),
+    ("deploy commands for an ability", "GET /api/v2/deploy_commands/{ability_id}"),
+    ("change the main server config", "PATCH /api/v2/config/main"),
+    ("list objectives", "GET /api/v2/objectives"),
+    ("create a schedule for an operation", "POST /api/v2/schedules"),
+    ("potential links for an agent in an operation", "GET /api/v2/operations/{id}/potential-links/{paw}"),
+    ("summary of operations", "GET /api/v2/operations/summary"),
+    ("enabled plugins", "GET /api/v2/plugins"),
+]
+
+
+def main():
+    api_spec = load_caldera_spec()
+    names = {name for name, _, _ in api_spec.endpoints}
+    queries = [(q, expected) for q, expected in LABELLED_QUERIES if expected in names]
+
+    builds = []
+    for _ in range(5):
+        start = time.perf_counter()
+        index = BM25Index.from_spec(api_spec)
+        builds.append((time.perf_counter() - start) * 1000)
+
+    hits_at = {1: 0, 3: 0, 5: 0}
+    latencies = []
+    for query, expected in queries:
+        start = time.perf_counter()
+        results = index.search(query, k=5)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        ranked = [name for name, _ in results]
+        for k in hits_at:
+            hits_at[k] += expected in ranked[:k]
+        if expected not in ranked[:1]:
+            print(f"  miss@1  {query!r}: got {ranked[:3]}")
+
+    print(f"documents {len(index.keys)}, queries {len(queries)}")
+    print(f"build     median {statistics.median(builds):6.1f} ms")
+    print(f"query     median {statistics.median(latencies):6.0f} us  max {max(latencies):6.0f} us")
+    for k, hits in hits_at.items():
+        print(f"recall@{k}  {hits / len(queries):.2f}")
+
+
+if __name__ == "__main__":
+    main()
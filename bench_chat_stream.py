@@ -0,0 +1,138 @@
+"""Streamed turns vs invoke(): time to first output, and Ctrl-C during a turn.
+
+Usage: python bench_chat_stream.py [--call-ms 400] [--output-ms-per-token 4] [--request-ms 300]
+
+The tool calling engine answers bench_agent_engines' tasks against a local
+stand-in for Caldera (--request-ms per request), with a scripted chat model
+that streams: --call-ms before the first chunk, then --output-ms-per-token
+per token. Each task runs once with invoke(), where nothing shows until the
+answer, and once through chat_repl.run_turn on the async client, which
+reports time to first token and to first tool result. Then a SIGINT is sent
+in the middle of a turn: the turn must end cancelled, and the next turn
+must still work on the same event loop, aiohttp session and response cache.
+"""
+import io
+import os
+import time
+import signal
+import asyncio
+import argparse
+import threading
+from http.server import ThreadingHTTPServer
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+import bench_agent_engines
+from bench_agent_engines import LATENCY, _Handler as _BaseHandler, _ScriptedChatModel, tasks
+from async_client import AsyncCalderaClient
+from caldera_client import CalderaClient
+from chat_repl import run_turn
+from load_spec import load_caldera_spec
+from tool_agent import create_tool_calling_agent
+
+REQUEST_S = [0.3]
+
+
+class _Handler(_BaseHandler):
+    def _serve(self):
+        time.sleep(REQUEST_S[0])
+        try:
+            super()._serve()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client went away, the turn was cancelled
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _serve
+
+
+class _StreamingChatModel(_ScriptedChatModel):
+    """_ScriptedChatModel that also streams: the call latency, then the answer token by token
+    (tool calls come whole, like most providers send them)."""
+
+    async def _astream(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        message = self.script.pop(0)
+        await asyncio.sleep(LATENCY["call_s"])
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk("", tool_call_chunks=[
+                {"name": c["name"], "args": bench_agent_engines.json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)]))
+            return
+        for i, word in enumerate(message.content.split(" ")):
+            await asyncio.sleep(LATENCY["output_s_per_token"])
+            chunk = ChatGenerationChunk(message=AIMessageChunk(word if i == 0 else " " + word))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def _sigint_after(seconds):
+    threading.Timer(seconds, os.kill, (os.getpid(), signal.SIGINT)).start()
+
+
+async def bench(agent, model, client, task_list):
+    rows = []
+    for query, _, script, _ in task_list:
+        model.script[:] = list(script)
+        start = time.perf_counter()
+        await asyncio.to_thread(agent.invoke, {"input": query})
+        blocking = time.perf_counter() - start
+        model.script[:] = list(script)
+        turn = await run_turn(agent, {"input": query}, out=io.StringIO())
+        rows.append((query, blocking, turn))
+
+    # Ctrl-C half way through the first task, then the same task again
+    query, _, script, _ = task_list[0]
+    session = await client.aiosession()
+    model.script[:] = list(script)
+    _sigint_after(LATENCY["call_s"] + REQUEST_S[0] / 2)
+    cancelled = await run_turn(agent, {"input": query}, out=io.StringIO())
+    model.script[:] = list(script)
+    again = await run_turn(agent, {"input": query}, out=io.StringIO())
+    same_session = await client.aiosession() is session
+    await client.aclose()
+    return rows, cancelled, again, same_session
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--call-ms", type=float, default=400)
+    parser.add_argument("--output-ms-per-token", type=float, default=4)
+    parser.add_argument("--request-ms", type=float, default=300)
+    args = parser.parse_args()
+    LATENCY.update(call_s=args.call_ms / 1000, prompt_s_per_token=0.0, output_s_per_token=args.output_ms_per_token / 1000)
+    REQUEST_S[0] = args.request_ms / 1000
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    spec = load_caldera_spec()
+    spec.servers[0]["url"] = base
+    client = CalderaClient(base_url=base)
+    model = _StreamingChatModel()
+    agent = create_tool_calling_agent(spec, model, client, allowed_operations=["GET", "POST", "PUT", "DELETE", "PATCH"],
+                                      allow_dangerous_requests=True, async_client=AsyncCalderaClient(spec, client))
+    # no cache hits between the invoke() and the streamed run of a task
+    client.cache.ttls = {k: 0 for k in client.cache.ttls}
+    client.cache.default_ttl = 0
+    task_list = [t for t in tasks(base) if all(isinstance(m, AIMessage) for m in t[2])]
+
+    rows, cancelled, again, same_session = asyncio.run(bench(agent, model, client, task_list))
+    print(f"model {args.call_ms:.0f} ms per call + {args.output_ms_per_token:g} ms per token, "
+          f"{args.request_ms:.0f} ms per request")
+    print(f"{'task':<44} {'invoke':>7} {'stream':>7} {'1st token':>9} {'1st result':>10}")
+    for query, blocking, turn in rows:
+        first_result = f"{turn.first_tool_result_s:9.2f}s" if turn.first_tool_result_s is not None else f"{'-':>10}"
+        print(f"{query[:44]:<44} {blocking:6.2f}s {turn.wall_s:6.2f}s {turn.ttft_s:8.2f}s {first_result}")
+    blocking = sum(r[1] for r in rows)
+    ttft = sum(r[2].ttft_s for r in rows)
+    first = [r[2].first_tool_result_s for r in rows if r[2].first_tool_result_s is not None]
+    print(f"first output on screen: {blocking / len(rows):.2f} s with invoke(), first tool result "
+          f"{sum(first) / len(first):.2f} s and first answer token {ttft / len(rows):.2f} s streamed (means)")
+    print(f"Ctrl-C after {LATENCY['call_s'] + REQUEST_S[0] / 2:.2f} s: cancelled={cancelled.cancelled} "
+          f"at {cancelled.wall_s:.2f} s; next turn {'ok' if again.output and not again.cancelled else 'FAILED'} "
+          f"({again.wall_s:.2f} s), same aiohttp session: {same_session}")
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
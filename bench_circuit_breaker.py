@@ -0,0 +1,110 @@
+"""Agent calls against a Caldera server that hangs for a while, with and without the breaker.
+
+Usage: python bench_circuit_breaker.py [--calls 12] [--down 8] [--timeout 2]
+
+A local stand-in answers /api/v2/agents and HEAD /api/v2/health, then for
+--down seconds accepts connections but never answers (a server stuck
+restarting), then answers again. --calls GETs, spread over the outage,
+go through a CalderaClient with --timeout as read timeout (30 s in the
+real client), once with a breaker that never opens and once with the
+breaker and its health prober. Reports the time spent waiting on the
+calls that failed, and how long after the server came back the breaker
+let requests through again.
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from caldera_client import CalderaClient
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+HANG = threading.Event()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _serve(self, body):
+        while HANG.is_set():
+            time.sleep(0.05)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        return body
+
+    def do_GET(self):
+        self.wfile.write(self._serve(json.dumps([{"paw": "abc", "host": "ws-1"}]).encode()))
+
+    def do_HEAD(self):
+        self._serve(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def run(base, breaker, calls, down, timeout, probe):
+    client = CalderaClient(base_url=base, cache=False, timeouts={}, default_timeout=timeout, retries=0,
+                           breaker=breaker)
+    if probe:
+        client.start_health_probe(interval=5, min_interval=0.25, max_interval=2, timeout=timeout)
+    time.sleep(0.3)
+    HANG.set()
+    outage_end = time.monotonic() + down
+    waited, failed, fast, recovered = 0.0, 0, 0, None
+    began = time.perf_counter()
+    spacing = down * 1.5 / calls
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            client.get("/api/v2/agents").raise_for_status()
+            if recovered is None and time.monotonic() > outage_end:
+                recovered = time.monotonic() - outage_end
+        except CircuitOpenError:
+            fast += 1
+            waited += time.perf_counter() - start
+        except requests.exceptions.RequestException:
+            failed += 1
+            waited += time.perf_counter() - start
+        if time.monotonic() >= outage_end:
+            HANG.clear()
+        time.sleep(max(spacing - (time.perf_counter() - start), 0))
+    HANG.clear()
+    # time to the first successful call after the outage
+    while recovered is None:
+        try:
+            client.get("/api/v2/agents")
+            recovered = time.monotonic() - outage_end
+        except requests.exceptions.RequestException:
+            time.sleep(0.05)
+    client.close()
+    return waited, failed, fast, recovered, time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=12)
+    parser.add_argument("--down", type=float, default=8)
+    parser.add_argument("--timeout", type=float, default=2)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.handle_error = lambda *a: None  # broken pipes from calls that gave up
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"{args.calls} calls over a {args.down:.0f} s outage (+50%), read timeout {args.timeout:.0f} s")
+    for label, breaker, probe in (
+        ("no breaker", CircuitBreaker(failure_threshold=10 ** 9), False),
+        ("breaker + health probe", CircuitBreaker(), True),
+    ):
+        waited, failed, fast, recovered, wall = run(base, breaker, args.calls, args.down, args.timeout, probe)
+        print(f"{label:<24} {waited:6.1f} s waiting on failed calls  {failed:3} timed out  {fast:3} failed fast  "
+              f"back {recovered:4.1f} s after the server  {wall:5.1f} s in all")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
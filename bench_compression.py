@@ -0,0 +1,179 @@
+"""Large Caldera responses over a 5 Mbit link, with and without compress_proxy.
+
+Usage: python bench_compression.py [--mbit 5] [--rtt-ms 40] [--level 6] [--scale 1]
+
+A local stand-in for Caldera (no compression, like the real server) serves
+an operation report, its event logs and the ability list, realistic
+repetitive JSON of a few MB each. The client (CalderaClient, which always
+asks for gzip) reaches it through a relay throttled to --mbit each way
+with --rtt-ms of latency, either directly or through compress_proxy
+running next to the server. Reports time and wire / decoded bytes per
+endpoint from CalderaClient.transfer_stats().
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from caldera_client import CalderaClient
+from compress_proxy import COMPRESS_LEVEL, serve
+
+TACTICS = ["discovery", "collection", "credential-access", "defense-evasion", "exfiltration", "lateral-movement"]
+
+
+def make_bodies(scale):
+    rng = random.Random(5)
+    abilities = [
+        {"ability_id": f"{rng.getrandbits(128):032x}", "name": f"Find {w} files {i}", "tactic": rng.choice(TACTICS),
+         "technique_id": f"T1{rng.randint(0, 999):03}", "technique_name": "File and Directory Discovery",
+         "description": f"Locate {w} files on the host and stage them for collection",
+         "executors": [{"name": ex, "platform": pl, "command": f"find / -name '*.{w}' -type f 2>/dev/null | head -{i}",
+                        "cleanup": [], "timeout": 60, "parsers": [], "payloads": [], "uploads": []}
+                       for ex, pl in (("sh", "linux"), ("sh", "darwin"), ("psh", "windows"))],
+         "requirements": [], "privilege": "", "repeatable": False, "buckets": [rng.choice(TACTICS)],
+         "additional_info": {}, "access": {}, "singleton": False, "plugin": "stockpile"}
+        for i, w in ((i, rng.choice(["pdf", "docx", "xlsx", "kdbx", "pem", "yml"])) for i in range(int(2500 * scale)))
+    ]
+    agents = [f"{rng.getrandbits(24):06x}" for _ in range(40)]
+    events = [
+        {"command": "ZmluZCAvIC1uYW1lICoucGRmIC10eXBlIGY=", "delegated_timestamp": f"2025-06-01T10:{i % 60:02}:00Z",
+         "collected_timestamp": f"2025-06-01T10:{i % 60:02}:05Z", "finished_timestamp": f"2025-06-01T10:{i % 60:02}:09Z",
+         "status": rng.choice([0, 0, 0, 1, -2]), "platform": "linux", "executor": "sh", "pid": rng.randint(1000, 60000),
+         "agent_metadata": {"paw": rng.choice(agents), "group": "red", "architecture": "amd64", "username": "root",
+                            "location": "/tmp/sandcat", "pid": rng.randint(1000, 60000), "ppid": 1, "privilege": "Elevated",
+                            "host": "ws-01", "contact": "HTTP", "created": "2025-06-01T09:00:00Z"},
+         "ability_metadata": {"ability_id": abilities[i % len(abilities)]["ability_id"],
+                              "ability_name": abilities[i % len(abilities)]["name"],
+                              "ability_description": abilities[i % len(abilities)]["description"]},
+         "operation_metadata": {"operation_name": "nightly", "operation_start": "2025-06-01T09:00:00Z",
+                                "operation_adversary": "Hunter"},
+         "attack_metadata": {"tactic": rng.choice(TACTICS), "technique_name": "File and Directory Discovery",
+                             "technique_id": "T1083"}}
+        for i in range(int(4000 * scale))
+    ]
+    report = {"name": "nightly", "host_group": [{"paw": p, "host": f"ws-{n:02}", "platform": "linux"}
+                                                 for n, p in enumerate(agents)],
+              "start": "2025-06-01T09:00:00Z", "steps": {p: {"steps": [
+                  {"link_id": f"{rng.getrandbits(128):032x}", "ability_id": e["ability_metadata"]["ability_id"],
+                   "command": e["command"], "status": e["status"], "name": e["ability_metadata"]["ability_name"],
+                   "output": "L2hvbWUvdXNlci9kb2N1bWVudHMvcmVwb3J0LnBkZgo=" * 3, "run": e["finished_timestamp"],
+                   "description": e["ability_metadata"]["ability_description"]}
+                  for e in events if e["agent_metadata"]["paw"] == p]} for p in agents}}
+    return {
+        "/api/v2/abilities": json.dumps(abilities).encode(),
+        "/api/v2/operations/5f3c/event-logs": json.dumps(events).encode(),
+        "/api/v2/operations/5f3c/report": json.dumps(report).encode(),
+    }
+
+
+BODIES = {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        body = BODIES.get(self.path.split("?")[0], b'{"error": "no route"}')
+        self.send_response(200 if self.path.split("?")[0] in BODIES else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+async def _pipe(reader, writer, bytes_per_s, delay):
+    """Copy reader -> writer at bytes_per_s, each chunk delivered `delay` seconds late."""
+    free_at = time.monotonic()
+    try:
+        while data := await reader.read(16 * 1024):
+            now = time.monotonic()
+            free_at = max(free_at, now) + len(data) / bytes_per_s
+            await asyncio.sleep(free_at - now + delay)
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+async def throttled_relay(target_port, mbit, rtt_ms):
+    """TCP relay to 127.0.0.1:target_port, throttled like a slow link; returns the server."""
+    rate = mbit * 1e6 / 8
+
+    async def handle(reader, writer):
+        up_reader, up_writer = await asyncio.open_connection("127.0.0.1", target_port)
+        await asyncio.gather(_pipe(reader, up_writer, rate, rtt_ms / 2000), _pipe(up_reader, writer, rate, rtt_ms / 2000))
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def run(label, port, rounds):
+    client = CalderaClient(base_url=f"http://127.0.0.1:{port}", cache=False)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for path in BODIES:
+            resp = client.get(path, stream=True)
+            for _ in resp.iter_content(64 * 1024):  # decoded as it arrives, like json_stream does
+                pass
+            resp.close()
+    elapsed = time.perf_counter() - start
+    stats = client.transfer_stats()
+    client.close()
+    print(f"{label:<26} {elapsed:6.1f} s  {stats['wire_bytes'] / 1e6:7.2f} MB on the wire  "
+          f"{stats['decoded_bytes'] / 1e6:7.2f} MB decoded")
+    for endpoint, v in stats["endpoints"].items():
+        print(f"  {endpoint:<42} {v['wire_bytes'] / 1e6:7.2f} MB -> {v['decoded_bytes'] / 1e6:7.2f} MB"
+              f"  ({v['decoded_bytes'] / max(v['wire_bytes'], 1):4.1f}x)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mbit", type=float, default=5)
+    parser.add_argument("--rtt-ms", type=float, default=40)
+    parser.add_argument("--level", type=int, default=COMPRESS_LEVEL)
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--rounds", type=int, default=1)
+    args = parser.parse_args()
+    BODIES.update(make_bodies(args.scale))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    caldera_port = server.server_address[1]
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    def on_loop(coro):
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    proxy_port = caldera_port + 1
+    runner = on_loop(serve(f"http://127.0.0.1:{caldera_port}", "127.0.0.1", proxy_port, args.level))
+    direct = on_loop(throttled_relay(caldera_port, args.mbit, args.rtt_ms))
+    via_proxy = on_loop(throttled_relay(proxy_port, args.mbit, args.rtt_ms))
+
+    total = sum(len(b) for b in BODIES.values())
+    print(f"{len(BODIES)} responses, {total / 1e6:.1f} MB of JSON, {args.mbit:g} Mbit/s link, {args.rtt_ms:g} ms RTT, "
+          f"gzip level {args.level}")
+    plain = run("direct (identity)", direct.sockets[0].getsockname()[1], args.rounds)
+    gz = run("via compress_proxy (gzip)", via_proxy.sockets[0].getsockname()[1], args.rounds)
+    print(f"{plain / gz:.1f}x faster through the proxy")
+    on_loop(runner.cleanup())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Per-plan controller setup: langchain's rebuild-everything vs ControllerFactory.
+
+Usage: python bench_controller_factory.py [--rounds 50] [--operations GET,POST,PUT,PATCH,DELETE]
+
+Sets up the controller agent for every plan of bench_route_index.SAMPLE_PLANS
+--rounds times, the way caldera_planner did before (docs, then
+_create_api_controller_agent and the extracting tools) and through a
+ControllerFactory. No LLM calls, only the setup before agent.run. Reports
+time per plan and what tracemalloc sees allocated per plan: memory blocks
+and bytes still alive at the end of setup and the peak during it.
+"""
+import time
+import argparse
+import tracemalloc
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_community.agent_toolkits.openapi.planner import _create_api_controller_agent
+from caldera_client import CalderaClient
+from caldera_planner import CONTROLLER_DOCS_TOKEN_BUDGET, ControllerFactory, plan_docs
+from load_spec import load_caldera_spec
+from output_extractor import extracting
+from route_index import RouteIndex
+from bench_route_index import SAMPLE_PLANS
+
+
+def rebuilt(spec, route_index, wrapper, llm, operations):
+    def setup(plan):
+        docs = plan_docs(spec, route_index, plan, "compact", CONTROLLER_DOCS_TOKEN_BUDGET)
+        agent = _create_api_controller_agent(spec.servers[0]["url"], docs, wrapper, llm, True, operations)
+        agent.tools = [extracting(tool) for tool in agent.tools]
+        return agent
+
+    return setup
+
+
+def factory(spec, wrapper, llm, operations):
+    controllers = ControllerFactory(wrapper, llm, True, operations)
+    return lambda plan: controllers.controller(spec, plan), controllers
+
+
+def measure(setup, rounds):
+    plans = [plan for _ in range(rounds) for plan in SAMPLE_PLANS]
+    start = time.perf_counter()
+    for plan in plans:
+        setup(plan)
+    elapsed = time.perf_counter() - start
+    # allocations of one more pass, plan by plan
+    blocks = size = peak = 0
+    for plan in SAMPLE_PLANS:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        agent = setup(plan)
+        after = tracemalloc.take_snapshot()
+        peak += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        diff = after.compare_to(before, "filename")
+        blocks += sum(d.count_diff for d in diff if d.count_diff > 0)
+        size += sum(d.size_diff for d in diff if d.size_diff > 0)
+        del agent
+    n = len(SAMPLE_PLANS)
+    return elapsed / len(plans) * 1000, blocks / n, size / n / 1024, peak / n / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--operations", default="GET,POST,PUT,PATCH,DELETE")
+    args = parser.parse_args()
+    operations = args.operations.split(",")
+    spec = load_caldera_spec()
+    route_index = RouteIndex.from_spec(spec)
+    client = CalderaClient(base_url="http://127.0.0.1:8888", cache=False)
+    wrapper = client.requests_wrapper()
+    llm = FakeListLLM(responses=["Final Answer: done"])
+    cached, controllers = factory(spec, wrapper, llm, operations)
+
+    print(f"{len(SAMPLE_PLANS)} plans x {args.rounds} rounds, tools for {', '.join(operations)}")
+    results = {}
+    for label, setup in (("rebuilt per plan", rebuilt(spec, route_index, wrapper, llm, operations)),
+                         ("ControllerFactory", cached)):
+        ms, blocks, kib, peak = measure(setup, args.rounds)
+        results[label] = ms, blocks
+        print(f"{label:<18} {ms:7.3f} ms/plan  {blocks:8.0f} blocks  {kib:8.1f} KiB kept  {peak:8.1f} KiB peak")
+    (old_ms, old_blocks), (new_ms, new_blocks) = results.values()
+    print(f"{old_ms / new_ms:.0f}x less setup time, {old_blocks / max(new_blocks, 1):.0f}x fewer allocations; "
+          f"prompt cache {controllers.stats()}")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Controller prompt size: yaml.dump docs vs doc_render compact signatures.
+
+Usage: python bench_doc_render.py [--budget N] [--live]
+
+--live also sends the first controller turn of every plan to the LLM (the
+same Gemini model as main.py) with each docs variant and reports latency.
+"""
+import argparse
+import time
+from langchain_community.agent_toolkits.openapi.planner_prompt import API_CONTROLLER_PROMPT
+from load_spec import load_caldera_spec, _reduce_spec, SPEC_FILE
+from route_index import RouteIndex
+from caldera_planner import CONTROLLER_DOCS_TOKEN_BUDGET, plan_docs
+from doc_render import count_tokens
+from bench_route_index import SAMPLE_PLANS
+
+
+def controller_prompt(api_spec, docs_str, plan):
+    return API_CONTROLLER_PROMPT.format(
+        api_url=api_spec.servers[0]["url"],
+        api_docs=docs_str,
+        tool_names="requests_get, requests_post",
+        tool_descriptions="",
+        input=plan,
+        agent_scratchpad="",
+    )
+
+
+def main(budget, live):
+    api_spec = load_caldera_spec()
+    route_index = RouteIndex.from_spec(api_spec)
+
+    # Rendering cost, cold (fresh spec, nothing memoized) and warm.
+    with open(SPEC_FILE, "rb") as f:
+        fresh = _reduce_spec(f.read())
+    for label, docs_format in (("yaml", "yaml"), ("compact", "compact")):
+        start = time.perf_counter()
+        for plan in SAMPLE_PLANS:
+            plan_docs(fresh, route_index, plan, docs_format, budget)
+        cold = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for plan in SAMPLE_PLANS:
+            plan_docs(fresh, route_index, plan, docs_format, budget)
+        warm = (time.perf_counter() - start) * 1000
+        print(f"render {label:<8} cold {cold:8.1f} ms  warm {warm:6.2f} ms  ({len(SAMPLE_PLANS)} plans)")
+    print()
+
+    llm = None
+    if live:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0)
+
+    print(f"{'plan':<52} {'yaml tok':>9} {'compact tok':>12}" + ("  yaml s  compact s" if live else ""))
+    totals = [0, 0, 0.0, 0.0]
+    for plan in SAMPLE_PLANS:
+        row = []
+        for docs_format in ("yaml", "compact"):
+            prompt = controller_prompt(api_spec, plan_docs(api_spec, route_index, plan, docs_format, budget), plan)
+            row.append(count_tokens(prompt))
+        for i, tokens in enumerate(row):
+            totals[i] += tokens
+        line = f"{plan.splitlines()[0][:52]:<52} {row[0]:>9} {row[1]:>12}"
+        if llm is not None:
+            for i, docs_format in enumerate(("yaml", "compact")):
+                prompt = controller_prompt(api_spec, plan_docs(api_spec, route_index, plan, docs_format, budget), plan)
+                start = time.perf_counter()
+                llm.invoke(prompt)
+                elapsed = time.perf_counter() - start
+                totals[2 + i] += elapsed
+                line += f"  {elapsed:6.2f}" if i == 0 else f"  {elapsed:9.2f}"
+        print(line)
+    print(f"{'total':<52} {totals[0]:>9} {totals[1]:>12}" + (f"  {totals[2]:6.2f}  {totals[3]:9.2f}" if live else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=int, default=CONTROLLER_DOCS_TOKEN_BUDGET)
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+    main(args.budget, args.live)
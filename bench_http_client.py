@@ -0,0 +1,124 @@
+"""Connection reuse: module-level requests / per-request aiohttp sessions vs CalderaClient.
+
+Usage: python bench_http_client.py [--requests N] [--workers N]
+
+Runs a local stand-in for the Caldera API (HTTP/1.1 keep-alive, a 2 KB
+agents list) and times N sequential and N concurrent GETs each way,
+counting the TCP connections the server accepted.
+"""
+import json
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import aiohttp
+import requests
+from caldera_client import CalderaClient
+
+AGENTS = json.dumps([
+    {"paw": f"paw{i:03}", "host": f"host-{i}", "platform": "linux", "group": "red", "trusted": True}
+    for i in range(24)
+]).encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _Handler.lock:
+            _Handler.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(AGENTS)))
+        self.end_headers()
+        self.wfile.write(AGENTS)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def measure(label, run):
+    before = _Handler.connections
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<44} {elapsed * 1000:8.0f} ms  {_Handler.connections - before:5} connections")
+    return elapsed
+
+
+def main(n, workers):
+    server, base_url = serve()
+    url = f"{base_url}/api/v2/agents"
+    # No GET cache here, every request has to reach the server.
+    client = CalderaClient(base_url=base_url, token="bench", pool_size=workers, cache=False)
+
+    def plain_get():
+        requests.get(url, headers={"KEY": "bench"}, timeout=10).json()
+
+    def client_get():
+        client.get("/api/v2/agents").json()
+
+    print(f"{n} GETs of {len(AGENTS)} bytes, {workers} workers for the concurrent runs\n")
+    a = measure("sequential  requests.get", lambda: [plain_get() for _ in range(n)])
+    b = measure("sequential  CalderaClient", lambda: [client_get() for _ in range(n)])
+    print(f"{'':<44} {a / b:8.1f}x\n")
+
+    def concurrent(fn):
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(lambda _: fn(), range(n)))
+
+    a = measure("concurrent  requests.get", lambda: concurrent(plain_get))
+    b = measure("concurrent  CalderaClient", lambda: concurrent(client_get))
+    print(f"{'':<44} {a / b:8.1f}x\n")
+
+    async def fan_out(get):
+        limit = asyncio.Semaphore(workers)
+
+        async def one():
+            async with limit:
+                await get()
+        await asyncio.gather(*(one() for _ in range(n)))
+
+    async def fresh_session_get():
+        async with aiohttp.ClientSession(headers={"KEY": "bench"}) as session:
+            async with session.get(url) as resp:
+                await resp.read()
+
+    async def shared_session_get():
+        session = await client.aiosession()
+        async with session.get(url) as resp:
+            await resp.read()
+
+    async def run_shared():
+        await fan_out(shared_session_get)
+        await client.aclose()
+
+    a = measure("concurrent  aiohttp, session per request", lambda: asyncio.run(fan_out(fresh_session_get)))
+    b = measure("concurrent  aiohttp, CalderaClient session", lambda: asyncio.run(run_shared()))
+    print(f"{'':<44} {a / b:8.1f}x")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+    main(args.requests, args.workers)
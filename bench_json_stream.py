@@ -0,0 +1,89 @@
+"""Large responses: response.text[:1200] vs the streamed json_stream projection.
+
+Usage: python bench_json_stream.py [--items N] [--fields paw,host,platform,last_seen]
+
+Serves an agents-like list of N items from a local stand-in for the
+Caldera API and reads it both ways through a CalderaClient, reporting
+time, peak Python memory (tracemalloc), output size and whether the
+output is valid JSON.
+"""
+import json
+import time
+import argparse
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from caldera_client import CalderaClient
+from json_stream import project_response
+
+BODY = b""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        for i in range(0, len(BODY), 256 * 1024):
+            self.wfile.write(BODY[i:i + 256 * 1024])
+
+    def log_message(self, *args):
+        pass
+
+
+def make_body(n):
+    return json.dumps([
+        {"paw": f"paw{i:05}", "host": f"host-{i}", "platform": "linux", "last_seen": "2025-01-01T00:00:00Z",
+         "group": "red", "trusted": True, "executors": ["sh", "proc"], "links": [
+             {"id": f"{i}-{j}", "command": "d2hvYW1p" * 20, "output": "x" * 300} for j in range(3)]}
+        for i in range(n)
+    ]).encode()
+
+
+def _valid(text):
+    try:
+        json.loads(text.split("\n(", 1)[0])
+        return True
+    except ValueError:
+        return False
+
+
+def measure(label, run):
+    start = time.perf_counter()
+    text = run()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()  # second run for memory, tracing slows allocations down a lot
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<48} {elapsed * 1000:8.0f} ms  peak {peak / 1e6:7.2f} MB  {len(text):6} chars  "
+          f"valid JSON: {_valid(text)}")
+
+
+def main():
+    global BODY
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--fields", default="paw,host,platform,last_seen")
+    args = parser.parse_args()
+    BODY = make_body(args.items)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = CalderaClient(base_url=f"http://127.0.0.1:{server.server_address[1]}", cache=False)
+    print(f"{args.items} agents, {len(BODY) / 1e6:.1f} MB body")
+    client.get("/api/v2/agents").content  # warm the connection
+    measure("response.text[:1200]", lambda: client.get("/api/v2/agents").text[:1200])
+    measure("projection, all fields", lambda: project_response(
+        client.get("/api/v2/agents", stream=True), max_chars=4500).to_text())
+    measure(f"projection, fields={args.fields}", lambda: project_response(
+        client.get("/api/v2/agents", stream=True), fields=args.fields).to_text())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""LLM parsing calls saved by output_extractor on a corpus of controller steps.
+
+Usage: python bench_output_extractor.py [--llm-ms MS] [-v]
+
+Each scenario is one requests_* tool call a controller makes against
+Caldera: the response (served by a local stand-in) and the step's
+output_instructions. Every scenario runs through langchain's
+requests_*ToolWithParsing and through the extracting version, both with a
+stand-in parsing LLM that sleeps --llm-ms per call (default: the mean
+parser LLM time in caldera_metrics.jsonl, else 1200 ms). Reports LLM calls,
+wall time and whether the extracted output holds the expected values and
+none of the values a scenario lists as filtered out.
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_classic.chains.llm import LLMChain
+from langchain_community.agent_toolkits.openapi.planner import (
+    RequestsDeleteToolWithParsing,
+    RequestsGetToolWithParsing,
+    RequestsPatchToolWithParsing,
+    RequestsPostToolWithParsing,
+)
+from langchain_community.agent_toolkits.openapi.planner_prompt import (
+    PARSING_DELETE_PROMPT,
+    PARSING_GET_PROMPT,
+    PARSING_PATCH_PROMPT,
+    PARSING_POST_PROMPT,
+)
+from caldera_client import CalderaClient
+from metrics import METRICS_FILE
+from output_extractor import extracting
+
+AGENTS = [
+    {"paw": f"paw{i:02}", "host": f"ws-{i:02}", "platform": ["linux", "windows", "darwin"][i % 3],
+     "group": "red" if i % 2 else "blue", "last_seen": f"2025-06-01T10:{i:02}:00Z", "trusted": i % 5 != 0,
+     "sleep_min": 30, "sleep_max": 60, "executors": ["sh"], "pid": 1000 + i}
+    for i in range(30)
+]
+ADVERSARIES = [
+    {"adversary_id": f"ad-{i}", "name": name, "description": f"{name} profile", "atomic_ordering": [f"ab-{j}" for j in range(8)]}
+    for i, name in enumerate(["Hunter", "Discovery", "Thief", "Ransack", "Super Spy", "Worm", "Check", "Nosy Neighbor"])
+]
+OPERATIONS = [
+    {"id": f"op-{i}", "name": f"op {i}", "state": ["running", "finished", "paused"][i % 3], "jitter": "2/8",
+     "adversary": {"adversary_id": ADVERSARIES[i]["adversary_id"], "name": ADVERSARIES[i]["name"]},
+     "planner": {"id": "atomic", "name": "atomic"}, "start": f"2025-06-0{i + 1}T09:00:00Z",
+     "chain": [{"id": f"l-{i}-{j}", "paw": AGENTS[j]["paw"], "status": 0, "command": "d2hvYW1p" * 8} for j in range(12)]}
+    for i in range(6)
+]
+ABILITIES = [
+    {"ability_id": f"ab-{i}", "name": f"ability {i}", "tactic": ["discovery", "collection", "exfiltration"][i % 3],
+     "technique_id": f"T10{i:02}", "description": "x" * 200, "executors": [{"platform": "linux", "command": "id"}]}
+    for i in range(300)
+]
+
+ROUTES = {
+    ("GET", "/api/v2/agents"): (200, AGENTS),
+    ("GET", "/api/v2/adversaries"): (200, ADVERSARIES),
+    ("GET", "/api/v2/operations"): (200, OPERATIONS),
+    ("GET", "/api/v2/operations/op-1"): (200, OPERATIONS[1]),
+    ("GET", "/api/v2/abilities"): (200, ABILITIES),
+    ("GET", "/api/v2/health"): (200, {"application": "CALDERA", "version": "5.0.0", "plugins": [
+        {"name": p, "enabled": True} for p in ("stockpile", "sandcat", "atomic", "manx")]}),
+    ("GET", "/api/v2/planners"): (200, [{"id": "atomic", "name": "atomic"}, {"id": "batch", "name": "batch"}]),
+    ("GET", "/api/v2/agents/nope"): (404, {"error": "Agent not found"}),
+    ("POST", "/api/v2/operations"): (200, {**OPERATIONS[0], "id": "op-new", "name": "nightly", "chain": []}),
+    ("POST", "/api/v2/sources"): (200, {"id": "src-9", "name": "lab facts", "facts": []}),
+    ("PATCH", "/api/v2/agents/paw03"): (200, {**AGENTS[3], "sleep_min": 5, "sleep_max": 10}),
+    ("PATCH", "/api/v2/operations/op-0"): (200, {**OPERATIONS[0], "state": "stop"}),
+    ("DELETE", "/api/v2/operations/op-2"): (204, None),
+}
+
+# (tool, path, extra input, output_instructions, values the answer must contain)
+SCENARIOS = [
+    ("get", "/api/v2/agents", {}, "Extract the paw and host of each agent", ["paw00", "ws-29"]),
+    ("get", "/api/v2/agents", {}, "the paws of agents whose platform is linux", ["paw00", "paw27"]),
+    ("get", "/api/v2/agents", {}, "How many agents are there?", ["30"]),
+    ("get", "/api/v2/agents", {}, "number of agents where group is red", ["15"]),
+    ("get", "/api/v2/agents", {}, "paw, platform and last seen of all agents", ["last_seen", "paw29"]),
+    ("get", "/api/v2/agents", {}, "the host of the agent with paw 'paw07'", ["ws-07"]),
+    ("get", "/api/v2/agents", {}, "Which agents look dead? Summarize their state", None),
+    ("get", "/api/v2/agents", {}, "the paws of agents that are not trusted", None),
+    ("get", "/api/v2/agents", {}, "the paw of the agent with host ws-03", ["paw03"]),
+    ("get", "/api/v2/agents", {}, "paws of agents whose group is green", None),
+    # the condition has to filter: other agents' paws must not come back
+    ("get", "/api/v2/agents", {}, "the paw of the agent on host ws-02", ["paw02"], ["paw01", "paw03"]),
+    ("get", "/api/v2/agents", {}, "paws of agents in group red", ["paw01", "paw29"], ["paw00", "paw02"]),
+    ("get", "/api/v2/adversaries", {}, "the id of the adversary named Hunter", ["ad-0"]),
+    ("get", "/api/v2/adversaries", {}, "the id of the adversary named 'Super Spy'", ["ad-4"]),
+    ("get", "/api/v2/adversaries", {}, "the id of the adversary named Super Spy", None),
+    ("get", "/api/v2/adversaries", {}, "Extract the adversary_id and name of every adversary", ["ad-7", "Nosy Neighbor"]),
+    ("get", "/api/v2/adversaries", {}, "$[*].adversary_id", ["ad-3"]),
+    ("get", "/api/v2/operations", {}, "ids and names of the running operations", ["op-0", "op-3"]),
+    ("get", "/api/v2/operations", {}, "id and name of operations whose state is running", ["op-0", "op-3"]),
+    ("get", "/api/v2/operations", {}, "the id of the most recent operation", None),
+    ("get", "/api/v2/operations", {}, "the adversary name of each operation", ["Hunter", "Worm"]),
+    ("get", "/api/v2/operations/op-1", {}, "the state and adversary name of the operation", ["finished", "Discovery"]),
+    ("get", "/api/v2/operations/op-1", {}, "how many links (chain) does the operation have", ["12"]),
+    ("get", "/api/v2/operations/op-1", {}, "$.chain[*].paw", ["paw11"]),
+    ("get", "/api/v2/abilities", {}, "ability_id of abilities whose tactic is exfiltration", ["ab-2", "ab-299"]),
+    ("get", "/api/v2/abilities", {}, "count of abilities", ["300"]),
+    ("get", "/api/v2/health", {}, "the version of caldera", ["5.0.0"]),
+    ("get", "/api/v2/health", {}, "Is the server healthy? Explain if any plugin is disabled", None),
+    ("get", "/api/v2/planners", {}, "the planner ids", ["atomic", "batch"]),
+    ("get", "/api/v2/agents/nope", {}, "the host of the agent", ["404"]),
+    ("post", "/api/v2/operations", {"data": {"name": "nightly"}}, "the id of the created operation", ["op-new"]),
+    ("post", "/api/v2/sources", {"data": {"name": "lab facts"}}, "the id and name of the new source", ["src-9"]),
+    ("patch", "/api/v2/agents/paw03", {"data": {"sleep_min": 5}}, "the new sleep_min and sleep_max", ["5", "10"]),
+    ("patch", "/api/v2/operations/op-0", {"data": {"state": "stop"}}, "the operation state after the update", ["stop"]),
+    ("delete", "/api/v2/operations/op-2", {}, "confirm the deletion", ["204"]),
+]
+
+TOOLS = {
+    "get": (RequestsGetToolWithParsing, PARSING_GET_PROMPT),
+    "post": (RequestsPostToolWithParsing, PARSING_POST_PROMPT),
+    "patch": (RequestsPatchToolWithParsing, PARSING_PATCH_PROMPT),
+    "delete": (RequestsDeleteToolWithParsing, PARSING_DELETE_PROMPT),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        status, data = ROUTES.get((self.command, self.path.split("?")[0]), (404, {"error": "no route"}))
+        body = b"" if data is None else json.dumps(data).encode()
+        self.send_response(status)
+        if data is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+LLM_CALLS = [0]
+
+
+class _SlowLLM(FakeListLLM):
+    """Parsing LLM stand-in: fixed latency, counts calls."""
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        LLM_CALLS[0] += 1
+        time.sleep(self.sleep or 0)
+        return super()._call(prompt, stop, run_manager, **kwargs)
+
+
+def parser_llm_seconds():
+    """Mean parser-stage LLM time per call from caldera_metrics.jsonl, None without data."""
+    calls = seconds = 0
+    try:
+        with open(METRICS_FILE) as f:
+            for line in f:
+                stage = json.loads(line).get("stages", {}).get("parser", {})
+                calls += stage.get("calls", 0)
+                seconds += stage.get("llm_s", 0.0)
+    except (OSError, ValueError):
+        return None
+    return seconds / calls if calls else None
+
+
+def run(extract, llm_s, wrapper, base, verbose):
+    llm = _SlowLLM(responses=["(parsed by the LLM)"], sleep=llm_s)
+    calls = correct = 0
+    start = time.perf_counter()
+    for method, path, extra, instructions, expected, *unexpected in SCENARIOS:
+        cls, prompt = TOOLS[method]
+        tool = cls(requests_wrapper=wrapper, llm_chain=LLMChain(llm=llm, prompt=prompt), allow_dangerous_requests=True)
+        if extract:
+            tool = extracting(tool)
+        before = LLM_CALLS[0]
+        output = tool.run(json.dumps({"url": base + path, **extra, "output_instructions": instructions}))
+        used_llm = LLM_CALLS[0] != before
+        calls += used_llm
+        if extract and not used_llm:
+            ok = expected is not None and all(re.search(re.escape(v), output) for v in expected) \
+                and not any(re.search(re.escape(v), output) for v in (unexpected[0] if unexpected else ()))
+            correct += ok
+        if verbose and extract:
+            print(f"  {'LLM ' if used_llm else 'local'} {method.upper():6} {path:<26} {instructions[:44]:<44} "
+                  f"-> {output[:70]!r}")
+    return calls, time.perf_counter() - start, correct
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-ms", type=float, default=None)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    llm_s = args.llm_ms / 1000 if args.llm_ms is not None else parser_llm_seconds() or 1.2
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    wrapper = CalderaClient(base_url=base, cache=False).requests_wrapper()
+
+    n = len(SCENARIOS)
+    print(f"{n} controller steps, parsing LLM at {llm_s * 1000:.0f} ms per call")
+    llm_calls, llm_time, _ = run(False, llm_s, wrapper, base, False)
+    ex_calls, ex_time, correct = run(True, llm_s, wrapper, base, args.verbose)
+    local = n - ex_calls
+    print(f"{'parse_mode=llm':<18} {llm_calls:3} parsing LLM calls  {llm_time:7.2f} s")
+    print(f"{'parse_mode=extract':<18} {ex_calls:3} parsing LLM calls  {ex_time:7.2f} s  "
+          f"({local} extracted locally, {correct}/{local} with the expected values)")
+    print(f"LLM calls -{(llm_calls - ex_calls) / llm_calls:.0%}, time -{(llm_time - ex_time) / llm_time:.0%}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Payload upload: one buffered files= POST per file vs payload_sync.
+
+Usage: python bench_payload_sync.py [--files 200] [--max-mb 300] [--workers 4] [--dir DIR]
+
+Writes a directory of --files payloads of mixed sizes (mostly KBs, some
+tens of MB, a few up to --max-mb) and serves a local stand-in for
+Caldera's /api/v2/payloads that already has 20% of them. Each way of
+uploading runs in a child process so its peak RSS is its own:
+
+- files=: requests.post(files={'file': open(path, 'rb')}) per file, in
+  order, every file (the old api_call);
+- sync: sync_payloads(), streamed, concurrent, existing names skipped;
+- sync again: the same directory right after, nothing left to upload;
+- resume: a fresh server that refuses uploads after half of them, then a
+  second sync picking up the rest from the manifest.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from payload_sync import MANIFEST_NAME
+
+BLOCK = random.Random(7).randbytes(1024 * 1024)
+
+
+def make_payloads(directory, count, max_mb):
+    rng = random.Random(11)
+    os.makedirs(directory, exist_ok=True)
+    total = 0
+    for i in range(count):
+        r = rng.random()
+        if i < 3:
+            size = int(max_mb * 1024 * 1024 * (1 - i * 0.3))
+        elif r < 0.1:
+            size = rng.randint(5, 50) * 1024 * 1024
+        else:
+            size = rng.randint(1, 1024) * 1024
+        with open(os.path.join(directory, f"payload_{i:03}.bin"), "wb") as f:
+            f.write(f"{i}\n".encode())  # distinct content per file
+            left = size
+            while left > 0:
+                f.write(BLOCK[:min(left, len(BLOCK))])
+                left -= len(BLOCK)
+        total += size
+    return total
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    names = set()
+    accept = None  # uploads accepted before answering 413, None for all
+    lock = threading.Lock()
+
+    def do_GET(self):
+        self._json(200, {"payloads": sorted(_Handler.names)})
+
+    def do_POST(self):
+        left = int(self.headers["Content-Length"])
+        head = self.rfile.read(min(left, 4096))
+        left -= len(head)
+        while left > 0:
+            left -= len(self.rfile.read(min(left, 1024 * 1024)))
+        name = head.split(b'filename="', 1)[1].split(b'"', 1)[0].decode()
+        with _Handler.lock:
+            if _Handler.accept is not None:
+                if _Handler.accept <= 0:
+                    return self._json(413, {"error": "storage full"})
+                _Handler.accept -= 1
+            _Handler.names.add(name)
+        self._json(200, {"payloads": [name]})
+
+    def _json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def child(mode, directory, url, workers):
+    """Runs in the child process; prints one json line."""
+    import resource
+    import requests
+    from caldera_client import CalderaClient
+    from payload_sync import scan, sync_payloads
+
+    start = time.perf_counter()
+    if mode == "files":
+        sent = uploaded = 0
+        for f in scan(directory):
+            resp = requests.post(f"{url}/api/v2/payloads", files={"file": open(f.path, "rb")})
+            uploaded += resp.ok
+            sent += f.size
+        result = {"uploaded": uploaded, "skipped": 0, "failed": 0, "mb": sent / 1e6}
+    else:
+        client = CalderaClient(base_url=url, cache=False)
+        r = sync_payloads(directory, client, workers=workers, progress=lambda *a, **k: None)
+        result = {"uploaded": len(r.uploaded), "skipped": len(r.skipped), "failed": len(r.failed),
+                  "mb": r.bytes_sent / 1e6}
+    result["s"] = time.perf_counter() - start
+    result["rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+
+
+def run(label, mode, directory, url, workers):
+    out = subprocess.run([sys.executable, __file__, "--child", mode, "--dir", directory, "--url", url,
+                          "--workers", str(workers)], capture_output=True, text=True, check=True)
+    r = json.loads(out.stdout.strip().splitlines()[-1])
+    print(f"{label:<30} {r['s']:7.1f} s  {r['uploaded']:4} uploaded  {r['skipped']:4} skipped  {r['failed']:4} failed  "
+          f"{r['mb']:8.0f} MB sent  peak RSS {r['rss_mb']:6.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--max-mb", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dir")
+    parser.add_argument("--child")
+    parser.add_argument("--url")
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child, args.dir, args.url, args.workers)
+
+    directory = args.dir or tempfile.mkdtemp(prefix="payloads_")
+    try:
+        total = make_payloads(directory, args.files, args.max_mb)
+        print(f"{args.files} payloads, {total / 1e6:,.0f} MB, largest {args.max_mb} MB")
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        existing = {f"payload_{i:03}.bin" for i in range(0, args.files, 5)}
+
+        _Handler.names = set(existing)
+        run("files= per file (old)", "files", directory, url, args.workers)
+        _Handler.names = set(existing)
+        run(f"sync, {args.workers} workers", "sync", directory, url, args.workers)
+        run("sync again", "sync", directory, url, args.workers)
+
+        os.remove(os.path.join(directory, MANIFEST_NAME))
+        _Handler.names, _Handler.accept = set(existing), (args.files - len(existing)) // 2
+        run("resume: interrupted half way", "sync", directory, url, args.workers)
+        _Handler.accept = None
+        run("resume: second run", "sync", directory, url, args.workers)
+        server.shutdown()
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
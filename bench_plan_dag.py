@@ -0,0 +1,171 @@
+"""Multi-step plans through the api_controller: one step after another vs plan_dag.
+
+Usage: python bench_plan_dag.py [--request-ms 300] [--call-ms 400] [-v]
+
+Runs the controller tool of caldera_planner on multi-step plans against a
+local stand-in for Caldera that takes --request-ms per request (a busy
+server behind a VPN), with a scripted controller model (bench_agent_engines'
+latency model, --call-ms per call plus time per token). Sequential is the
+controller as before: a ReAct turn per step, then the answer. With the
+async client the plan's independent GETs go out at once first and the
+controller model only makes the dependent calls, or isn't called at all.
+Reports wall time per plan both ways, the DAG's waves and its critical
+path next to the sequential sum, from the per-step costs measured here,
+and whether every request the server saw was also reported to the
+client's listeners (what the answer cache records a turn's dependencies
+from), prefetched ones included.
+"""
+import io
+import time
+import argparse
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlsplit
+import caldera_planner
+from async_client import AsyncCalderaClient
+from bench_agent_engines import LATENCY, SEEN, _controller, _Handler as _BaseHandler, _ScriptedLLM
+from caldera_client import CalderaClient
+from load_spec import load_caldera_spec
+from plan_dag import PlanDAG
+
+REQUEST_S = [0.3]
+LLM_SECONDS = []
+RECORDED = []  # requests the client's listeners were told about
+
+
+class _Handler(_BaseHandler):
+    def _serve(self):
+        time.sleep(REQUEST_S[0])
+        super()._serve()
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _serve
+
+
+class _TimedLLM(_ScriptedLLM):
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super()._call(prompt, stop, run_manager, **kwargs)
+        finally:
+            LLM_SECONDS.append(time.perf_counter() - start)
+
+
+def _answer(text):
+    return f"Thought: I am finished executing the plan.\nFinal Answer: {text}"
+
+
+def scenarios(base):
+    """(name, plan, controller turns per step number, answer)"""
+    return [
+        ("status overview",
+         "1. GET /api/v2/planners to list the planners\n2. GET /api/v2/agents to list the agents\n"
+         "3. GET /api/v2/operations to list the operations\n4. GET /api/v2/adversaries to list the adversaries",
+         {1: _controller("GET", base, "/api/v2/planners", "the name of each planner"),
+          2: _controller("GET", base, "/api/v2/agents", "the paw and host of each agent"),
+          3: _controller("GET", base, "/api/v2/operations", "the name and state of each operation"),
+          4: _controller("GET", base, "/api/v2/adversaries", "the name of each adversary")},
+         "2 planners, 30 agents, 6 operations, 8 adversaries."),
+        ("start an operation",
+         "1. GET /api/v2/adversaries to find the adversary named Hunter\n2. GET /api/v2/planners to list the planners\n"
+         "3. GET /api/v2/agents to count the agents\n"
+         "4. POST /api/v2/operations to start operation nightly with that adversary",
+         {1: _controller("GET", base, "/api/v2/adversaries", "the adversary_id of the adversary named Hunter"),
+          2: _controller("GET", base, "/api/v2/planners", "the name of each planner"),
+          3: _controller("GET", base, "/api/v2/agents", "how many agents are there"),
+          4: _controller("POST", base, "/api/v2/operations", "the id of the created operation",
+                         {"name": "nightly", "adversary": {"adversary_id": "ad-0"}})},
+         "Started nightly (op-new) with Hunter, atomic planner, 30 agents."),
+        ("operation state and exfil abilities",
+         "1. GET /api/v2/operations to find the operation named 'op 1'\n"
+         "2. GET /api/v2/operations/{id} with the id of that operation to get its state\n"
+         "3. GET /api/v2/abilities to list the abilities whose tactic is exfiltration\n"
+         "4. GET /api/v2/agents to count the agents",
+         {1: _controller("GET", base, "/api/v2/operations", "the id of the operation named 'op 1'"),
+          2: _controller("GET", base, "/api/v2/operations/op-1", "the state of the operation"),
+          3: _controller("GET", base, "/api/v2/abilities", "abilities whose tactic is exfiltration"),
+          4: _controller("GET", base, "/api/v2/agents", "how many agents are there")},
+         "op-1 is finished; 100 exfiltration abilities; 30 agents."),
+        ("change sleep, check operations",
+         "1. GET /api/v2/agents to list the agents whose platform is linux\n"
+         "2. PATCH /api/v2/agents/paw03 to set sleep_min 5 and sleep_max 10\n"
+         "3. GET /api/v2/operations to list the running operations",
+         {1: _controller("GET", base, "/api/v2/agents", "the paw of agents whose platform is linux"),
+          2: _controller("PATCH", base, "/api/v2/agents/paw03", "the new sleep_min and sleep_max",
+                         {"sleep_min": 5, "sleep_max": 10}),
+          3: _controller("GET", base, "/api/v2/operations", "the name of the running operations")},
+         "paw03 sleeps 5-10 s; op 0 and op 3 are running."),
+    ]
+
+
+def run(tool, llm, plan, script, verbose):
+    llm.script[:] = script
+    SEEN.clear()
+    LLM_SECONDS.clear()
+    RECORDED.clear()
+    start = time.perf_counter()
+    # langchain's controller agent prints its chain whatever verbose says
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+        output = tool.run(plan)
+    wall = time.perf_counter() - start
+    unrecorded = sorted(set(SEEN) - set(RECORDED))
+    return wall, len(LLM_SECONDS), sum(LLM_SECONDS), sorted(SEEN), unrecorded, output
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--request-ms", type=float, default=300)
+    parser.add_argument("--call-ms", type=float, default=400)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    REQUEST_S[0] = args.request_ms / 1000
+    LATENCY["call_s"] = args.call_ms / 1000
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    spec = load_caldera_spec()
+    spec.servers[0]["url"] = base
+    client = CalderaClient(base_url=base, cache=False)
+    client.listeners.append(lambda method, url, params: RECORDED.append(f"{method} {urlsplit(url).path}"))
+    operations = ["GET", "POST", "PUT", "DELETE", "PATCH"]
+    llm = _TimedLLM()
+    tools = {
+        mode: caldera_planner._create_api_controller_tool(
+            spec, client.requests_wrapper(), llm, True, operations, async_client=async_client)
+        for mode, async_client in (("sequential", None), ("dag", AsyncCalderaClient(spec, client)))
+    }
+
+    print(f"{args.request_ms:.0f} ms per request, controller model {args.call_ms:.0f} ms per call + tokens")
+    totals = {"sequential": 0.0, "dag": 0.0, "critical": 0.0}
+    for name, plan, turns, answer in scenarios(base):
+        dag = PlanDAG.from_plan(plan)
+        seq_script = [turns[step.number] for step in dag.steps] + [_answer(answer)]
+        remaining = [turns[step.number] for step in dag.steps if not step.ready]
+        dag_script = remaining + [_answer(answer)] if remaining else []
+        seq_wall, seq_calls, seq_llm, seq_seen, _, _ = run(tools["sequential"], llm, plan, seq_script, args.verbose)
+        dag_wall, dag_calls, _, dag_seen, unrecorded, _ = run(tools["dag"], llm, plan, dag_script, args.verbose)
+        # per-step costs measured here: a model turn and the request, just the request for a prefetched
+        # step; the answer turn comes last, unless the controller isn't needed at all
+        turn = seq_llm / seq_calls
+        seq_cost = {step.number: turn + REQUEST_S[0] for step in dag.steps}
+        dag_cost = {step.number: REQUEST_S[0] if step.ready else turn + REQUEST_S[0] for step in dag.steps}
+        sequential = dag.sequential(seq_cost) + turn
+        critical = dag.critical_path(dag_cost) + (turn if remaining else 0.0)
+        print(f"{name}: {dag.describe()}")
+        print(f"  sequential {seq_wall:5.2f} s (sum of steps {sequential:5.2f} s, {seq_calls} model calls)   "
+              f"dag {dag_wall:5.2f} s (critical path {critical:5.2f} s, {dag_calls} model calls)   "
+              f"{'same requests' if seq_seen == dag_seen else f'requests differ {seq_seen} {dag_seen}'}, "
+              f"{'all recorded' if not unrecorded else f'NOT RECORDED {unrecorded}'}")
+        totals["sequential"] += seq_wall
+        totals["dag"] += dag_wall
+        totals["critical"] += critical
+    print(f"total: sequential {totals['sequential']:.2f} s, dag {totals['dag']:.2f} s "
+          f"(-{1 - totals['dag'] / totals['sequential']:.0%}), critical paths {totals['critical']:.2f} s")
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
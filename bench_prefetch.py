@@ -0,0 +1,150 @@
+"""A conversation's HTTP wait time with and without the speculative prefetcher.
+
+Usage: python bench_prefetch.py [--think 4] [--request-ms 300] [--max-bytes-mb 8]
+
+A local stand-in for Caldera answers after --request-ms (abilities is a
+couple of MB). Each turn of a scripted conversation sleeps --think
+seconds for the LLM (the planner call on a self-hosted model), then makes
+the GETs the agent would make, streamed like json_stream reads them, and
+the answer goes to Prefetcher.observe(). Run once with the cache alone and
+once with a Prefetcher started at the beginning of every turn. Reports the
+time spent waiting on HTTP after the LLM answered, and how many
+prefetches were used or wasted.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from caldera_client import CalderaClient
+from load_spec import load_caldera_spec
+from prefetcher import MAX_BYTES, Prefetcher
+
+OP_ID = "6b1c2f0e-4f7a-4c59-9d3e-0a6c1b2d3e4f"
+NEW_OP_ID = "9f8e7d6c-5b4a-4392-8170-6f5e4d3c2b1a"
+REQUEST_S = [0.3]
+
+
+def make_routes():
+    rng = random.Random(3)
+    agents = [{"paw": f"{rng.getrandbits(24):06x}", "host": f"ws-{i:02}", "platform": "linux", "group": "red",
+               "last_seen": "2025-06-01T10:00:00Z", "trusted": True} for i in range(30)]
+    operations = [{"id": OP_ID, "name": "nightly", "state": "running", "adversary": {"name": "Hunter"}},
+                  {"id": NEW_OP_ID, "name": "weekly", "state": "finished", "adversary": {"name": "Hunter"}}]
+    abilities = [{"ability_id": f"{rng.getrandbits(128):032x}", "name": f"Ability {i}",
+                  "tactic": rng.choice(["discovery", "collection", "exfiltration"]),
+                  "technique_id": rng.choice(["T1083", "T1005", "T1041"]), "description": "x" * 300,
+                  "executors": [{"platform": "linux", "name": "sh", "command": "find / -name '*.pdf'" * 5}]}
+                 for i in range(1500)]
+    links = [{"id": f"l{i}", "paw": agents[i % 30]["paw"], "status": 0, "ability": {"name": f"Ability {i}"}}
+             for i in range(200)]
+    return {
+        ("GET", "/api/v2/agents"): agents,
+        ("GET", "/api/v2/operations"): operations,
+        ("GET", f"/api/v2/operations/{OP_ID}"): operations[0],
+        ("GET", f"/api/v2/operations/{OP_ID}/links"): links,
+        ("GET", f"/api/v2/operations/{NEW_OP_ID}"): operations[1],
+        ("GET", f"/api/v2/operations/{NEW_OP_ID}/links"): links[:20],
+        ("GET", "/api/v2/abilities"): abilities,
+        ("GET", "/api/v2/adversaries"): [{"adversary_id": "ad-0", "name": "Hunter"}],
+        ("GET", "/api/v2/planners"): [{"id": "atomic", "name": "atomic"}],
+        ("POST", "/api/v2/operations"): {"id": NEW_OP_ID, "name": "weekly"},
+    }
+
+
+ROUTES = {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        time.sleep(REQUEST_S[0])
+        data = ROUTES.get((self.command, self.path.split("?")[0]))
+        body = json.dumps(data if data is not None else {"error": "no route"}).encode()
+        self.send_response(200 if data is not None else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+# (message, the agent's requests after the LLM answered, the answer)
+CONVERSATION = [
+    ("which agents are online?", [("GET", "/api/v2/agents")], "30 agents, paw 4f2a1c on ws-00 ..."),
+    ("list the operations and their state", [("GET", "/api/v2/operations")],
+     f"Operation nightly (id {OP_ID}) is running, weekly is finished."),
+    ("show its links", [("GET", f"/api/v2/operations/{OP_ID}/links")], "200 links, all succeeded."),
+    ("which abilities use technique T1083?", [("GET", "/api/v2/abilities")], "About 500 abilities."),
+    ("start an operation with the Hunter adversary",
+     [("GET", "/api/v2/adversaries"), ("GET", "/api/v2/planners"), ("POST", "/api/v2/operations")],
+     f"Started operation weekly, id {NEW_OP_ID}."),
+    ("is it finished yet?", [("GET", f"/api/v2/operations/{NEW_OP_ID}")], "Yes, it is finished."),
+    ("what did its agents run?", [("GET", f"/api/v2/operations/{NEW_OP_ID}/links")], "20 links."),
+]
+
+
+def run(base, spec, think, prefetch, max_bytes):
+    client = CalderaClient(base_url=base)
+    prefetcher = Prefetcher(spec, client, max_bytes=max_bytes) if prefetch else None
+    waited = 0.0
+    rows = []
+    for message, calls, answer in CONVERSATION:
+        if prefetcher is not None:
+            prefetcher.start(message)
+        time.sleep(think)  # the LLM deciding what to call
+        start = time.perf_counter()
+        for method, path in calls:
+            resp = client.request(method, path, stream=method == "GET", json={} if method == "POST" else None)
+            for _ in resp.iter_content(64 * 1024):
+                pass
+            resp.close()
+        waited += time.perf_counter() - start
+        if prefetcher is not None:
+            prefetcher.observe(answer)
+            rows.append((message, time.perf_counter() - start, prefetcher.finish()))
+    client.close()
+    return waited, rows, prefetcher.stats() if prefetcher is not None else {}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--think", type=float, default=4)
+    parser.add_argument("--request-ms", type=float, default=300)
+    parser.add_argument("--max-bytes-mb", type=float, default=MAX_BYTES / 2 ** 20)
+    args = parser.parse_args()
+    REQUEST_S[0] = args.request_ms / 1000
+    ROUTES.update(make_routes())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    spec = load_caldera_spec()
+
+    print(f"{len(CONVERSATION)} turns, {args.think:g} s LLM per turn, {args.request_ms:.0f} ms per request, "
+          f"prefetch budget {args.max_bytes_mb:g} MB")
+    plain, _, _ = run(base, spec, args.think, False, 0)
+    warmed, rows, totals = run(base, spec, args.think, True, int(args.max_bytes_mb * 2 ** 20))
+    for message, wait, turn in rows:
+        print(f"  {message:<46} {wait * 1000:6.0f} ms waiting  predicted {turn.get('predicted', 0)}  "
+              f"used {turn.get('used', 0)}  wasted {turn.get('wasted', 0)}  {turn.get('bytes', 0) / 1e3:7.0f} kB")
+    print(f"HTTP wait after the LLM: {plain:.2f} s cache only, {warmed:.2f} s with prefetch "
+          f"(-{1 - warmed / plain:.0%})")
+    print(f"prefetches: {totals.get('requests', 0)} requests, {totals.get('used', 0)} used, "
+          f"{totals.get('wasted', 0)} wasted, {totals.get('bytes', 0) / 1e6:.1f} MB, "
+          f"{totals.get('over_budget', 0)} over budget")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
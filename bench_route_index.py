@@ -0,0 +1,103 @@
+"""Plan -> endpoint matching: langchain's regex loop vs RouteIndex.
+
+Reports lookup time per plan and the size of the docs each approach puts
+into the controller prompt, in tokens (doc_render.count_tokens: tiktoken
+when it is installed with its encoding, else an estimate).
+
+Usage: python bench_route_index.py [iterations]
+"""
+import re
+import sys
+import time
+from doc_render import count_tokens, token_unit
+from load_spec import load_caldera_spec
+from route_index import RouteIndex
+from caldera_planner import endpoint_docs
+
+SAMPLE_PLANS = [
+    "1. GET /api/v2/health to check the server status",
+    "1. GET /api/v2/agents to list all agents",
+    "1. GET /api/v2/operations/summary to get a summary of all operations",
+    "1. GET /api/v2/operations to find the operation named Foo\n"
+    "2. GET /api/v2/operations/{id}/links with the id of Foo to list its links",
+    "1. GET /api/v2/agents/abc123 to read the agent\n"
+    "2. PATCH /api/v2/agents/abc123 to set sleep_min to 30 and sleep_max to 60",
+    "1. GET /api/v2/operations/1f2e/links/9a8b/result to fetch the link output",
+    "1. GET /api/v2/adversaries to find the adversary named Discovery\n"
+    "2. POST /api/v2/operations to start an operation with that adversary",
+    "1. GET /api/v2/abilities to find abilities with tactic discovery",
+    "1. GET /api/v2/config/main to read the main config",
+    "1. DELETE /api/v2/operations/1f2e to remove the operation",
+]
+
+
+def regex_docs(api_spec, plan_str):
+    # langchain_community planner._create_and_run_api_controller_agent
+    pattern = r"\b(GET|POST|PATCH|DELETE|PUT)\s+(/\S+)*"
+    matches = re.findall(pattern, plan_str)
+    endpoint_names = [
+        "{method} {route}".format(method=method, route=route.split("?")[0])
+        for method, route in matches
+    ]
+    docs_str = ""
+    for endpoint_name in endpoint_names:
+        for name, _, _ in api_spec.endpoints:
+            regex_name = re.compile(re.sub("\\{.*?\\}", ".*", name))
+            if regex_name.match(endpoint_name):
+                docs_str += f"== Docs for {endpoint_name} == \n{endpoint_docs(api_spec, name)}\n"
+    return docs_str
+
+
+def index_docs(api_spec, route_index, plan_str):
+    docs_str = ""
+    for match in route_index.match_plan(plan_str):
+        docs_str += f"== Docs for {match.name} == \n{endpoint_docs(api_spec, match.name)}\n"
+    return docs_str
+
+
+def _lookup_regex(api_spec, plan_str):
+    pattern = r"\b(GET|POST|PATCH|DELETE|PUT)\s+(/\S+)*"
+    found = []
+    for method, route in re.findall(pattern, plan_str):
+        endpoint_name = f"{method} {route.split('?')[0]}"
+        for name, _, _ in api_spec.endpoints:
+            if re.compile(re.sub("\\{.*?\\}", ".*", name)).match(endpoint_name):
+                found.append(name)
+    return found
+
+
+def main(iterations=200):
+    api_spec = load_caldera_spec()
+
+    start = time.perf_counter()
+    route_index = RouteIndex.from_spec(api_spec)
+    build_us = (time.perf_counter() - start) * 1e6
+
+    # Lookup cost only (docs rendering is memoized and shared by both).
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for plan in SAMPLE_PLANS:
+            _lookup_regex(api_spec, plan)
+    regex_us = (time.perf_counter() - start) * 1e6 / (iterations * len(SAMPLE_PLANS))
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for plan in SAMPLE_PLANS:
+            route_index.match_plan(plan)
+    index_us = (time.perf_counter() - start) * 1e6 / (iterations * len(SAMPLE_PLANS))
+
+    print(f"index build {build_us:.0f} us")
+    print(f"lookup per plan: regex {regex_us:.1f} us, index {index_us:.1f} us ({regex_us / index_us:.0f}x)")
+    print()
+    print(f"{'plan':<60} {'regex tok':>10} {'index tok':>10}")
+    total_regex = total_index = 0
+    for plan in SAMPLE_PLANS:
+        regex_tokens = count_tokens(regex_docs(api_spec, plan))
+        index_tokens = count_tokens(index_docs(api_spec, route_index, plan))
+        total_regex += regex_tokens
+        total_index += index_tokens
+        print(f"{plan.splitlines()[0][:60]:<60} {regex_tokens:>10} {index_tokens:>10}")
+    print(f"{'total':<60} {total_regex:>10} {total_index:>10}  ({token_unit()})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,41 @@
+"""Startup benchmark: cold vs warm load_caldera_spec().
+
+Usage: python bench_spec_cache.py [runs]
+"""
+import sys
+import time
+import shutil
+import tempfile
+import statistics
+from load_spec import load_caldera_spec
+
+
+def _time_ms(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main(runs=5):
+    cold, warm = [], []
+    for _ in range(runs):
+        cache_dir = tempfile.mkdtemp(prefix="spec_cache_")
+        try:
+            # Cold: empty cache dir -> parse, reduce, dereference, render, write.
+            cold.append(_time_ms(lambda: load_caldera_spec(cache_dir=cache_dir)))
+            # Warm: same spec bytes -> unpickle only.
+            warm.append(_time_ms(lambda: load_caldera_spec(cache_dir=cache_dir)))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    uncached = [_time_ms(lambda: load_caldera_spec(use_cache=False)) for _ in range(runs)]
+
+    print(f"runs: {runs}")
+    print(f"uncached  median {statistics.median(uncached):8.1f} ms")
+    print(f"cold      median {statistics.median(cold):8.1f} ms (includes cache write)")
+    print(f"warm      median {statistics.median(warm):8.1f} ms")
+    print(f"speedup   {statistics.median(uncached) / statistics.median(warm):8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,59 @@
+"""Memory/startup benchmark: eager reduce_openapi_spec vs lazy CalderaSpec.
+
+Usage: python bench_spec_memory.py
+"""
+import gc
+import json
+import time
+import tracemalloc
+from langchain_community.agent_toolkits.openapi.spec import reduce_openapi_spec
+from load_spec import SPEC_FILE, _prepare_spec, _reduce_spec
+
+# A typical session only ever looks at a handful of endpoints.
+SESSION_ENDPOINTS = [
+    "GET /api/v2/agents",
+    "PATCH /api/v2/agents/{paw}",
+    "GET /api/v2/operations",
+    "GET /api/v2/operations/{id}/links",
+    "GET /api/v2/abilities",
+]
+
+
+def _measure(fn):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current / 2**20, peak / 2**20
+
+
+def main():
+    with open(SPEC_FILE, "rb") as f:
+        spec_bytes = f.read()
+
+    _, eager_ms, eager_mb, eager_peak = _measure(
+        lambda: reduce_openapi_spec(_prepare_spec(json.loads(spec_bytes)))
+    )
+    print(f"eager            {eager_ms:8.1f} ms  resident {eager_mb:6.2f} MiB  peak {eager_peak:6.2f} MiB")
+
+    def lazy_session(names):
+        spec = _reduce_spec(spec_bytes)
+        for name in names:
+            spec.docs(name)
+        return spec
+
+    _, ms, mb, peak = _measure(lambda: lazy_session([]))
+    print(f"lazy (startup)   {ms:8.1f} ms  resident {mb:6.2f} MiB  peak {peak:6.2f} MiB")
+    _, ms, mb, peak = _measure(lambda: lazy_session(SESSION_ENDPOINTS))
+    print(f"lazy (5 used)    {ms:8.1f} ms  resident {mb:6.2f} MiB  peak {peak:6.2f} MiB")
+    spec = _reduce_spec(spec_bytes)
+    every = [name for name, _, _ in spec.endpoints]
+    _, ms, mb, peak = _measure(lambda: lazy_session(every))
+    print(f"lazy (all {len(every)})   {ms:8.1f} ms  resident {mb:6.2f} MiB  peak {peak:6.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Dependency-free BM25 search over the Caldera spec.
+
+For the offline / self-hosted path where the embeddings server in context.py
+is slow or down. Each endpoint becomes one document made of its path,
+summary, description, tags, parameter names and the field names of the
+component schemas it takes or returns, so "which endpoint sets an agent's
+sleep?" finds PATCH /api/v2/agents/{paw} through Agent.sleep_min without any
+LLM or embedding call. create_search_tool gives the agent that search
+as its search_endpoints tool.
+"""
+import re
+import math
+from collections import Counter
+from route_index import related_routes
+
+K1 = 1.5
+B = 0.75
+
+_STOPWORDS = frozenset(
+    "a an and api are as at be by can do does for from give how i in into is it its me my "
+    "of on or please the their them this to v2 was what when which who with you".split()
+)
+
+# Caldera vocabulary: query term -> extra terms it should also match.
+CALDERA_SYNONYMS = {
+    "paw": ["agent"],
+    "agent": ["paw"],
+    "implant": ["agent", "paw"],
+    "beacon": ["agent", "contact"],
+    "host": ["agent"],
+    "profile": ["adversary"],
+    "adversary": ["profile"],
+    "ttp": ["ability", "technique"],
+    "technique": ["ability"],
+    "procedure": ["ability"],
+    "tactic": ["ability"],
+    "op": ["operation"],
+    "campaign": ["operation"],
+    "link": ["command"],
+    "command": ["link"],
+    "output": ["result"],
+    "result": ["output"],
+    "trait": ["fact"],
+    "fact": ["trait"],
+    "knowledge": ["fact", "relationship"],
+    "callback": ["contact", "sleep"],
+    "interval": ["sleep"],
+    "beaconing": ["sleep"],
+    "stop": ["state"],
+    "pause": ["state"],
+    "status": ["state", "health"],
+    "delete": ["remove"],
+    "remove": ["delete"],
+    "create": ["new", "post"],
+    "add": ["create", "post"],
+    "start": ["create", "post"],
+    "new": ["create", "post"],
+    "update": ["patch", "change"],
+    "set": ["update", "patch"],
+    "change": ["update", "patch"],
+    "edit": ["update", "patch"],
+    "list": ["get", "retrieve"],
+    "show": ["get", "retrieve"],
+    "find": ["get", "retrieve"],
+    "get": ["retrieve"],
+    "upload": ["payload"],
+    "file": ["payload"],
+}
+
+_WORD = re.compile(r"[A-Za-z][a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lowercased, stemmed terms; splits snake_case, camelCase and /paths."""
+    terms = []
+    for word in _WORD.findall(text or ""):
+        word = _stem(word.lower())
+        if word not in _STOPWORDS:
+            terms.append(word)
+    return terms
+
+
+def expand_query(terms):
+    expanded = list(terms)
+    for term in terms:
+        expanded.extend(CALDERA_SYNONYMS.get(term, ()))
+    return expanded
+
+
+def _schema_fields(node, lookup_ref, seen, out, depth=0):
+    """Property names of the schemas under `node`, following $refs one level."""
+    if isinstance(node, dict):
+        ref = node.get("$ref")
+        if isinstance(ref, str) and lookup_ref is not None:
+            if ref not in seen and depth < 1:
+                seen.add(ref)
+                out.append(ref.rsplit("/", 1)[-1])
+                _schema_fields(lookup_ref(ref), lookup_ref, seen, out, depth + 1)
+            return
+        properties = node.get("properties")
+        if isinstance(properties, dict):
+            out.extend(properties)
+        for value in node.values():
+            _schema_fields(value, lookup_ref, seen, out, depth)
+    elif isinstance(node, list):
+        for value in node:
+            _schema_fields(value, lookup_ref, seen, out, depth)
+
+
+def endpoint_document(api_spec, name, description, docs):
+    """Weighted text of one endpoint: method and path count three times, summary twice."""
+    meta = getattr(api_spec, "endpoint_meta", {}).get(name, {})
+    raw = api_spec.raw_docs(name) if hasattr(api_spec, "raw_docs") else docs
+    fields = []
+    _schema_fields(raw, getattr(api_spec, "lookup_ref", None), set(), fields)
+    return " ".join([
+        name, name, name, meta.get("summary", ""), meta.get("summary", ""), description or "",
+        " ".join(meta.get("tags", [])),
+        " ".join(meta.get("parameters", [])),
+        " ".join(fields),
+    ])
+
+
+class BM25Index:
+    """Okapi BM25 over (key, text) documents."""
+
+    def __init__(self, documents, k1=K1, b=B):
+        self.k1 = k1
+        self.b = b
+        self.keys = []
+        self._postings = {}  # term -> [(doc index, term frequency)]
+        lengths = []
+        for key, text in documents:
+            terms = tokenize(text)
+            index = len(self.keys)
+            self.keys.append(key)
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self._postings.setdefault(term, []).append((index, tf))
+        self._lengths = lengths
+        self._avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        n = len(self.keys)
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    @classmethod
+    def from_spec(cls, api_spec):
+        return cls(
+            (name, endpoint_document(api_spec, name, description, docs))
+            for name, description, docs in api_spec.endpoints
+        )
+
+    def search(self, query, k=5):
+        """[(key, score)] best first, only documents sharing a term with the query."""
+        scores = {}
+        for term, weight in Counter(expand_query(tokenize(query))).items():
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term] * weight
+            for index, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / self._avg_length)
+                scores[index] = scores.get(index, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [(self.keys[index], score) for index, score in best]
+
+
+class BM25EndpointRetriever:
+    """EndpointRetriever stand-in that needs no embeddings server."""
+
+    def __init__(self, k=6, min_score=2.0):
+        self.k = k
+        self.min_score = min_score
+        self._spec = None
+        self._index = None
+
+    def index(self, api_spec):
+        if self._spec is not api_spec:
+            self._index = BM25Index.from_spec(api_spec)
+            self._spec = api_spec
+        return self._index
+
+    def retrieve(self, api_spec, query):
+        """Endpoint tuples relevant to `query`, or None to use the full list."""
+        hits = self.index(api_spec).search(query, self.k)
+        if not hits or hits[0][1] < self.min_score:
+            return None
+        names = [name for name, _, _ in api_spec.endpoints]
+        selected = set(related_routes(names, [name for name, _ in hits]))
+        return [endpoint for endpoint in api_spec.endpoints if endpoint[0] in selected]
+
+
+SEARCH_TOOL_NAME = "search_endpoints"
+SEARCH_TOOL_DESCRIPTION = (
+    "Find the Caldera API endpoints for a task described in plain words, e.g. \"which endpoint sets an "
+    "agent's sleep?\". Input is the question; returns up to 5 lines of 'METHOD /path - summary'."
+)
+
+
+def search_text(api_spec, retriever, query, k=5) -> str:
+    hits = retriever.index(api_spec).search(query, k)
+    if not hits:
+        return "No matching endpoint."
+    meta = getattr(api_spec, "endpoint_meta", {})
+    return "\n".join(f"{name} - {meta.get(name, {}).get('summary', '')}".rstrip(" -") for name, _ in hits)
+
+
+def create_search_tool(api_spec, retriever=None):
+    """Single string input tool over the current spec; a SpecProvider's reloads are picked up."""
+    from langchain_core.tools import Tool  # the index itself doesn't need langchain
+
+    retriever = retriever or BM25EndpointRetriever()
+
+    def _run(query: str) -> str:
+        spec = api_spec.current() if hasattr(api_spec, "current") else api_spec
+        return search_text(spec, retriever, query)
+
+    return Tool(name=SEARCH_TOOL_NAME, description=SEARCH_TOOL_DESCRIPTION, func=_run)
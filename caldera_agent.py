@@ -1,5 +1,6 @@
 import requests
 import os
+import asyncio
 from dotenv import load_dotenv
 from langchain.tools import tool, ToolRuntime
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -8,26 +9,26 @@ from rich.console import Console
 from rich.panel import Panel
 from rich.prompt import Prompt
 from langchain_core.messages import HumanMessage, AIMessage
+from spec_provider import SpecProvider
+from caldera_client import get_client
+from json_stream import DEFAULT_LIMIT, response_text
+from payload_sync import MultipartFile
+from intent_router import IntentRouter, describe
+from chat_repl import ainput, run_turn
 
 
 # Load environment variables
 load_dotenv()
 
-# Load LIVE Swagger JSON from your Caldera API
-print("📥 Loading live Swagger spec...")
-try:
-    swagger_spec = requests.get("http://12.1.0.15:8888/api/docs/swagger.json", timeout=10).json()
-    print(f"✅ Loaded {swagger_spec['info']['title']} v{swagger_spec['info']['version']}")
-except Exception as e:
-    print(f"⚠️  Swagger fetch failed: {e}")
-    # Fallback minimal spec
-    swagger_spec = {
-        "info": {"title": "Caldera API", "version": "live"},
-        "paths": {
-            "/api/v2/health": {"get": {"summary": "Health check"}},
-            "/api/v2/agents": {"get": {"summary": "List agents"}}
-        }
-    }
+# Serve the cached Swagger spec right away, revalidate against the live Caldera API in the background
+spec_provider = SpecProvider(base_url="http://12.1.0.15:8888").start()
+swagger_spec = spec_provider.raw_spec
+print(f"✅ Loaded {swagger_spec['info']['title']} v{swagger_spec['info']['version']} (refreshing in background)")
+
+# "list agents", "health", ... are answered straight from the API, no LLM round trip
+intent_router = IntentRouter(spec_provider, base_url="http://12.1.0.15:8888", get=get_client().get)
+# While the server is down calls fail fast and the chat says so without calling the LLM
+get_client().start_health_probe()
 
 # Swagger context formatter
 def format_swagger_context(spec):
@@ -58,7 +59,8 @@ api_context = format_swagger_context(swagger_spec)
 
 # === YOUR EXACT ORIGINAL TOOL ===
 @tool
-def api_call(runtime: ToolRuntime, api_path: str, req_type: str, params: dict, payload: str, body: dict) -> str:
+def api_call(runtime: ToolRuntime, api_path: str, req_type: str, params: dict, payload: str, body: dict,
+             fields: str = "", limit: int = DEFAULT_LIMIT) -> str:
     """Make an API call to a specified endpoint. Depending on the req_type, it might include a payload or body which is json text.
 
     Args:
@@ -67,17 +69,13 @@ def api_call(runtime: ToolRuntime, api_path: str, req_type: str, params: dict, p
         params: Query parameters for the API call
         payload: File path for payload (PUT/POST, e.g., '/tmp/payload.bin')
         body: JSON body for the API call (if applicable)
+        fields: Comma-separated fields to keep from each returned item, e.g. 'paw,host,platform,last_seen' (dotted for nested: 'adversary.name')
+        limit: Maximum number of list items to return; the rest are counted
     """
     req_type = req_type.lower()
-    url = "http://12.1.0.15:8888".strip()
     api_path = api_path.strip()
-    full_url = f"{url}/{api_path}"
-
-    # Headers with SECRET_KEY (ADDED)
-    headers = {"Authorization": f"Bearer {SECRET_KEY}"}
-
-    # File payload handling (YOUR ORIGINAL LOGIC)
-    files = {'file': open(payload, 'rb')} if payload else None
+    client = get_client()
+    full_url = client.url(api_path)
 
     # Body from runtime.state (YOUR ORIGINAL LOGIC)
     body = runtime.state.get("body", body)
@@ -85,27 +83,34 @@ def api_call(runtime: ToolRuntime, api_path: str, req_type: str, params: dict, p
     console.print(f"[yellow]🌐 {req_type.upper()} {full_url}[/yellow]")
     console.print(f"[dim]📥 Params: {params} | 📎 Payload: {payload or 'none'} | 📤 Body: {body}[/dim]")
 
+    # Pooled session: KEY header, per-endpoint timeouts, retries on connect errors / 5xx
     try:
+        # File payload: multipart body streamed from disk while it is sent, file closed at the end
+        upload = MultipartFile(payload) if payload else None
         if req_type == "get":
-            response = requests.get(full_url, params=params, headers=headers, timeout=60)
+            response = client.get(full_url, params=params, stream=True)
         elif req_type == "post":
-            response = requests.post(full_url, files=files, json=body, params=params, headers=headers, timeout=60)
+            if upload:
+                response = client.post(full_url, data=upload, headers={"Content-Type": upload.content_type}, params=params)
+            else:
+                response = client.post(full_url, json=body, params=params)
         elif req_type == "put":
             # ✅ PAYLOAD SUPPORT FOR PUT (your requirement)
-            if files:
-                response = requests.put(full_url, files=files, params=params, headers=headers, timeout=60)
+            if upload:
+                response = client.put(full_url, data=upload, headers={"Content-Type": upload.content_type}, params=params)
             else:
-                response = requests.put(full_url, json=body, params=params, headers=headers, timeout=60)
+                response = client.put(full_url, json=body, params=params)
         elif req_type == "delete":
-            response = requests.delete(full_url, params=params, headers=headers, timeout=60)
+            response = client.delete(full_url, params=params)
         elif req_type == "patch":
-            response = requests.patch(full_url, json=body, params=params, headers=headers, timeout=60)
+            response = client.patch(full_url, json=body, params=params)
         elif req_type == "head":
-            response = requests.head(full_url, params=params, headers=headers, timeout=60)
+            response = client.head(full_url, params=params)
         else:
             return f"Unsupported request type: {req_type}"
         
-        content = response.text[:1200]
+        # Valid JSON of the requested fields / rows plus what was left out, not a cut-off prefix
+        content = response_text(response, fields=fields, limit=limit)
         if response.status_code == 200:
             return f"✅ **SUCCESS {response.status_code}**\n```\n{content}\n```"
         else:
@@ -162,7 +167,7 @@ class ChatBot:
             self.sessions[user_id] = {"history": []}
         return self.sessions[user_id]
     
-    def chat(self, user_id: str, message: str):
+    async def chat(self, user_id: str, message: str):
         session = self.get_session(user_id)
         
         # Add memory context
@@ -176,17 +181,21 @@ class ChatBot:
         
         try:
             history_msgs = history_to_messages(session["history"][-6:])
-            result = agent_executor.run(full_message)
+            # tokens and tool calls are printed as they come; Ctrl-C cancels just this turn
+            turn = await run_turn(agent_executor, {"input": full_message})
+            if turn.cancelled:
+                return {"response": None, "history_length": len(session["history"]), "turn": turn}
 
-            response = result["output"]
+            response = turn.output
             session["history"].append({"human": message, "ai": response})
             
             return {
                 "response": response,
-                "history_length": len(session["history"])
+                "history_length": len(session["history"]),
+                "turn": turn,
             }
         except Exception as e:
-            return {"response": f"❌ Error: {str(e)}", "history_length": len(session["history"])}
+            return {"response": f"❌ Error: {str(e)}", "history_length": len(session["history"]), "turn": None}
 
 def history_to_messages(history):
     msgs = []
@@ -204,8 +213,8 @@ from rich.prompt import Prompt
 
 console = Console()
 
-def cli_chat():
-    user_id = Prompt.ask("👤 User ID", default="demo")
+async def cli_chat_async():
+    user_id = await ainput("👤 User ID", lambda prompt: Prompt.ask(prompt, default="demo"))
     console.print(f"\n[bold green]🤖 LIVE Caldera Gemini Bot | User: {user_id}[/bold green]")
     console.print(Panel.fit(api_context, title="🔥 LIVE API", border_style="blue"))
     console.print("[dim]Commands: 'memory' | 'health' | 'quit'[/dim]\n")
@@ -213,7 +222,7 @@ def cli_chat():
     chatbot = ChatBot()
     
     while True:
-        msg = Prompt.ask("💬")
+        msg = await ainput("💬", Prompt.ask)
         msg_lower = msg.lower()
         
         if msg_lower in ['quit', 'exit', 'bye']:
@@ -221,8 +230,14 @@ def cli_chat():
             break
         
         if msg_lower == 'health':
-            result = chatbot.chat(user_id, "Check API health")
-            console.print(Panel(result["response"], title="🏥 Health", border_style="green"))
+            fast = intent_router.handle("health")
+            if fast:
+                console.print(Panel(fast.output, title="🏥 Health", border_style="green"))
+                console.print(f"[dim]{describe(fast)}[/dim]\n")
+                continue
+            result = await chatbot.chat(user_id, "Check API health")
+            if result["response"] is not None:
+                console.print(Panel(result["response"], title="🏥 Health", border_style="green"))
             continue
         
         if msg_lower == 'memory':
@@ -234,16 +249,36 @@ def cli_chat():
                 console.print("🧠 No API calls yet!")
             continue
         
-        # Check if the message is a GET request or related to agents
-        if msg_lower.startswith("get") or "agents" in msg_lower:
-            # Call perform_api_call directly for known agent queries
-            response = perform_api_call(api_path="api/v2/agents", req_type="get", params={}, payload=None, body={})
-            console.print(f"\n🤖 [bold cyan]{response['output']}[/bold cyan]")
+        breaker = get_client().breaker
+        if not breaker.available:
+            console.print(Panel(breaker.unavailable_message(), title="🔌 Caldera down", border_style="red"))
             continue
 
-        result = chatbot.chat(user_id, msg)
-        console.print(f"\n🤖 [bold cyan]{result['response']}[/bold cyan]")
-        console.print(f"[dim]📊 History: {result['history_length']}[/dim]\n")
+        # Frequent unambiguous requests ("list agents", "show operation X links") skip the LLM
+        fast = intent_router.handle(msg)
+        if fast:
+            console.print(f"\n🤖 [bold cyan]{fast.output}[/bold cyan]")
+            console.print(f"[dim]{describe(fast)}[/dim]\n")
+            continue
+
+        result = await chatbot.chat(user_id, msg)
+        turn = result["turn"]
+        if result["response"] is not None and not (turn and turn.answer_shown):
+            console.print(f"\n🤖 [bold cyan]{result['response']}[/bold cyan]")
+        timings = ""
+        if turn is not None:
+            timings = f" | ⏱ {turn.wall_s:.1f}s"
+            if turn.ttft_s is not None:
+                timings += f", first token {turn.ttft_s:.1f}s"
+            if turn.first_tool_result_s is not None:
+                timings += f", first tool result {turn.first_tool_result_s:.1f}s"
+        console.print(f"[dim]📊 History: {result['history_length']}{timings}[/dim]\n")
+
+    await get_client().aclose()
+
+
+def cli_chat():
+    asyncio.run(cli_chat_async())
 
 if __name__ == "__main__":
     print("🚀 Starting LIVE Caldera Bot...")
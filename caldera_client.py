@@ -0,0 +1,656 @@
+"""One HTTP client for everything that talks to the Caldera API.
+
+tools.api_call, caldera_agent.api_call and the agent's RequestsWrapper used
+module-level requests.get/post/..., a new TCP connection per call, and the
+async path a new aiohttp.ClientSession per request. CalderaClient keeps a
+requests.Session with a bounded keep-alive pool instead, retries connect
+errors and 5xx with jittered backoff, picks the timeout per endpoint and
+sets the KEY header once. get_client() returns the process-wide instance.
+
+GETs are read through a ResponseCache: abilities and adversaries (several
+MB, almost static) are kept for minutes, agents and links for seconds, and
+any POST / PUT / PATCH / DELETE under a collection drops what was cached
+for it. A GET with Cache-Control: no-cache (NO_CACHE) or a conditional
+header always goes to the server.
+
+Requests go through a CircuitBreaker (circuit_breaker): while the server
+is unreachable they raise CircuitOpenError at once instead of waiting out
+retries and timeouts; start_health_probe() lets a background HEAD of
+/api/v2/health close it again.
+
+Compression is always asked for (ACCEPT_ENCODING) and bodies are decoded
+as they are read, chunk by chunk; TransferStats keeps wire bytes against
+decoded bytes per endpoint, to see what a compressing proxy
+(compress_proxy) in front of a server that doesn't compress would save.
+
+Every request made through the client, sync or async and cache hits
+included, is reported to its `listeners` (the answer cache records what a
+turn read and changed that way); requests made under untracked() are not.
+"""
+import os
+import zlib
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Dict, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from contextlib import asynccontextmanager, contextmanager
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import stream_decode_response_unicode
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+from langchain_community.utilities.requests import Requests, TextRequestsWrapper
+from spec_provider import DEFAULT_CALDERA_URL
+from route_index import split_path
+from json_stream import response_text
+from circuit_breaker import CircuitBreaker, HealthProber
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("CALDERA_HTTP_POOL_SIZE", 16))
+RETRIES = int(os.getenv("CALDERA_HTTP_RETRIES", 3))
+BACKOFF = 0.3  # seconds, doubled per retry, plus up to BACKOFF_JITTER
+BACKOFF_JITTER = 0.3
+RETRY_STATUSES = (500, 502, 503, 504)
+
+CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30
+# Read timeout by path prefix, longest prefix wins.
+ENDPOINT_TIMEOUTS = {
+    "/api/v2/health": 5,
+    "/api/v2/abilities": 60,  # several MB of abilities
+    "/api/v2/adversaries": 60,
+    "/api/v2/payloads": 120,  # uploads
+    "/api/v2/operations": 45,  # reports / event logs can be large
+}
+
+# Seconds a GET response may be served from the cache, by the innermost
+# collection in its path (links of /operations/{id}/links). 0 = never cached.
+CACHE_TTLS = {
+    "abilities": 600,
+    "adversaries": 600,
+    "planners": 3600,
+    "obfuscators": 3600,
+    "plugins": 3600,
+    "objectives": 300,
+    "sources": 300,
+    "payloads": 300,
+    "deploy_commands": 300,
+    "config": 60,
+    "schedules": 30,
+    "facts": 10,
+    "relationships": 10,
+    "agents": 5,
+    "operations": 5,
+    "contacts": 5,
+    "links": 2,
+    "potential-links": 2,
+    "result": 2,
+    "health": 0,
+}
+CACHE_MAX_BYTES = int(os.getenv("CALDERA_HTTP_CACHE_MB", 64)) * 1024 * 1024
+# A streamed GET body up to this size is kept as it is read and cached once complete.
+CACHE_STREAM_MAX_BYTES = int(os.getenv("CALDERA_HTTP_CACHE_STREAM_MB", 8)) * 1024 * 1024
+MUTATING = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+IDEMPOTENT = frozenset({"GET", "HEAD", "PUT", "DELETE"})  # safe to send again after a lost response
+NO_CACHE = {"Cache-Control": "no-cache"}  # request headers: skip the response cache
+# Room for a projected GET body under the planner tools' MAX_RESPONSE_LENGTH (5000), notes included.
+PROJECTED_CHARS = 4500
+
+# Set by CalderaClient.untracked(): a context var, so that it holds per thread and per asyncio task.
+_untracked: ContextVar[bool] = ContextVar("caldera_untracked", default=False)
+
+
+class TransferStats:
+    """Wire vs decoded body bytes per endpoint ('GET /api/v2/operations/{id}/report')."""
+
+    def __init__(self):
+        self._endpoints: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method, url, wire, decoded, encoding=None):
+        """wire None: not known, the response is counted but its bytes stay out of the ratio."""
+        key = endpoint_key(method, url)
+        with self._lock:
+            entry = self._endpoints.setdefault(key, {"requests": 0, "compressed": 0, "wire_bytes": 0,
+                                                     "decoded_bytes": 0, "unknown_wire": 0})
+            entry["requests"] += 1
+            entry["compressed"] += bool(encoding) and encoding != "identity"
+            if wire is None:
+                entry["unknown_wire"] += 1
+                return
+            entry["wire_bytes"] += wire
+            entry["decoded_bytes"] += decoded
+
+    def stats(self):
+        with self._lock:
+            endpoints = {k: dict(v) for k, v in self._endpoints.items()}
+        wire = sum(v["wire_bytes"] for v in endpoints.values())
+        decoded = sum(v["decoded_bytes"] for v in endpoints.values())
+        return {"wire_bytes": wire, "decoded_bytes": decoded,
+                "ratio": round(decoded / wire, 2) if wire else None,
+                "unknown_wire": sum(v["unknown_wire"] for v in endpoints.values()), "endpoints": endpoints}
+
+
+def endpoint_key(method, url):
+    """Caldera paths alternate collection / id after /api/v2: ids become {id}."""
+    segments = split_path(url)
+    head, rest = (segments[:2], segments[2:]) if segments[:2] == ["api", "v2"] else ([], segments)
+    rest = [s if i % 2 == 0 else "{id}" for i, s in enumerate(rest)]
+    return f"{method} /" + "/".join(head + rest)
+
+
+_WBITS = {"gzip": 31, "x-gzip": 31, "deflate": 15}  # gzip container, zlib container
+
+
+def _inflated(chunks, encoding):
+    """Decode a gzip / deflate body read undecoded; deflate without its zlib header too."""
+    wbits = _WBITS[encoding]
+    decoder = zlib.decompressobj(wbits)
+    first = True
+    for data in chunks:
+        try:
+            out = decoder.decompress(data)
+        except zlib.error:
+            if not (first and wbits == 15):
+                raise
+            decoder = zlib.decompressobj(-15)
+            out = decoder.decompress(data)
+        first = False
+        if out:
+            yield out
+    tail = decoder.flush()
+    if tail:
+        yield tail
+
+
+def _undecoded(resp, chunk_size, encoding, wire):
+    """resp's body as read from the wire (counted into wire[0]), decoded here instead of by urllib3;
+    urllib3 errors raised as requests' like iter_content does."""
+
+    def read():
+        for data in resp.raw.stream(chunk_size, decode_content=False):
+            wire[0] += len(data)
+            yield data
+
+    try:
+        yield from read() if encoding == "identity" else _inflated(read(), encoding)
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ConnectionError(e)
+    except zlib.error as e:
+        raise requests.exceptions.ContentDecodingError(e)
+
+
+def _metered(resp, method, url, transfer):
+    """Count what resp.iter_content decodes, recorded with the wire bytes once the body is done.
+
+    urllib3's raw.tell() only counts a body of known Content-Length, and one
+    compressed on the fly (compress_proxy) comes chunked: that one is read
+    undecoded and decoded here, to count it. A chunked body in an encoding
+    this doesn't decode (br, zstd) is recorded with an unknown wire size.
+    """
+    iter_content = resp.iter_content
+    encoding = resp.headers.get("Content-Encoding", "identity").strip().lower()
+    chunked = getattr(resp.raw, "chunked", False)
+    by_hand = chunked and (encoding == "identity" or encoding in _WBITS)
+
+    def counted(chunk_size=1, decode_unicode=False):
+        decoded, wire = 0, [0]
+        chunks = _undecoded(resp, chunk_size, encoding, wire) if by_hand else iter_content(chunk_size)
+        if decode_unicode:
+            chunks = stream_decode_response_unicode(chunks, resp)
+        try:
+            for chunk in chunks:
+                decoded += len(chunk)
+                yield chunk
+        finally:
+            if resp.__dict__.pop("iter_content", None) is not None:  # once, later reads are of .content
+                size = wire[0] if by_hand else None if chunked else resp.raw.tell()
+                transfer.record(method, url, size, decoded, resp.headers.get("Content-Encoding"))
+
+    resp.iter_content = counted
+    return resp
+
+
+def _teed(resp, cache, key, url, max_bytes=CACHE_STREAM_MAX_BYTES):
+    """Keep what resp.iter_content yields and cache it once the body was read to the end; bodies
+    over max_bytes, read as text or abandoned half way are not."""
+    iter_content = resp.iter_content
+
+    def teed(*args, **kwargs):
+        body = bytearray() if resp.status_code == 200 else None
+        chunks = iter_content(*args, **kwargs)
+
+        def keep(chunk):
+            nonlocal body
+            if body is not None and isinstance(chunk, bytes) and len(body) + len(chunk) <= max_bytes:
+                body += chunk
+            else:
+                body = None
+
+        complete = False
+        try:
+            for chunk in chunks:
+                keep(chunk)
+                yield chunk
+            complete = True
+        finally:
+            # json_stream stops at the closing bracket, before the end of the stream: a read or
+            # two more tell whether that was all of it (trailing whitespace) or it was abandoned
+            if not complete and body is not None:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    complete = True
+                else:
+                    keep(chunk)
+                    complete = body is not None and next(chunks, None) is None
+            if complete and body is not None:
+                cache.put(key, resp.status_code, resp.headers, bytes(body), url, resp.encoding)
+
+    resp.iter_content = teed
+    return resp
+
+
+class CachedResponse(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    content: bytes
+    url: str
+    encoding: Optional[str]
+    expires: float
+
+
+def cache_key(url, params=None):
+    """Normalized GET key: lowercased scheme/host, no trailing slash, sorted query."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(str(k), str(v)) for k, v in (params.items() if isinstance(params, dict) else params)]
+    path = parts.path.rstrip("/") or "/"
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{path}?{urlencode(sorted(query))}"
+
+
+def collection_path(url):
+    """'/api/v2/operations' for any /api/v2/operations/... URL."""
+    segments = split_path(url)
+    return "/" + "/".join(segments[:3] if segments[:2] == ["api", "v2"] else segments[:1])
+
+
+class ResponseCache:
+    """LRU of GET responses with per-collection TTLs, bounded in bytes."""
+
+    def __init__(self, ttls=None, max_bytes=CACHE_MAX_BYTES, default_ttl=0):
+        self.ttls = dict(CACHE_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = self.misses = self.invalidations = 0
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        # called with (key, entry) on every hit; the prefetcher counts its entries being used
+        self.listeners = []
+
+    def ttl_for(self, url):
+        for segment in reversed(split_path(url)):
+            if segment in self.ttls:
+                return self.ttls[segment]
+        return self.default_ttl
+
+    def get(self, key) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        for listener in tuple(self.listeners):
+            listener(key, entry)
+        return entry
+
+    def peek(self, key) -> Optional[CachedResponse]:
+        """The fresh entry for `key` without counting a hit or a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry if entry is not None and entry.expires >= time.monotonic() else None
+
+    def put(self, key, status, headers, content, url, encoding=None):
+        ttl = self.ttl_for(url)
+        if ttl <= 0 or status != 200 or len(content) > self.max_bytes:
+            return
+        entry = CachedResponse(status, dict(headers), content, url, encoding, time.monotonic() + ttl)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, url):
+        """Drop every cached response under the collection `url` belongs to."""
+        prefix = collection_path(url)
+        with self._lock:
+            stale = [k for k in self._entries if _key_path(k) == prefix or _key_path(k).startswith(prefix + "/")]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits,
+                    "misses": self.misses, "invalidations": self.invalidations}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.content)
+
+
+def _key_path(key):
+    return urlsplit(key).path
+
+
+def _cacheable(kwargs, headers):
+    if kwargs.get("data") or kwargs.get("json") or kwargs.get("files"):
+        return False
+    if not headers:
+        return True
+    # Conditional requests and Cache-Control: no-cache want the server's answer, not ours.
+    return not any(h.lower() in ("if-none-match", "if-modified-since")
+                   or h.lower() == "cache-control" and "no-cache" in str(v).lower() for h, v in headers.items())
+
+
+def _to_response(entry: CachedResponse) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = entry.status
+    resp.headers = CaseInsensitiveDict(entry.headers)
+    resp._content = entry.content
+    resp._content_consumed = True  # iter_content() slices the cached body
+    resp.url = entry.url
+    resp.encoding = entry.encoding
+    return resp
+
+
+class CalderaClient:
+    """Pooled, retrying Caldera HTTP client (sync requests + one shared aiohttp session)."""
+
+    def __init__(self, base_url=None, token=None, pool_size=POOL_SIZE, retries=RETRIES,
+                 timeouts=None, default_timeout=DEFAULT_READ_TIMEOUT, cache=None, breaker=None):
+        self.base_url = (base_url or os.getenv("CALDERA_WEB_URL") or DEFAULT_CALDERA_URL).rstrip("/")
+        self.headers = {"KEY": f"{token or os.getenv('CALDERA_API_TOKEN')}"}
+        self.pool_size = pool_size
+        self.retries = retries
+        self.timeouts = dict(ENDPOINT_TIMEOUTS if timeouts is None else timeouts)
+        self.default_timeout = default_timeout
+        # cache=False disables the GET cache, a ResponseCache replaces the default one.
+        if cache is None:
+            cache = os.getenv("CALDERA_HTTP_CACHE") != "off"
+        self.cache = ResponseCache() if cache is True else (cache or None)
+        self.breaker = breaker or CircuitBreaker(f"Caldera server at {self.base_url}")
+        self._prober = None
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,  # the server got the request, replaying a POST could run it twice
+            status=retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}),
+            backoff_factor=BACKOFF,
+            backoff_jitter=BACKOFF_JITTER,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING  # gzip, deflate (+ br / zstd when installed)
+        self.transfer = TransferStats()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._aiosessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._aio_lock = threading.Lock()
+        # called with (method, url, params) for every request, see notify()
+        self.listeners = []
+
+    def url(self, path):
+        """Full URL for 'api/v2/agents', '/api/v2/agents' or an absolute URL."""
+        if "://" in path:
+            return path
+        return f"{self.base_url}/{path.strip().lstrip('/')}"
+
+    def timeout_for(self, url):
+        path = "/" + "/".join(split_path(url))
+        best = max((prefix for prefix in self.timeouts if path.startswith(prefix)), key=len, default=None)
+        return (CONNECT_TIMEOUT, self.timeouts[best] if best else self.default_timeout)
+
+    def notify(self, method, url, params=None):
+        """Tell the listeners about a request, unless it is made under untracked()."""
+        if _untracked.get():
+            return
+        for listener in tuple(self.listeners):
+            try:
+                listener(method, url, params)
+            except Exception:
+                logger.exception("Request listener failed on %s %s", method, url)
+
+    @contextmanager
+    def untracked(self):
+        """Requests made in this block (this thread / task) are not reported to the listeners:
+        the client's own speculative or validation requests, not the agent's."""
+        token = _untracked.set(True)
+        try:
+            yield
+        finally:
+            _untracked.reset(token)
+
+    def request(self, method, path, headers=None, **kwargs) -> requests.Response:
+        method = method.upper()
+        url = self.url(path)
+        self.notify(method, url, kwargs.get("params"))
+        kwargs.setdefault("timeout", self.timeout_for(url))
+        key = None
+        if method == "GET" and self.cache is not None and self.cache.ttl_for(url) > 0 and _cacheable(kwargs, headers):
+            key = cache_key(url, kwargs.get("params"))
+            entry = self.cache.get(key)
+            if entry is not None:
+                return _to_response(entry)
+        self.breaker.before()
+        stream = kwargs.pop("stream", False)
+        try:
+            # always streamed, so that the body is read through _metered
+            resp = self.session.request(method, url, headers=headers, stream=True, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            self.breaker.failure(f"{type(e).__name__}: {e}")
+            raise
+        except Exception:
+            self.breaker.release()  # never sent (bad URL...): says nothing about the server
+            raise
+        self.breaker.record(resp.status_code)
+        _metered(resp, method, url, self.transfer)
+        if stream:
+            if key is not None:
+                _teed(resp, self.cache, key, url)  # the caller reads the body piecewise
+        elif key is not None:
+            self.cache.put(key, resp.status_code, resp.headers, resp.content, url, resp.encoding)
+        else:
+            resp.content  # read now, as requests does without stream=True
+        if method in MUTATING:
+            self.invalidate(url)
+        return resp
+
+    def invalidate(self, url):
+        if self.cache is not None:
+            self.cache.invalidate(url)
+
+    def start_health_probe(self, **kwargs) -> HealthProber:
+        """Start (once) the background HEAD /api/v2/health feeding self.breaker."""
+        if self._prober is None:
+            self._prober = HealthProber(self, **kwargs)
+        return self._prober.start()
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else {}
+
+    def transfer_stats(self):
+        return self.transfer.stats()
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def head(self, path, **kwargs):
+        return self.request("HEAD", path, **kwargs)
+
+    async def aiosession(self) -> aiohttp.ClientSession:
+        """The shared aiohttp session of the running event loop (sessions can't cross loops)."""
+        loop = asyncio.get_running_loop()
+        with self._aio_lock:
+            for other in [l for l, s in self._aiosessions.items() if l.is_closed() or s.closed]:
+                del self._aiosessions[other]
+            session = self._aiosessions.get(loop)
+            if session is None:
+                session = aiohttp.ClientSession(
+                    headers={**self.headers, "Accept-Encoding": "gzip, deflate"},
+                    connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30),
+                    timeout=aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=self.default_timeout),
+                )
+                self._aiosessions[loop] = session
+        return session
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        with self._aio_lock:
+            session = self._aiosessions.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+    def close(self):
+        if self._prober is not None:
+            self._prober.stop()
+        self.session.close()
+
+    def requests_wrapper(self) -> "CalderaRequestsWrapper":
+        """langchain RequestsWrapper for create_openapi_agent backed by this client."""
+        return CalderaRequestsWrapper(client=self, headers=self.headers)
+
+
+class CalderaRequests(Requests):
+    """langchain's Requests, sending through a CalderaClient."""
+
+    client: Any = None
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.client.get(url, **kwargs)
+
+    def post(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return self.client.post(url, json=data, **kwargs)
+
+    def patch(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return self.client.patch(url, json=data, **kwargs)
+
+    def put(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return self.client.put(url, json=data, **kwargs)
+
+    def delete(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.client.delete(url, **kwargs)
+
+    @asynccontextmanager
+    async def _arequest(self, method: str, url: str, **kwargs: Any) -> AsyncGenerator[aiohttp.ClientResponse, None]:
+        """Retried like AsyncCalderaClient (and the sync session): connect errors, and 5xx or a lost
+        connection on an idempotent method, with the same backoff. Not once the response was handed
+        to the caller, its body may be half read."""
+        method, url = method.upper(), self.client.url(url)
+        breaker = self.client.breaker
+        session = await self.client.aiosession()
+        self.client.notify(method, url, kwargs.get("params"))
+        try:
+            attempt = 0
+            while True:
+                breaker.before()
+                try:
+                    response = await session.request(method, url, **kwargs)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    breaker.failure(f"{type(e).__name__}: {e}")
+                    retryable = isinstance(e, aiohttp.ClientConnectorError) or method in IDEMPOTENT
+                    if attempt >= self.client.retries or not retryable:
+                        raise
+                except BaseException:
+                    breaker.release()  # cancelled, or failed on our side: says nothing about the server
+                    raise
+                else:
+                    breaker.record(response.status)
+                    if response.status not in RETRY_STATUSES or method not in IDEMPOTENT \
+                            or attempt >= self.client.retries:
+                        break
+                    response.release()
+                await asyncio.sleep(BACKOFF * 2 ** attempt + random.uniform(0, BACKOFF_JITTER))
+                attempt += 1
+            try:
+                async with response:
+                    yield response
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                breaker.failure(f"{type(e).__name__}: {e}")
+                raise
+        finally:
+            if method in MUTATING:
+                self.client.invalidate(url)
+
+
+class CalderaRequestsWrapper(TextRequestsWrapper):
+    """TextRequestsWrapper whose requests go through a shared CalderaClient.
+
+    GET bodies are streamed and projected (json_stream) to fit the planner
+    tools' 5000 character cut as valid JSON, instead of being cut mid-item.
+    """
+
+    client: Any = None
+    max_chars: int = PROJECTED_CHARS
+
+    def get(self, url: str, **kwargs: Any) -> str:
+        return response_text(self.requests.get(url, stream=True, **kwargs), max_chars=self.max_chars)
+
+    @property
+    def requests(self) -> Requests:
+        return CalderaRequests(client=self.client, headers=self.headers, auth=self.auth, verify=self.verify)
+
+
+_client: Optional[CalderaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> CalderaClient:
+    """Process-wide CalderaClient (CALDERA_WEB_URL / CALDERA_API_TOKEN)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CalderaClient()
+        return _client
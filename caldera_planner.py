@@ -0,0 +1,363 @@
+"""Caldera flavour of langchain's OpenAPI planner agent.
+
+Same orchestrator / planner / controller stack as
+langchain_community.agent_toolkits.openapi.planner.create_openapi_agent, with
+the pieces we need to tune for the Caldera spec swapped out.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Literal, Optional, Sequence
+import yaml
+import doc_render
+from langchain_core.callbacks import BaseCallbackManager
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.prompts import PromptTemplate
+from langchain_core.tools import Tool
+from langchain_community.agent_toolkits.openapi.planner import (
+    Operation,
+    RequestsDeleteToolWithParsing,
+    RequestsGetToolWithParsing,
+    RequestsPatchToolWithParsing,
+    RequestsPostToolWithParsing,
+    RequestsPutToolWithParsing,
+)
+from langchain_community.agent_toolkits.openapi.planner_prompt import (
+    API_CONTROLLER_PROMPT,
+    API_CONTROLLER_TOOL_DESCRIPTION,
+    API_CONTROLLER_TOOL_NAME,
+    API_ORCHESTRATOR_PROMPT,
+    API_PLANNER_PROMPT,
+    API_PLANNER_TOOL_DESCRIPTION,
+    API_PLANNER_TOOL_NAME,
+    PARSING_DELETE_PROMPT,
+    PARSING_GET_PROMPT,
+    PARSING_PATCH_PROMPT,
+    PARSING_POST_PROMPT,
+    PARSING_PUT_PROMPT,
+)
+from langchain_community.agent_toolkits.openapi.spec import ReducedOpenAPISpec
+from langchain_community.utilities.requests import RequestsWrapper
+from route_index import RouteIndex
+from output_extractor import extracting
+
+DocsFormat = Literal["compact", "yaml"]
+ParseMode = Literal["extract", "llm"]
+
+# Token budget for all endpoint docs of one plan in the controller prompt.
+CONTROLLER_DOCS_TOKEN_BUDGET = int(os.getenv("CALDERA_DOCS_TOKEN_BUDGET", 1500))
+# Controller prompts kept, one per set of endpoints a plan calls.
+CONTROLLER_PROMPT_CACHE_SIZE = 64
+
+# Same order as langchain's _create_api_controller_agent.
+CONTROLLER_TOOLS = (
+    ("GET", RequestsGetToolWithParsing, PARSING_GET_PROMPT),
+    ("POST", RequestsPostToolWithParsing, PARSING_POST_PROMPT),
+    ("PUT", RequestsPutToolWithParsing, PARSING_PUT_PROMPT),
+    ("DELETE", RequestsDeleteToolWithParsing, PARSING_DELETE_PROMPT),
+    ("PATCH", RequestsPatchToolWithParsing, PARSING_PATCH_PROMPT),
+)
+
+
+def current_spec(api_spec):
+    """The spec to use right now; a SpecProvider may swap it between calls."""
+    if hasattr(api_spec, "current"):
+        return api_spec.current()
+    return api_spec
+
+
+def endpoint_docs(api_spec, name, docs_format="yaml", budget=None):
+    """Docs of one endpoint, using the spec's memoized renderings when it has them.
+
+    "yaml" is what langchain's controller shows, "compact" a doc_render
+    signature fitted to `budget` tokens.
+    """
+    if docs_format == "compact":
+        if hasattr(api_spec, "render_signature"):
+            return api_spec.render_signature(name, budget)
+        docs = next(docs for n, _, docs in api_spec.endpoints if n == name)
+        return doc_render.render_signature(name, docs, budget=budget)
+    if hasattr(api_spec, "render_docs"):
+        return api_spec.render_docs(name)
+    return yaml.dump(next(docs for n, _, docs in api_spec.endpoints if n == name))
+
+
+def plan_docs(api_spec, route_index, plan_str, docs_format="yaml", budget=None):
+    """Controller docs for every endpoint `plan_str` calls, budget split evenly."""
+    matches = route_index.match_plan(plan_str)
+    per_endpoint = budget // len(matches) if budget and matches else None
+    docs_str = ""
+    for match in matches:
+        docs = endpoint_docs(api_spec, match.name, docs_format, per_endpoint)
+        docs_str += f"== Docs for {match.name} == \n{docs}\n"
+    return docs_str
+
+
+def _planner_chain(llm, endpoints):
+    from langchain_classic.chains.llm import LLMChain
+
+    endpoint_descriptions = [
+        f"{name} {description}" for name, description, _ in endpoints
+    ]
+    prompt = PromptTemplate(
+        template=API_PLANNER_PROMPT,
+        input_variables=["query"],
+        partial_variables={"endpoints": "- " + "- ".join(endpoint_descriptions)},
+    )
+    return LLMChain(llm=llm, prompt=prompt)
+
+
+def _create_api_planner_tool(
+    api_spec: ReducedOpenAPISpec,
+    llm: BaseLanguageModel,
+    endpoint_retriever: Optional[Any] = None,
+) -> Tool:
+    """Planner tool; with an endpoint_retriever the prompt only lists the
+    endpoints retrieved for the query (all of them if retrieval is unsure)."""
+    # Rebuilt only when the spec behind api_spec changes.
+    state = {"spec": None, "chain": None}
+
+    def _run_api_planner(query: str) -> str:
+        spec = current_spec(api_spec)
+        if endpoint_retriever is not None:
+            endpoints = endpoint_retriever.retrieve(spec, query)
+            if endpoints is not None:
+                return _planner_chain(llm, endpoints).run(query)
+        if state["spec"] is not spec:
+            state["chain"] = _planner_chain(llm, spec.endpoints)
+            state["spec"] = spec
+        return state["chain"].run(query)
+
+    return Tool(
+        name=API_PLANNER_TOOL_NAME,
+        description=API_PLANNER_TOOL_DESCRIPTION,
+        func=_run_api_planner,
+    )
+
+
+class ControllerFactory:
+    """Controller agents for one LLM and requests wrapper, without rebuilding them per plan.
+
+    langchain's _create_api_controller_agent makes new parsing chains,
+    requests tools, a controller prompt and an AgentExecutor for every plan.
+    Here the tools and chains are built once, the controller prompt of each
+    set of endpoints is kept in an LRU, and each thread reuses one executor
+    that only gets the plan's prompt swapped in.
+    """
+
+    def __init__(self, requests_wrapper, llm, allow_dangerous_requests, allowed_operations,
+                 docs_format: DocsFormat = "compact", docs_token_budget=CONTROLLER_DOCS_TOKEN_BUDGET,
+                 parse_mode: ParseMode = "extract", cache_size=CONTROLLER_PROMPT_CACHE_SIZE, verbose=True):
+        from langchain_classic.chains.llm import LLMChain
+
+        self.llm = llm
+        self.docs_format = docs_format
+        self.docs_token_budget = docs_token_budget
+        self.cache_size = cache_size
+        self.verbose = verbose
+        self.tools = [
+            cls(requests_wrapper=requests_wrapper, llm_chain=LLMChain(llm=llm, prompt=parsing_prompt),
+                allow_dangerous_requests=allow_dangerous_requests)
+            for operation, cls, parsing_prompt in CONTROLLER_TOOLS if operation in allowed_operations
+        ]
+        if not self.tools:
+            raise ValueError("Tools not found")
+        if parse_mode == "extract":
+            self.tools = [extracting(tool) for tool in self.tools]
+        self.hits = self.misses = 0
+        self._spec = None
+        self._route_index = None
+        self._prompts: "OrderedDict[tuple, PromptTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def prompt(self, spec, plan_str) -> PromptTemplate:
+        """Controller prompt for the endpoints `plan_str` calls, from the LRU when it's there."""
+        with self._lock:
+            if self._spec is not spec:  # a reloaded spec has other docs
+                self._route_index = RouteIndex.from_spec(spec)
+                self._prompts.clear()
+                self._spec = spec
+            route_index = self._route_index
+        names = tuple(sorted(match.name for match in route_index.match_plan(plan_str)))
+        with self._lock:
+            prompt = self._prompts.get(names)
+            if prompt is not None:
+                self._prompts.move_to_end(names)
+                self.hits += 1
+                return prompt
+            self.misses += 1
+        docs_str = plan_docs(spec, route_index, plan_str, self.docs_format, self.docs_token_budget)
+        prompt = PromptTemplate(
+            template=API_CONTROLLER_PROMPT,
+            input_variables=["input", "agent_scratchpad"],
+            partial_variables={
+                "api_url": spec.servers[0]["url"],
+                "api_docs": docs_str,
+                "tool_names": ", ".join(tool.name for tool in self.tools),
+                "tool_descriptions": "\n".join(f"{tool.name}: {tool.description}" for tool in self.tools),
+            },
+        )
+        with self._lock:
+            self._prompts[names] = prompt
+            while len(self._prompts) > self.cache_size:
+                self._prompts.popitem(last=False)
+        return prompt
+
+    def _executor(self, prompt):
+        executor = getattr(self._local, "executor", None)
+        if executor is None:
+            from langchain_classic.agents.agent import AgentExecutor
+            from langchain_classic.agents.mrkl.base import ZeroShotAgent
+            from langchain_classic.chains.llm import LLMChain
+
+            agent = ZeroShotAgent(
+                llm_chain=LLMChain(llm=self.llm, prompt=prompt),
+                allowed_tools=[tool.name for tool in self.tools],
+            )
+            executor = AgentExecutor.from_agent_and_tools(agent=agent, tools=self.tools, verbose=self.verbose)
+            self._local.executor = executor
+        return executor
+
+    def controller(self, spec, plan_str):
+        """This thread's controller AgentExecutor, set up for `plan_str`."""
+        prompt = self.prompt(spec, plan_str)
+        executor = self._executor(prompt)
+        executor.agent.llm_chain.prompt = prompt  # only the docs differ from the last plan
+        return executor
+
+    def stats(self) -> Dict[str, int]:
+        return {"prompts": len(self._prompts), "hits": self.hits, "misses": self.misses}
+
+
+def _create_api_controller_tool(
+    api_spec: ReducedOpenAPISpec,
+    requests_wrapper: RequestsWrapper,
+    llm: BaseLanguageModel,
+    allow_dangerous_requests: bool,
+    allowed_operations: Sequence[Operation],
+    docs_format: DocsFormat = "compact",
+    docs_token_budget: Optional[int] = CONTROLLER_DOCS_TOKEN_BUDGET,
+    parse_mode: ParseMode = "extract",
+    async_client: Optional[Any] = None,
+) -> Tool:
+    """Expose controller as a tool.
+
+    Unlike langchain's version, the endpoints of a plan are resolved through a
+    prebuilt RouteIndex: one trie walk per call instead of compiling and
+    trying a regex per endpoint, and exactly one endpoint's docs per call.
+    Docs are compact signatures within docs_token_budget unless
+    docs_format="yaml". With parse_mode="extract" the requests_* tools apply
+    output_instructions locally (output_extractor) and only fall back to
+    their PARSING_*_PROMPT chain when that fails. The controller agent
+    itself comes from a ControllerFactory instead of being rebuilt per plan.
+    With an async_client (async_client.AsyncCalderaClient) the GETs of the
+    plan that don't depend on other steps are sent concurrently first
+    (plan_dag) and the controller only makes the remaining calls.
+    """
+    factory = ControllerFactory(
+        requests_wrapper,
+        llm,
+        allow_dangerous_requests,
+        allowed_operations,
+        docs_format,
+        docs_token_budget,
+        parse_mode,
+    )
+
+    def _create_and_run_api_controller_agent(plan_str: str) -> str:
+        spec = current_spec(api_spec)
+        if async_client is None or "GET" not in allowed_operations:
+            return factory.controller(spec, plan_str).run(plan_str)
+        from plan_dag import PREFETCHED_NOTE, PlanDAG, prefetch, prefetched_text
+
+        dag = PlanDAG.from_plan(plan_str)
+        done = prefetch(async_client, dag)
+        if not done:
+            return factory.controller(spec, plan_str).run(plan_str)
+        results = prefetched_text(dag, done)
+        if len(done) == len(dag.steps):
+            return results
+        # docs only for the steps left to the controller
+        remaining = "\n".join(step.text for step in dag.steps if step.number not in done)
+        return factory.controller(spec, remaining).run(f"{plan_str}\n\n{PREFETCHED_NOTE}\n{results}")
+
+    return Tool(
+        name=API_CONTROLLER_TOOL_NAME,
+        func=_create_and_run_api_controller_agent,
+        description=API_CONTROLLER_TOOL_DESCRIPTION,
+    )
+
+
+def create_openapi_agent(
+    api_spec: ReducedOpenAPISpec,
+    requests_wrapper: RequestsWrapper,
+    llm: BaseLanguageModel,
+    shared_memory: Optional[Any] = None,
+    callback_manager: Optional[BaseCallbackManager] = None,
+    verbose: bool = True,
+    agent_executor_kwargs: Optional[Dict[str, Any]] = None,
+    allow_dangerous_requests: bool = False,
+    allowed_operations: Sequence[Operation] = ("GET", "POST"),
+    docs_format: DocsFormat = "compact",
+    docs_token_budget: Optional[int] = CONTROLLER_DOCS_TOKEN_BUDGET,
+    endpoint_retriever: Optional[Any] = None,
+    extra_tools: Sequence[Tool] = (),
+    parse_mode: ParseMode = "extract",
+    async_client: Optional[Any] = None,
+    **kwargs: Any,
+) -> Any:
+    """Drop-in replacement for langchain's planner.create_openapi_agent.
+
+    api_spec may also be a spec_provider.SpecProvider, the tools then pick up
+    a reloaded spec on their next call. docs_format / docs_token_budget pick
+    how the controller prompt documents the endpoints of a plan. An
+    endpoint_retriever (endpoint_retriever.EndpointRetriever) narrows the
+    endpoints the planner sees down to the ones relevant to the query.
+    extra_tools (single string input) are offered to the orchestrator next
+    to the planner and controller. parse_mode="llm" keeps langchain's LLM
+    parsing of every response instead of the local output extraction. With
+    an async_client, the independent GETs of a plan run concurrently
+    before the controller takes over the steps that depend on them.
+    """
+    from langchain_classic.agents.agent import AgentExecutor
+    from langchain_classic.agents.mrkl.base import ZeroShotAgent
+    from langchain_classic.chains.llm import LLMChain
+
+    tools = [
+        _create_api_planner_tool(api_spec, llm, endpoint_retriever),
+        _create_api_controller_tool(
+            api_spec,
+            requests_wrapper,
+            llm,
+            allow_dangerous_requests,
+            allowed_operations,
+            docs_format,
+            docs_token_budget,
+            parse_mode,
+            async_client,
+        ),
+        *extra_tools,
+    ]
+    prompt = PromptTemplate(
+        template=API_ORCHESTRATOR_PROMPT,
+        input_variables=["input", "agent_scratchpad"],
+        partial_variables={
+            "tool_names": ", ".join([tool.name for tool in tools]),
+            "tool_descriptions": "\n".join(
+                [f"{tool.name}: {tool.description}" for tool in tools]
+            ),
+        },
+    )
+    agent = ZeroShotAgent(
+        llm_chain=LLMChain(llm=llm, prompt=prompt, memory=shared_memory),
+        allowed_tools=[tool.name for tool in tools],
+        **kwargs,
+    )
+    return AgentExecutor.from_agent_and_tools(
+        agent=agent,
+        tools=tools,
+        callback_manager=callback_manager,
+        verbose=verbose,
+        **(agent_executor_kwargs or {}),
+    )
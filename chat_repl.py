@@ -0,0 +1,161 @@
+"""Chat turns on the event loop: streamed output, Ctrl-C cancels the turn only.
+
+invoke() prints nothing until the whole turn is over, and Ctrl-C during it
+kills the process along with its caches and the agent's memory. run_turn
+streams the turn instead: the model's tokens as they arrive, a line per
+tool call and per result. Ctrl-C while it runs cancels that turn's task
+(the model stream and the aiohttp requests in flight with it) and the
+session goes on; at the prompt, Ctrl-C still quits.
+
+ToolCallingAgent.astream gives the events directly; anything else (the
+planner's AgentExecutor, caldera_agent's ReAct executor) goes through
+langchain's astream_events. Every turn reports time to first token and
+to first tool result next to the wall time.
+"""
+import sys
+import json
+import time
+import signal
+import asyncio
+import threading
+from typing import AsyncIterator, NamedTuple, Optional
+from tool_agent import AgentEvent, ToolCallingAgent, _text
+
+RESULT_PREVIEW_CHARS = 100
+
+
+class TurnResult(NamedTuple):
+    output: Optional[str]  # None when cancelled
+    cancelled: bool
+    answer_shown: bool  # the answer already went out as tokens, no need to print it again
+    ttft_s: Optional[float]  # first streamed token
+    first_tool_result_s: Optional[float]
+    tool_calls: int
+    wall_s: float
+
+    def timings(self):
+        """For TurnMetrics.end_turn."""
+        return {"ttft_s": _round(self.ttft_s), "first_tool_result_s": _round(self.first_tool_result_s),
+                "tool_calls": self.tool_calls, "cancelled": self.cancelled}
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+async def ainput(prompt="", ask=input):
+    """`ask(prompt)` (input, rich's Prompt.ask) without blocking the loop. In a daemon thread,
+    not the default executor: asyncio.run would wait for a pending input() on the way out."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(value, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def run():
+        try:
+            value = ask(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(settle, None, e)
+        else:
+            loop.call_soon_threadsafe(settle, value, None)
+    threading.Thread(target=run, daemon=True, name="chat-input").start()
+    return await future
+
+
+async def agent_events(agent, inputs, config=None) -> AsyncIterator[AgentEvent]:
+    """The turn as AgentEvents, whichever engine runs it."""
+    if isinstance(agent, ToolCallingAgent):
+        async for event in agent.astream(inputs, config):
+            yield event
+        return
+    output = None
+    async for event in agent.astream_events(inputs, config=config, version="v2"):
+        kind, data = event["event"], event["data"]
+        if kind in ("on_chat_model_stream", "on_llm_stream"):
+            chunk = data.get("chunk")
+            content = getattr(chunk, "content", None)
+            text = _text(content) if content is not None else getattr(chunk, "text", "")
+            if text:
+                yield AgentEvent("token", text)
+        elif kind == "on_tool_start":
+            yield AgentEvent("tool_call", call={"name": event["name"], "args": data.get("input"), "id": event["run_id"]})
+        elif kind == "on_tool_end":
+            result = data.get("output")
+            yield AgentEvent("tool_result", str(getattr(result, "content", result)),
+                             {"name": event["name"], "args": data.get("input"), "id": event["run_id"]})
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            output = data.get("output")
+    if isinstance(output, dict):
+        output = output.get("output") or output.get("structured_response")
+    yield AgentEvent("answer", "" if output is None else str(output))
+
+
+def describe_call(call) -> str:
+    args = call.get("args")
+    if not args:  # astream_events doesn't always have a tool's input
+        return call["name"]
+    if isinstance(args, dict) and "method" in args and "path" in args:
+        rest = {k: v for k, v in args.items() if k not in ("method", "path") and v not in (None, "", {})}
+        return f"{call['name']} {args['method']} {args['path']}" + (f" {json.dumps(rest, default=str)}" if rest else "")
+    text = args if isinstance(args, str) else json.dumps(args, default=str)
+    return f"{call['name']} {text[:200]}"
+
+
+async def run_turn(agent, inputs, config=None, out=None) -> TurnResult:
+    """Stream one turn to `out` (stdout); Ctrl-C cancels it instead of ending the program.
+    Errors of the agent are raised as with invoke()."""
+    out = out or sys.stdout
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    state = {"ttft": None, "tool": None, "calls": 0, "output": None, "since_tool": []}
+
+    async def consume():
+        async for event in agent_events(agent, inputs, config):
+            elapsed = time.perf_counter() - start
+            if event.kind == "token":
+                if state["ttft"] is None:
+                    state["ttft"] = elapsed
+                state["since_tool"].append(event.text)
+                out.write(event.text)
+            elif event.kind == "tool_call":
+                state["calls"] += 1
+                state["since_tool"] = []
+                out.write(f"\n→ {describe_call(event.call)}\n")
+            elif event.kind == "tool_result":
+                if state["tool"] is None:
+                    state["tool"] = elapsed
+                state["since_tool"] = []
+                preview = event.text.strip().split("\n", 1)[0][:RESULT_PREVIEW_CHARS]
+                out.write(f"← {event.call['name']} {preview} ({elapsed:.1f}s)\n")
+            elif event.kind == "answer":
+                state["output"] = event.text
+            out.flush()
+
+    task = asyncio.ensure_future(consume())
+    try:
+        previous = signal.signal(signal.SIGINT, lambda *_: loop.call_soon_threadsafe(task.cancel))
+    except ValueError:  # not the main thread, Ctrl-C isn't ours to handle
+        previous = None
+    try:
+        await asyncio.wait({task})
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGINT, previous)
+        task.cancel()  # no-op once it is done; when we are the ones cancelled, so is the turn
+    wall = time.perf_counter() - start
+    if task.cancelled():
+        out.write("\n⏹ turn cancelled\n")
+        out.flush()
+        return TurnResult(None, True, False, state["ttft"], state["tool"], state["calls"], wall)
+    task.result()
+    output = state["output"]
+    shown = bool(output) and "".join(state["since_tool"]).strip() == output.strip()
+    if state["since_tool"]:
+        out.write("\n")
+    return TurnResult(output, False, shown, state["ttft"], state["tool"], state["calls"], wall)
@@ -0,0 +1,211 @@
+"""Fail fast while the Caldera server is down.
+
+With the server down or restarting, every api_call waited out its connect
+retries and read timeout, and the model spent LLM calls reasoning about
+the errors. The shared CalderaClient now goes through a CircuitBreaker:
+
+- closed: requests go out; FAILURE_THRESHOLD connection errors / timeouts /
+  502-504 in a row open it;
+- open: requests raise CircuitOpenError at once (cached GETs are still
+  served), and the chat loop answers without calling the LLM;
+- half-open: one trial request (or health probe) at a time; success
+  closes the breaker, failure opens it again.
+
+HealthProber sends HEAD /api/v2/health in the background: every
+`interval` seconds while the breaker is closed (skipped when a request
+just succeeded), every `min_interval` seconds doubling up to
+`max_interval` while it is open, and right away after a request failure.
+A probe that gets an answer moves an open breaker to half-open and a
+half-open one to closed.
+"""
+import time
+import logging
+import threading
+from typing import Optional
+import requests
+from spec_provider import HEALTH_PATH
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 30  # seconds open before a trial request, when no prober runs
+DOWN_STATUSES = (502, 503, 504)  # a proxy in front of a restarting server
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The breaker is open: the request was not sent."""
+
+
+class CircuitBreaker:
+    """closed -> open after consecutive failures -> half-open -> closed."""
+
+    def __init__(self, name="Caldera server", failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.opened_at = None  # time.time() the breaker last opened
+        self.last_success = 0.0  # time.monotonic()
+        self.fast_failures = 0  # requests refused while open
+        self._opened = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def on_failure(self, callback):
+        """Call `callback()` after every recorded failure (the prober wakes up)."""
+        self._listeners.append(callback)
+
+    @property
+    def available(self):
+        """False while open: a request would fail fast."""
+        with self._lock:
+            self._maybe_half_open()
+            return self.state != OPEN
+
+    def before(self):
+        """Raise CircuitOpenError unless a request may go out now."""
+        with self._lock:
+            self._maybe_half_open()
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+            self.fast_failures += 1
+        raise CircuitOpenError(self.describe())
+
+    def success(self):
+        with self._lock:
+            self.last_success = time.monotonic()
+            self.failures = 0
+            self._trial = False
+            if self.state != CLOSED:
+                logger.warning("%s is back, circuit closed", self.name)
+                self.state = CLOSED
+                self.last_error = None
+
+    def failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)[:200]
+            self._trial = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    self.opened_at = time.time()
+                    logger.warning("%s unreachable, circuit open: %s", self.name, self.last_error)
+                self.state = OPEN
+                self._opened = time.monotonic()
+        for callback in self._listeners:
+            callback()
+
+    def release(self):
+        """A request let through by before() ended without telling anything."""
+        with self._lock:
+            self._trial = False
+
+    def probe_ok(self):
+        """The server answered a health probe: open -> half-open -> closed."""
+        with self._lock:
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+                self._trial = False
+                return
+        self.success()
+
+    def record(self, status):
+        """Success or failure from a response's HTTP status."""
+        if status in DOWN_STATUSES:
+            self.failure(f"HTTP {status}")
+        else:
+            self.success()
+
+    def describe(self):
+        since = time.strftime("%H:%M:%S", time.localtime(self.opened_at)) if self.opened_at else "?"
+        return f"{self.name} unreachable since {since} ({self.last_error}), circuit open"
+
+    def unavailable_message(self):
+        """What the chat loops answer instead of calling the LLM while open."""
+        return (f"{self.describe()}. Not asking the model; the server is being checked in the background, "
+                "ask again once it is back.")
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "fast_failures": self.fast_failures,
+                    "last_error": self.last_error}
+
+    def _maybe_half_open(self):
+        if self.state == OPEN and time.monotonic() - self._opened >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self._trial = False
+
+
+class HealthProber:
+    """Background HEAD /api/v2/health feeding a CircuitBreaker."""
+
+    def __init__(self, client, breaker=None, path=HEALTH_PATH, interval=15, min_interval=1, max_interval=15,
+                 timeout=2):
+        self.url = client.url(path)
+        self.breaker = breaker or client.breaker
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.probes = 0
+        # Own session: no retries and no pool slots taken from the agent's requests.
+        self.session = requests.Session()
+        self.session.headers.update(client.headers)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._down = 0  # failed probes in a row
+        self.breaker.on_failure(self._wake.set)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="caldera-health-probe", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def probe(self):
+        """One HEAD; True if the server answered."""
+        self.probes += 1
+        try:
+            resp = self.session.head(self.url, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        else:
+            resp.close()
+            ok, error = resp.status_code not in DOWN_STATUSES, f"HTTP {resp.status_code}"
+        if ok:
+            self._down = 0
+            self.breaker.probe_ok()
+        else:
+            self._down += 1
+            self.breaker.failure(error)
+        return ok
+
+    def next_delay(self):
+        if self.breaker.state == CLOSED and not self._down:
+            return self.interval
+        return min(self.min_interval * 2 ** max(self._down - 1, 0), self.max_interval)
+
+    def _run(self):
+        while not self._stop.is_set():
+            breaker = self.breaker
+            recent = time.monotonic() - breaker.last_success < self.interval
+            # traffic just showed it is up
+            if not (breaker.state == CLOSED and recent and not breaker.failures):
+                self.probe()
+                self._wake.clear()  # set by the probe's own failure
+            self._wake.wait(self.next_delay())
+            self._wake.clear()
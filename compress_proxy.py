@@ -0,0 +1,135 @@
+"""Compressing reverse proxy for Caldera servers that don't compress.
+
+Usage: python compress_proxy.py --upstream http://caldera:8888 [--port 8889] [--level 6]
+
+Caldera answers with identity JSON: an operation report, its event logs
+or the ability list are MBs of the same keys over and over, which is slow
+over a VPN. Run this next to the server and point CALDERA_WEB_URL at it:
+every request is passed through (bodies streamed both ways), and a
+JSON / text / YAML response of at least MIN_SIZE bytes is gzip or deflate
+compressed on the fly for a client that accepts it. Responses upstream
+already encoded pass through as they are.
+"""
+import zlib
+import argparse
+import aiohttp
+from aiohttp import web
+
+DEFAULT_PORT = 8889
+COMPRESS_LEVEL = 6
+MIN_SIZE = 1024  # below that the gzip header isn't worth it
+CHUNK_SIZE = 64 * 1024
+COMPRESSIBLE = ("application/json", "text/", "application/yaml", "application/x-yaml", "application/javascript")
+HOP_BY_HOP = frozenset({"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+                        "trailer", "transfer-encoding", "upgrade", "host"})
+WBITS = {"gzip": 31, "deflate": 15}  # gzip container, zlib container (what HTTP calls deflate)
+
+
+def accepted_encoding(accept_encoding):
+    """'gzip' or 'deflate' from an Accept-Encoding header, None for neither."""
+    offered = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                pass
+        offered[name.strip()] = q
+    best = max(WBITS, key=lambda e: offered.get(e, offered.get("*", 0)))
+    return best if offered.get(best, offered.get("*", 0)) > 0 else None
+
+
+def compressible(headers):
+    if headers.get("Content-Encoding", "identity") != "identity":
+        return False
+    length = headers.get("Content-Length")
+    if length is not None and int(length) < MIN_SIZE:
+        return False
+    content_type = headers.get("Content-Type", "").lower()
+    return any(content_type.startswith(t) for t in COMPRESSIBLE)
+
+
+class CompressProxy:
+    """aiohttp app forwarding to `upstream`, compressing the answers."""
+
+    def __init__(self, upstream, level=COMPRESS_LEVEL):
+        self.upstream = upstream.rstrip("/")
+        self.level = level
+        self.stats = {"requests": 0, "compressed": 0, "upstream_bytes": 0, "sent_bytes": 0}
+        self._session = None
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=0)
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        app.on_startup.append(self._start)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    async def _start(self, app):
+        self._session = aiohttp.ClientSession(
+            auto_decompress=False,  # upstream-encoded bodies go through untouched
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10),
+            connector=aiohttp.TCPConnector(limit=64, keepalive_timeout=30),
+        )
+
+    async def _stop(self, app):
+        await self._session.close()
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.stats["requests"] += 1
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP}
+        encoding = accepted_encoding(request.headers.get("Accept-Encoding"))
+        headers.pop("Accept-Encoding", None)  # upstream sends identity, compressing is our job
+        async with self._session.request(request.method, self.upstream + request.rel_url.raw_path_qs,
+                                         headers=headers, data=request.content if request.body_exists else None,
+                                         allow_redirects=False) as upstream:
+            out_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP}
+            compress = encoding is not None and request.method != "HEAD" and compressible(upstream.headers)
+            if compress:
+                out_headers.pop("Content-Length", None)
+                out_headers["Content-Encoding"] = encoding
+                out_headers["Vary"] = "Accept-Encoding"
+                etag = out_headers.get("ETag")
+                if etag and not etag.startswith("W/"):  # not the same bytes any more
+                    out_headers["ETag"] = "W/" + etag
+            response = web.StreamResponse(status=upstream.status, reason=upstream.reason, headers=out_headers)
+            await response.prepare(request)
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, WBITS[encoding]) if compress else None
+            async for chunk in upstream.content.iter_chunked(CHUNK_SIZE):
+                self.stats["upstream_bytes"] += len(chunk)
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    self.stats["sent_bytes"] += len(chunk)
+                    await response.write(chunk)
+            if compressor is not None:
+                tail = compressor.flush()
+                self.stats["sent_bytes"] += len(tail)
+                self.stats["compressed"] += 1
+                await response.write(tail)
+            await response.write_eof()
+            return response
+
+
+async def serve(upstream, host="0.0.0.0", port=DEFAULT_PORT, level=COMPRESS_LEVEL) -> web.AppRunner:
+    """Start the proxy on the running loop; the caller cleans up the returned runner."""
+    runner = web.AppRunner(CompressProxy(upstream, level).app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gzip/deflate reverse proxy for a Caldera server")
+    parser.add_argument("--upstream", required=True, help="Caldera URL, e.g. http://127.0.0.1:8888")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--level", type=int, default=COMPRESS_LEVEL, help="zlib level, 1 (fast) to 9 (small)")
+    args = parser.parse_args()
+    web.run_app(CompressProxy(args.upstream, args.level).app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
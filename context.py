@@ -22,6 +22,8 @@ def prompt_with_context(request: ModelRequest) -> str:
     return system_message
 
 
-agent = create_agent(model, tools=[], middleware=[prompt_with_context])
+# endpoint_retriever imports `embeddings` from here, keep the demo agent out of import time.
+if __name__ == "__main__":
+    agent = create_agent(model, tools=[], middleware=[prompt_with_context])
 
 # https://docs.langchain.com/oss/python/langchain/rag#ollama
\ No newline at end of file
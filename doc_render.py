@@ -0,0 +1,172 @@
+"""Compact, TypeScript-like endpoint docs for the controller prompt.
+
+yaml.dump of a dereferenced Operation or Ability response runs to thousands
+of tokens. This renders the same information as a signature:
+
+    PATCH /api/v2/agents/{paw}  // Update the attributes of a specific Agent
+      body: Partial-Agent1 {sleep_min?: int, group?: str, …+14}
+      → Agent {paw: str, sleep_min: int, links: Link[], …}
+
+and, given a token budget, progressively drops nested types, optional
+fields and finally the description until the rendering fits.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (nested_depth, max_fields, describe), from most to least detailed.
+DETAIL_LEVELS = [
+    (2, None, True),
+    (1, None, True),
+    (1, 16, True),
+    (1, 8, True),
+    (1, 4, True),
+    (1, 0, True),
+    (0, 0, False),
+]
+
+_SCALARS = {"string": "str", "integer": "int", "number": "float", "boolean": "bool"}
+
+_encoding = None
+
+
+def count_tokens(text):
+    """tiktoken count of `text` (cl100k_base), ~4 chars per token without tiktoken."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:  # not installed, or no network to fetch the encoding
+            logger.debug("tiktoken unavailable, estimating tokens: %s", e)
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def token_unit():
+    """What count_tokens() counts here."""
+    count_tokens("")
+    return "cl100k_base tokens" if _encoding else "estimated tokens (~4 chars each, no tiktoken)"
+
+
+class _Renderer:
+    def __init__(self, resolve_ref, nested_depth, max_fields):
+        self.resolve_ref = resolve_ref
+        self.nested_depth = nested_depth
+        self.max_fields = max_fields
+
+    def type(self, schema, depth=0, body=False):
+        if not isinstance(schema, dict) or not schema:
+            return "any"
+        ref = schema.get("$ref")
+        if isinstance(ref, str):
+            name = ref.rsplit("/", 1)[-1]
+            # Only the top-level body/response type is spelled out, nested
+            # ones are referred to by name.
+            if depth == 0 and self.resolve_ref is not None:
+                return f"{name} {self.type(self.resolve_ref(ref), depth, body)}"
+            return name
+        for key, sep in (("allOf", " & "), ("oneOf", " | "), ("anyOf", " | ")):
+            if schema.get(key):
+                return sep.join(self.type(s, depth, body) for s in schema[key])
+        if schema.get("enum") and len(schema["enum"]) <= 4:
+            return "|".join(repr(v) if isinstance(v, str) else str(v) for v in schema["enum"])
+        kind = schema.get("type")
+        if kind == "array":
+            item = self.type(schema.get("items"), depth, body)
+            return f"({item})[]" if " " in item or "|" in item else f"{item}[]"
+        if kind == "object" or "properties" in schema:
+            return self.object(schema, depth, body)
+        return _SCALARS.get(kind, kind or "any")
+
+    def object(self, schema, depth, body):
+        properties = schema.get("properties") or {}
+        if not properties:
+            extra = schema.get("additionalProperties")
+            if isinstance(extra, dict):
+                return f"{{[key]: {self.type(extra, depth + 1, body)}}}"
+            return "object"
+        if depth >= self.nested_depth:
+            return "{…}"
+        required = set(schema.get("required") or ())
+        names = list(properties)
+        if body:
+            # The server ignores read-only fields in request bodies.
+            names = [n for n in names if not properties[n].get("readOnly")]
+        if self.max_fields is not None and len(names) > self.max_fields:
+            # Optional fields are the first to go.
+            keep = [n for n in names if n in required][: self.max_fields]
+            keep += [n for n in names if n not in required][: self.max_fields - len(keep)]
+            shown = [n for n in names if n in keep]
+        else:
+            shown = names
+        fields = []
+        for name in shown:
+            optional = "?" if body and name not in required else ""
+            fields.append(f"{name}{optional}: {self.type(properties[name], depth + 1, body)}")
+        if len(shown) < len(names):
+            fields.append(f"…+{len(names) - len(shown)}")
+        return "{" + ", ".join(fields) + "}"
+
+
+def _first_sentence(text):
+    text = " ".join((text or "").split())
+    end = text.find(". ")
+    return text[: end + 1] if end != -1 else text
+
+
+def _schema_of(section):
+    """The schema of a reduced response/requestBody (OpenAPI 3 or swagger 2)."""
+    if not isinstance(section, dict):
+        return None
+    if "schema" in section:
+        return section["schema"]
+    for media in (section.get("content") or {}).values():
+        if isinstance(media, dict) and "schema" in media:
+            return media["schema"]
+    return None
+
+
+def render_signature(name, docs, resolve_ref=None, budget=None):
+    """Compact docs of endpoint `name` from its reduced `docs`.
+
+    `docs` may still contain $refs (pass `resolve_ref` to look them up) or be
+    fully dereferenced. With `budget` the most detailed rendering that fits in
+    that many tokens is returned, else the least detailed one.
+    """
+    method, path = name.split(" ", 1)
+    parameters = [
+        p for p in docs.get("parameters") or []
+        if isinstance(p, dict) and p.get("in") not in ("path", "body")
+    ]
+    body_schema = _schema_of(docs.get("requestBody"))
+    if body_schema is None:
+        body_schema = next(
+            (p.get("schema") for p in docs.get("parameters") or []
+             if isinstance(p, dict) and p.get("in") == "body"),
+            None,
+        )
+    response_schema = _schema_of(docs.get("responses"))
+
+    rendered = ""
+    for nested_depth, max_fields, describe in DETAIL_LEVELS:
+        r = _Renderer(resolve_ref, nested_depth, max_fields)
+        line = f"{method} {path}"
+        if describe and docs.get("description"):
+            line += f"  // {_first_sentence(docs['description'])}"
+        lines = [line]
+        for location in dict.fromkeys(p.get("in", "query") for p in parameters):
+            params = ", ".join(
+                f"{p.get('name')}{'' if p.get('required') else '?'}: {r.type(p.get('schema') or p, 1)}"
+                for p in parameters if p.get("in", "query") == location
+            )
+            lines.append(f"  {location}: {{{params}}}")
+        if body_schema is not None:
+            lines.append(f"  body: {r.type(body_schema, 0, body=True)}")
+        lines.append(f"  → {r.type(response_schema) if response_schema is not None else 'void'}")
+        rendered = "\n".join(lines)
+        if budget is None or count_tokens(rendered) <= budget:
+            break
+    return rendered
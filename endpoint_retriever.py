@@ -0,0 +1,127 @@
+"""Pick the endpoints the api_planner gets to see for a query.
+
+The planner prompt normally lists every endpoint of the spec. An
+EndpointRetriever embeds each endpoint once (method, path, summary, tags),
+persists the vectors next to the spec cache, and per query returns the top-k
+endpoints plus the routes directly above and below them, so the planner can
+still discover ids (GET /operations before GET /operations/{id}/links). When
+the best match is weak, or embedding fails, it returns None and the caller
+falls back to the full list. After a failure (embeddings server down) it
+returns None at once for RETRY_MIN_S, doubling up to RETRY_MAX_S while it
+keeps failing, instead of every caller waiting for the same timeout.
+"""
+import os
+import time
+import hashlib
+import logging
+import numpy as np
+from load_spec import SPEC_CACHE_DIR
+from route_index import related_routes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_K = int(os.getenv("CALDERA_RETRIEVER_K", 6))
+# Cosine similarity the best endpoint must reach for retrieval to be trusted.
+DEFAULT_MIN_SCORE = float(os.getenv("CALDERA_RETRIEVER_MIN_SCORE", 0.3))
+# Seconds without trying the embeddings again after a failure, doubled per failure in a row.
+RETRY_MIN_S = 30
+RETRY_MAX_S = 600
+
+
+def endpoint_text(api_spec, name, description):
+    """What gets embedded / indexed for one endpoint."""
+    meta = getattr(api_spec, "endpoint_meta", {}).get(name, {})
+    parts = [name, meta.get("summary", ""), description or ""]
+    if meta.get("tags"):
+        parts.append("tags: " + ", ".join(meta["tags"]))
+    return "\n".join(p for p in parts if p)
+
+
+class EndpointRetriever:
+    """Top-k endpoint retrieval over a pluggable embeddings backend.
+
+    `embeddings` is anything with LangChain's Embeddings interface
+    (embed_documents / embed_query); by default the OllamaEmbeddings set up
+    in context.py.
+    """
+
+    def __init__(self, embeddings=None, k=DEFAULT_K, min_score=DEFAULT_MIN_SCORE, cache_dir=SPEC_CACHE_DIR):
+        self._embeddings = embeddings
+        self.k = k
+        self.min_score = min_score
+        self.cache_dir = cache_dir
+        self._spec = None
+        self._names = []
+        self._vectors = None
+        self._retry_in = 0.0  # 0 while the backend works
+        self._down_until = 0.0
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from context import embeddings
+            self._embeddings = embeddings
+        return self._embeddings
+
+    @property
+    def backend_id(self):
+        backend = self.embeddings
+        model = getattr(backend, "model", None) or getattr(backend, "model_name", None) or ""
+        return f"{type(backend).__name__}-{model}".replace("/", "_").replace(":", "_")
+
+    def retrieve(self, api_spec, query):
+        """Endpoint tuples relevant to `query`, or None to use the full list."""
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            self._ensure_index(api_spec)
+            query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        except Exception as e:
+            self._retry_in = min(self._retry_in * 2, RETRY_MAX_S) if self._retry_in else RETRY_MIN_S
+            self._down_until = time.monotonic() + self._retry_in
+            logger.warning("Endpoint retrieval unavailable, using every endpoint for %.0f s: %s", self._retry_in, e)
+            return None
+        self._retry_in = 0.0
+        norm = np.linalg.norm(query_vector)
+        if not norm or self._vectors is None or not len(self._vectors):
+            return None
+        scores = self._vectors @ (query_vector / norm)
+        top = np.argsort(-scores)[: self.k]
+        if scores[top[0]] < self.min_score:
+            return None
+        selected = related_routes(self._names, [self._names[i] for i in top])
+        by_name = {endpoint[0]: endpoint for endpoint in api_spec.endpoints}
+        return [by_name[name] for name in selected]
+
+    def _ensure_index(self, api_spec):
+        if self._spec is api_spec:
+            return
+        names = [name for name, _, _ in api_spec.endpoints]
+        texts = [endpoint_text(api_spec, name, description) for name, description, _ in api_spec.endpoints]
+        digest = hashlib.sha256("\0".join(texts).encode()).hexdigest()[:16]
+        path = os.path.join(self.cache_dir, f"endpoints.{self.backend_id}.{digest}.npy")
+        try:
+            vectors = np.load(path)
+        except (OSError, ValueError):
+            vectors = None
+        if vectors is None or len(vectors) != len(names):
+            vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+            self._save(path, vectors)
+        self._spec, self._names, self._vectors = api_spec, names, vectors
+
+    def _save(self, path, vectors):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, vectors)
+            os.replace(tmp_path, path)
+            # Drop vectors of older specs for this backend.
+            prefix = f"endpoints.{self.backend_id}."
+            for name in os.listdir(self.cache_dir):
+                stale = os.path.join(self.cache_dir, name)
+                if name.startswith(prefix) and name.endswith(".npy") and stale != path:
+                    os.remove(stale)
+        except OSError as e:
+            logger.warning("Could not persist endpoint vectors: %s", e)
@@ -0,0 +1,241 @@
+"""Answer frequent, unambiguous requests without going through the LLM.
+
+"list agents" or "health" do not need the orchestrator, planner, controller
+and a parsing chain (four rate limited LLM calls, tens of seconds): the
+endpoint is obvious from the wording. IntentRouter matches the whole query
+against a small set of patterns, fills the path template from the captured
+slots, checks the resulting call against the spec's RouteIndex and runs the
+GET directly, rendering the JSON locally. Anything that does not match
+exactly falls through to the agent, so the router never has to guess.
+"""
+import os
+import re
+import time
+import logging
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+import requests
+from route_index import RouteIndex
+from spec_provider import DEFAULT_CALDERA_URL
+
+logger = logging.getLogger(__name__)
+
+FAST_PATH = "fast-path"
+
+_LIST = r"(?:list|show|get|display|what are|which are)(?: me)?(?: all| the| all the| every)?"
+_POLITE = re.compile(r"^(?:please|pls|can you|could you|hey)\s+|\s+(?:please|pls)$", re.IGNORECASE)
+
+
+class Intent(NamedTuple):
+    name: str
+    pattern: "re.Pattern"
+    endpoint: str  # spec endpoint name, path params filled from the pattern's named groups
+    columns: Tuple[str, ...] = ()  # dotted fields shown per row, empty renders the object as key: value lines
+
+
+def _intent(name, pattern, endpoint, columns=()):
+    # Case-insensitive so slots keep the case the user typed them in.
+    return Intent(name, re.compile(rf"^(?:{pattern})$", re.IGNORECASE), endpoint, tuple(columns))
+
+
+INTENTS = (
+    _intent("health", r"health|(?:check |get |show )?(?:api |server |caldera )?(?:health|status)(?: check)?"
+            r"|is (?:caldera|the server|the api) (?:up|alive|running)",
+            "GET /api/v2/health", ()),
+    _intent("list_agents", rf"{_LIST} (?:agents|paws|implants)|agents",
+            "GET /api/v2/agents", ("paw", "host", "platform", "group", "last_seen", "trusted")),
+    # Needs the verb: a bare "agent <word>" is "agent status", "agent count", ...
+    _intent("show_agent", r"(?:show|get|describe) agent (?P<paw>[\w.-]+)",
+            "GET /api/v2/agents/{paw}", ()),
+    _intent("list_operations", rf"{_LIST} (?:operations|ops)|operations",
+            "GET /api/v2/operations", ("id", "name", "state", "adversary.name", "start")),
+    _intent("operation_links", r"(?:show|list|get) (?:the )?(?:operation|op) (?P<id>[\w .-]+?) links"
+            r"|(?:show|list|get) (?:the )?links (?:of|for|from) (?:operation|op) (?P<id2>[\w .-]+)",
+            "GET /api/v2/operations/{id}/links", ("id", "paw", "ability.name", "status", "finish")),
+    _intent("show_operation", r"(?:show|get|describe|status of) (?:the )?(?:operation|op) (?P<id>[\w .-]+)",
+            "GET /api/v2/operations/{id}", ()),
+    _intent("list_adversaries", rf"{_LIST} (?:adversaries|adversary profiles|profiles)|adversaries",
+            "GET /api/v2/adversaries", ("adversary_id", "name", "description")),
+    _intent("list_abilities", rf"{_LIST} abilities|abilities",
+            "GET /api/v2/abilities", ("ability_id", "name", "tactic", "technique_id")),
+    _intent("list_planners", rf"{_LIST} planners|planners",
+            "GET /api/v2/planners", ("id", "name", "description")),
+    _intent("list_objectives", rf"{_LIST} objectives|objectives",
+            "GET /api/v2/objectives", ("id", "name", "description")),
+    _intent("list_sources", rf"{_LIST} (?:fact )?sources",
+            "GET /api/v2/sources", ("id", "name")),
+    _intent("list_plugins", rf"{_LIST} plugins|plugins",
+            "GET /api/v2/plugins", ("name", "enabled", "description")),
+)
+
+# Slots that may be given by name instead of id, resolved against the collection.
+NAMED_SLOTS = {"id": ("GET /api/v2/operations", "id", "name")}
+
+MAX_ROWS = 50
+
+
+class FastPathResult(NamedTuple):
+    intent: str
+    endpoint: str  # the concrete call, "GET /api/v2/operations/1234/links"
+    status: int
+    elapsed_ms: float
+    output: str
+
+    @property
+    def served_by(self):
+        return FAST_PATH
+
+
+def _clean(query):
+    """Punctuation and politeness stripped, case kept (paws and ids are case sensitive)."""
+    query = " ".join(query.replace("?", " ").replace("!", " ").split()).rstrip(".")
+    previous = None
+    while previous != query:
+        previous, query = query, _POLITE.sub("", query).strip()
+    return query
+
+
+def normalize(query):
+    return _clean(query).lower()
+
+
+def _field(item, dotted):
+    for key in dotted.split("."):
+        if not isinstance(item, dict):
+            return None
+        item = item.get(key)
+    return item
+
+
+def _cell(value, width=40):
+    text = "" if value is None else str(value)
+    return text if len(text) <= width else text[: width - 1] + "…"
+
+
+def render(data, columns=()):
+    """Plain-text rendering of a GET response, no LLM involved."""
+    if isinstance(data, list):
+        if not data:
+            return "(none)"
+        if not columns:
+            columns = tuple(k for k in data[0] if not isinstance(data[0][k], (dict, list)))[:6] if isinstance(data[0], dict) else ()
+        if not columns:
+            return "\n".join(_cell(item, 120) for item in data[:MAX_ROWS])
+        rows = [[_cell(_field(item, c)) for c in columns] for item in data[:MAX_ROWS]]
+        widths = [max(len(c), *(len(r[i]) for r in rows)) for i, c in enumerate(columns)]
+        lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths)).rstrip()]
+        lines += ["  ".join(v.ljust(w) for v, w in zip(r, widths)).rstrip() for r in rows]
+        lines.append(f"{len(data)} total" + (f", first {MAX_ROWS} shown" if len(data) > MAX_ROWS else ""))
+        return "\n".join(lines)
+    if isinstance(data, dict):
+        lines = []
+        for key, value in data.items():
+            if isinstance(value, list):
+                value = f"[{len(value)} items]"
+            elif isinstance(value, dict):
+                value = ", ".join(f"{k}={_cell(v, 30)}" for k, v in value.items() if not isinstance(v, (dict, list)))
+            lines.append(f"{key}: {_cell(value, 100)}")
+        return "\n".join(lines)
+    return str(data)
+
+
+class IntentRouter:
+    """Pattern + slot matching of whole queries onto single spec GETs.
+
+    `api_spec` is a ReducedOpenAPISpec or a SpecProvider; intents whose
+    endpoint the current spec does not have are skipped.
+    """
+
+    def __init__(self, api_spec, base_url=None, headers=None, timeout=15, intents=INTENTS,
+                 get: Optional[Callable] = None):
+        self.api_spec = api_spec
+        self.base_url = (base_url or os.getenv("CALDERA_WEB_URL") or DEFAULT_CALDERA_URL).rstrip("/")
+        self.headers = headers if headers is not None else {"KEY": f"{os.getenv('CALDERA_API_TOKEN')}"}
+        self.timeout = timeout
+        self.intents = intents
+        self._get = get or requests.get
+        self._spec = None
+        self._route_index = None
+
+    def route_index(self):
+        spec = self.api_spec.current() if hasattr(self.api_spec, "current") else self.api_spec
+        if spec is not self._spec:
+            self._route_index = RouteIndex.from_spec(spec)
+            self._spec = spec
+        return self._route_index
+
+    def match(self, query) -> Optional[Tuple[Intent, Dict[str, str]]]:
+        """(intent, slots) for a query the router can answer, else None."""
+        text = _clean(query)
+        if not text:
+            return None
+        names = set(self.route_index().names)
+        for intent in self.intents:
+            m = intent.pattern.match(text)
+            if m is None or intent.endpoint not in names:
+                continue
+            # Alternatives capture the same slot as name, name2, ...
+            slots = {}
+            for group, value in m.groupdict().items():
+                if value is not None:
+                    slots[group.rstrip("0123456789")] = value
+            return intent, slots
+        return None
+
+    def handle(self, query) -> Optional[FastPathResult]:
+        """Answer `query` directly, or None when the agent should handle it."""
+        matched = self.match(query)
+        if matched is None:
+            return None
+        intent, slots = matched
+        start = time.perf_counter()
+        try:
+            slots = self._resolve_names(slots)
+            path = intent.endpoint.split(" ", 1)[1].format(**slots)
+            route = self.route_index().match("GET", path)
+            if route is None or route.name != intent.endpoint:
+                return None
+            resp = self._get(f"{self.base_url}{path}", headers=self.headers, timeout=self.timeout)
+        except (requests.exceptions.RequestException, LookupError) as e:
+            # Let the agent deal with it (and report the error the usual way).
+            logger.warning("Fast path for %r failed, falling back to the agent: %s", query, e)
+            return None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if resp.status_code != 200:
+            # Most likely the pattern read a word as a slot ("show agent status"),
+            # the agent can work out what was meant.
+            logger.info("Fast path for %r got %s, falling back to the agent", query, resp.status_code)
+            return None
+        try:
+            output = render(resp.json(), intent.columns)
+        except ValueError:
+            output = resp.text[:1200]
+        return FastPathResult(intent.name, f"GET {path}", resp.status_code, elapsed_ms, output)
+
+    def _resolve_names(self, slots):
+        """Operation names typed by the user ("show operation Foo links") -> ids.
+
+        Raises LookupError when the value is neither an id nor a name, the
+        agent is better at working out what was meant.
+        """
+        resolved = dict(slots)
+        for slot, value in slots.items():
+            if slot not in NAMED_SLOTS:
+                continue
+            endpoint, id_field, name_field = NAMED_SLOTS[slot]
+            resp = self._get(f"{self.base_url}{endpoint.split(' ', 1)[1]}", headers=self.headers, timeout=self.timeout)
+            resp.raise_for_status()
+            items = resp.json()
+            by_id = {str(item.get(id_field)).lower(): item[id_field] for item in items}
+            by_name = {str(item.get(name_field, "")).lower(): item[id_field] for item in items}
+            if value.lower() in by_id:
+                resolved[slot] = by_id[value.lower()]
+            elif value.lower() in by_name:
+                resolved[slot] = by_name[value.lower()]
+            else:
+                raise LookupError(f"no {endpoint.rsplit('/', 1)[1]} with id or name {value!r}")
+        return resolved
+
+
+def describe(result: FastPathResult):
+    """One-line footer saying which path served the request."""
+    return f"⚡ {result.served_by}: {result.endpoint} → {result.status} in {result.elapsed_ms:.0f} ms (no LLM call)"
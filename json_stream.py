@@ -0,0 +1,347 @@
+"""Incremental JSON projection of large Caldera responses.
+
+api_call used to return response.text[:1200] and the planner tools cut at
+5000 characters, so on /api/v2/abilities or /operations/{id}/report the
+model got a broken JSON prefix and usually asked again. project() reads
+the body chunk by chunk and splits the top-level array (or object) into
+its elements with a small structural scanner. The first `limit` elements
+are decoded and projected to `fields`; the remaining ones are only
+counted (one at a time through json's C scanner when they fit in the
+chunk, that is faster than scanning them here). Memory stays at one
+element plus one chunk, whatever the response size. The result is valid compact JSON plus the
+number of items left out.
+"""
+import re
+import json
+import codecs
+from typing import Any, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+DEFAULT_LIMIT = 20
+DEFAULT_MAX_CHARS = 4000
+CHUNK_SIZE = 64 * 1024
+
+# A whole string (when it ends in this chunk) or one structural character.
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|["\[\]{},:]')
+# Inside an element only nesting matters, commas and colons can be passed over.
+_NESTED_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|["\[\]{}]')
+_IN_STRING = re.compile(r'["\\]')
+_SPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class Projection(NamedTuple):
+    data: Any
+    total: Optional[int]  # elements of the top-level array / object, None if not scanned to the end
+    omitted: int  # elements (and nested list items) left out
+    notes: List[str]  # what was left out, for the model
+    complete: bool  # whole body was read
+
+    def to_text(self, indent=None):
+        text = json.dumps(self.data, separators=(",", ":") if indent is None else None, indent=indent,
+                          default=str, ensure_ascii=False)
+        if self.notes:
+            text += "\n(" + "; ".join(self.notes) + ")"
+        return text
+
+
+def parse_fields(fields: Union[str, Sequence[str], None]):
+    """'paw,host, platform' -> ('paw', 'host', 'platform'); dotted names select nested fields."""
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    fields = tuple(f.strip() for f in fields if f and f.strip())
+    return fields or None
+
+
+def project_item(item, fields):
+    """`item` with only `fields` kept ('adversary.name' keeps {"adversary": {"name": ...}})."""
+    if not fields or not isinstance(item, dict):
+        return item
+    out = {}
+    for field in fields:
+        source, target, parts = item, out, field.split(".")
+        for i, part in enumerate(parts):
+            if not isinstance(source, dict) or part not in source:
+                break
+            source = source[part]
+            if i == len(parts) - 1:
+                target[part] = source
+            else:
+                target = target.setdefault(part, {})
+    return out
+
+
+class _Scanner:
+    """Splits the top-level container into element texts as chunks arrive.
+
+    Only elements want_element(index, key_text) accepts are buffered (for
+    an object, the decision is taken on the member's key); the rest are
+    skipped while still tracking strings and nesting.
+    """
+
+    def __init__(self, want_element, on_element):
+        self.want_element = want_element
+        self.on_element = on_element
+        self.top = None  # '[' or '{' once seen, '' for a scalar document
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.count = 0  # elements seen
+        self.recording = False
+        self.empty = True  # nothing but whitespace in the current element so far
+        self.buffer: List[str] = []
+        self.scalar: List[str] = []
+        self.done = False
+
+    def _start_element(self):
+        self.buffer = []
+        self.empty = True
+        # Object members are buffered up to the ':' so the key can decide.
+        self.recording = self.top == "{" or self.want_element(self.count, None)
+
+    def _end_element(self):
+        if self.empty:  # "[]", "{}"
+            return
+        self.on_element(self.count, "".join(self.buffer) if self.recording else None)
+        self.count += 1
+
+    def feed(self, chunk: str):
+        if self.done:
+            return
+        pos, n = 0, len(chunk)
+        if self.top is None:
+            stripped = chunk.lstrip()
+            if not stripped:
+                return
+            if stripped[0] not in "[{":
+                self.top = ""
+            else:
+                self.top = stripped[0]
+                self.depth = 1
+                pos = chunk.index(self.top) + 1
+                self._start_element()
+        if self.top == "":
+            self.scalar.append(chunk)
+            return
+        seg = pos  # start of the part of chunk not yet copied into the element buffer
+        while pos < n:
+            if self.escape:
+                self.escape = False
+                pos += 1
+                continue
+            if self.empty and not self.recording and self.top == "[" and not self.in_string:
+                # Skipped array item: decode and drop it if it ends in this chunk
+                start = _SPACE.match(chunk, pos).end()
+                if start < n and chunk[start] != "]":
+                    try:
+                        pos = _decoder.raw_decode(chunk, start)[1]
+                        self.empty = False
+                        continue
+                    except ValueError:  # runs into the next chunk
+                        pass
+            if self.in_string:
+                m = _IN_STRING.search(chunk, pos)
+                if m is None:
+                    pos = n
+                    break
+                pos = m.end()
+                if m.group() == "\\":
+                    self.escape = True
+                else:
+                    self.in_string = False
+                continue
+            m = (_TOKEN if self.depth == 1 else _NESTED_TOKEN).search(chunk, pos)
+            at = m.start() if m else n
+            if self.empty and chunk[pos:at].strip():
+                self.empty = False  # numbers, true/false/null
+            if m is None:
+                pos = n
+                break
+            c = m.group()
+            pos = m.end()
+            if c[0] == '"':
+                self.in_string = len(c) == 1  # string continues in the next chunk
+                self.empty = False
+            elif c in "[{":
+                self.depth += 1
+                self.empty = False
+            elif c in "]}":
+                self.depth -= 1
+                if self.depth == 0:
+                    if self.recording:
+                        self.buffer.append(chunk[seg:at])
+                    self._end_element()
+                    self.done = True
+                    return
+            elif self.depth == 1 and c == ",":
+                if self.recording:
+                    self.buffer.append(chunk[seg:at])
+                self._end_element()
+                if self.done:  # on_element has all it wanted
+                    return
+                seg = pos
+                self._start_element()
+            elif self.depth == 1 and c == ":" and self.recording and self.top == "{":
+                key_text = "".join(self.buffer) + chunk[seg:at]
+                self.buffer = [key_text]
+                seg = at
+                if not self.want_element(self.count, key_text):
+                    self.recording = False
+        if self.recording:
+            self.buffer.append(chunk[seg:pos])
+
+
+def iter_elements(chunks: Iterable[Union[bytes, str]]):
+    """Text of each element of the top-level JSON array arriving in `chunks`, as it completes."""
+    pending: List[str] = []
+    scanner = _Scanner(lambda index, key_text: True, lambda index, text: pending.append(text))
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    for chunk in chunks:
+        scanner.feed(decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        if scanner.top not in (None, "["):
+            raise ValueError("response is not a JSON array")
+        yield from pending
+        pending.clear()
+        if scanner.done:
+            return
+    scanner.feed(decoder.decode(b"", final=True))
+    yield from pending
+    if not scanner.done:
+        raise ValueError("response ended inside the JSON array")
+
+
+def project(chunks: Iterable[Union[bytes, str]], fields=None, limit=DEFAULT_LIMIT, max_chars=None,
+            max_scan_bytes=None) -> Projection:
+    """Projection of the JSON document arriving in `chunks`.
+
+    Top-level array: the first `limit` items (fewer if their compact JSON
+    would exceed `max_chars`), each reduced to `fields`; the others are
+    counted. Top-level object: only the `fields` members (all if none
+    given, while they fit in `max_chars`), with lists inside cut to
+    `limit` items; reading stops once every requested member was seen.
+    Reading also stops after max_scan_bytes, the total is then unknown.
+    """
+    fields = parse_fields(fields)
+    top_fields = {f.split(".", 1)[0] for f in fields} if fields else None
+    state = {"items": [], "members": {}, "chars": 0, "full": False, "omitted": 0, "skipped_keys": [],
+             "truncated": {}, "dropped": [], "stopped": False}
+
+    def want(index, key_text):
+        if key_text is None:  # array element
+            return index < limit and not state["full"]
+        if top_fields is None:
+            return True
+        try:
+            key = json.loads(key_text)
+        except ValueError:
+            return True
+        keep = key in top_fields
+        if not keep:
+            state["skipped_keys"].append(key)
+        return keep
+
+    def on_element(index, text):
+        if text is None:
+            state["omitted"] += 1
+            return
+        if scanner.top == "[":
+            item = project_item(json.loads(text), fields)
+            size = len(json.dumps(item, separators=(",", ":"), default=str))
+            if max_chars and state["items"] and state["chars"] + size > max_chars:
+                state["full"] = True
+                state["omitted"] += 1
+                return
+            state["chars"] += size
+            state["items"].append(item)
+        else:
+            member = json.loads("{" + text + "}")
+            for key, value in member.items():
+                if isinstance(value, list) and len(value) > limit:
+                    state["truncated"][key] = len(value) - limit
+                    value = value[:limit]
+                if isinstance(value, list):
+                    value = [project_item(v, _nested(fields, key)) for v in value]
+                elif isinstance(value, dict):
+                    value = project_item(value, _nested(fields, key))
+                size = len(json.dumps(value, separators=(",", ":"), default=str))
+                if max_chars and state["members"] and state["chars"] + size > max_chars:
+                    state["dropped"].append(key)
+                    continue
+                state["chars"] += size
+                state["members"][key] = value
+            if top_fields and top_fields <= set(state["members"]) | set(state["dropped"]):
+                state["stopped"] = scanner.done = True
+
+    scanner = _Scanner(want, on_element)
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    read = 0
+    complete = True
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            read += len(chunk)
+            chunk = decoder.decode(chunk)
+        else:
+            read += len(chunk)
+        scanner.feed(chunk)
+        if scanner.done:
+            break
+        if max_scan_bytes and read >= max_scan_bytes:
+            complete = False
+            break
+    scanner.feed(decoder.decode(b"", final=True))
+
+    if not scanner.top:  # scalar or empty body
+        text = "".join(scanner.scalar).strip()
+        data = json.loads(text) if text else None
+        return Projection(data, None, 0, [], complete)
+    notes = []
+    if scanner.top == "[":
+        total = scanner.count if complete and scanner.done else None
+        data = state["items"]
+        if total is None:
+            notes.append(f"showing {len(data)} items, response cut after {read} bytes, more not counted")
+        elif state["omitted"]:
+            notes.append(f"{len(data)} of {total} items shown, {state['omitted']} omitted")
+        return Projection(data, total, state["omitted"], notes, complete and scanner.done)
+    data = state["members"]
+    if state["skipped_keys"]:
+        notes.append("fields not requested: " + ", ".join(map(str, state["skipped_keys"][:20])))
+    if state["dropped"]:
+        notes.append(f"left out to stay under {max_chars} characters: " + ", ".join(map(str, state["dropped"])))
+    for key, n in state["truncated"].items():
+        notes.append(f"{key}: {n} more items omitted")
+    omitted = len(state["skipped_keys"]) + len(state["dropped"]) + sum(state["truncated"].values())
+    complete = complete and scanner.done and not state["stopped"]
+    return Projection(data, scanner.count if complete else None, omitted, notes, complete)
+
+
+def _nested(fields, key):
+    """Sub-fields of `key` in a field list: ('steps.paw', 'name') -> ('paw',) for 'steps'."""
+    if not fields:
+        return None
+    nested = tuple(f.split(".", 1)[1] for f in fields if f.startswith(key + "."))
+    return nested or None
+
+
+def project_response(response, fields=None, limit=DEFAULT_LIMIT, max_chars=None, max_scan_bytes=None,
+                     chunk_size=CHUNK_SIZE) -> Projection:
+    """project() over a requests.Response, best opened with stream=True; closes it."""
+    try:
+        return project(response.iter_content(chunk_size), fields, limit, max_chars, max_scan_bytes)
+    finally:
+        response.close()
+
+
+def response_text(response, fields=None, limit=DEFAULT_LIMIT, max_chars=DEFAULT_MAX_CHARS, max_scan_bytes=None):
+    """What the model gets to see of a response: JSON bodies projected, anything else cut at max_chars."""
+    if "json" not in response.headers.get("Content-Type", ""):
+        text = response.text
+        response.close()
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars] + f"\n({len(text) - max_chars} more characters omitted)"
+    try:
+        return project_response(response, fields, limit, max_chars, max_scan_bytes).to_text()
+    except ValueError as e:
+        return f"(response is not valid JSON: {e})"
@@ -1,26 +1,144 @@
 import os
 import json
-import requests
-from dotenv import load_dotenv
-from langchain_community.agent_toolkits.openapi.spec import reduce_openapi_spec
+import pickle
+import hashlib
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Any, Dict
+import yaml
+import doc_render
+from langchain_community.agent_toolkits.openapi.spec import ReducedOpenAPISpec, reduce_openapi_spec
 
+SPEC_FILE = "response_1765136132246.json"
+SPEC_CACHE_DIR = ".spec_cache"
 
-def load_caldera_spec():
-    # Reading URL
+# Bump whenever _prepare_spec / the reduction / the rendered docs change shape,
+# so stale caches are rebuilt instead of loaded.
+REDUCER_VERSION = "4"
 
-    # resp = requests.get(
-    #     f"{os.getenv('CALDERA_WEB_URL')}/api/docs/swagger.json",
-    #     headers={"KEY": os.getenv("CALDERA_API_TOKEN")}
-    # )
-    # resp.raise_for_status()
 
-    # Reading File
+@dataclass(frozen=True)
+class CalderaSpec(ReducedOpenAPISpec):
+    """ReducedOpenAPISpec whose endpoint docs keep their $refs until first use.
+
+    reduce_openapi_spec() inlines every component schema into every operation,
+    which mostly duplicates the same Operation/Agent/Ability trees ~80 times
+    over. Here each endpoint tuple carries a LazyEndpointDocs instead; the
+    first access dereferences that one endpoint and memoizes it. Components
+    are resolved once and shared between all endpoints that use them.
+    """
+
+    ref_root: Dict[str, Any] = field(default_factory=dict)
+    # summary / tags / all parameter names per endpoint, which the reduction drops
+    endpoint_meta: Dict[str, dict] = field(default_factory=dict)
+    key: str = ""  # spec_cache_key of the document this was reduced from
+    _docs: Dict[str, dict] = field(default_factory=dict, repr=False, compare=False)
+    _rendered: Dict[str, str] = field(default_factory=dict, repr=False, compare=False)
+    _signatures: Dict[tuple, str] = field(default_factory=dict, repr=False, compare=False)
+    _components: Dict[str, Any] = field(default_factory=dict, repr=False, compare=False)
+
+    def raw_docs(self, name):
+        """Reduced docs of endpoint `name` with their $refs still in place."""
+        docs = next(docs for n, _, docs in self.endpoints if n == name)
+        return docs.raw if isinstance(docs, LazyEndpointDocs) else docs
+
+    def docs(self, name):
+        """Dereferenced docs of endpoint `name` ("GET /api/v2/agents")."""
+        if name not in self._docs:
+            self._docs[name] = self._deref(self.raw_docs(name), set())
+        return self._docs[name]
+
+    def render_docs(self, name):
+        """yaml docs of endpoint `name`, as the controller prompt shows them."""
+        if name not in self._rendered:
+            self._rendered[name] = yaml.dump(self.docs(name), Dumper=_NoAliasDumper)
+        return self._rendered[name]
+
+    def render_signature(self, name, budget=None):
+        """Compact doc_render signature of endpoint `name`, memoized per budget."""
+        key = (name, budget)
+        if key not in self._signatures:
+            self._signatures[key] = doc_render.render_signature(
+                name, self.raw_docs(name), resolve_ref=self.lookup_ref, budget=budget
+            )
+        return self._signatures[key]
+
+    def lookup_ref(self, ref):
+        """The raw node a local $ref ("#/components/schemas/Agent") points to."""
+        node = self.ref_root
+        for part in ref[2:].split("/"):
+            node = node[part.replace("~1", "/").replace("~0", "~")]
+        return node
+
+    def _component(self, ref, resolving):
+        if ref in self._components:
+            return self._components[ref]
+        if ref in resolving:
+            # Recursive schema, keep the $ref rather than looping forever.
+            return {"$ref": ref}
+        resolving.add(ref)
+        resolved = self._deref(self.lookup_ref(ref), resolving)
+        resolving.discard(ref)
+        self._components[ref] = resolved
+        return resolved
+
+    def _deref(self, node, resolving):
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str) and ref.startswith("#/"):
+                resolved = self._component(ref, resolving)
+                if len(node) == 1:
+                    return resolved
+                # Mixed ref, siblings override the referenced schema.
+                extra = {k: self._deref(v, resolving) for k, v in node.items() if k != "$ref"}
+                return {**resolved, **extra} if isinstance(resolved, dict) else extra
+            return {k: self._deref(v, resolving) for k, v in node.items()}
+        if isinstance(node, list):
+            return [self._deref(v, resolving) for v in node]
+        return node
+
+
+class LazyEndpointDocs(Mapping):
+    """Read-only view of one endpoint's docs, dereferenced on first access.
+
+    Stands in for the docs dict of ReducedOpenAPISpec.endpoints so the
+    langchain planner (which only iterates and yaml.dump()s them) keeps
+    working unchanged.
+    """
+
+    def __init__(self, spec, name, raw):
+        self.spec = spec
+        self.name = name
+        self.raw = raw
+
+    def __getitem__(self, key):
+        return self.spec.docs(self.name)[key]
+
+    def __iter__(self):
+        return iter(self.spec.docs(self.name))
+
+    def __len__(self):
+        return len(self.spec.docs(self.name))
+
+    def __repr__(self):
+        return f"LazyEndpointDocs({self.name!r})"
+
+
+class _NoAliasDumper(yaml.Dumper):
+    # Shared component subtrees would otherwise come out as &id001/*id001 anchors.
+    def ignore_aliases(self, data):
+        return True
+
 
-    with open("response_1765136132246.json") as f:
-        resp = json.load(f)
+def _represent_lazy_docs(dumper, data):
+    dumper.ignore_aliases = lambda _data: True
+    return dumper.represent_dict(data.spec.docs(data.name))
 
-    spec = resp  # already a dict
 
+yaml.add_representer(LazyEndpointDocs, _represent_lazy_docs)
+
+
+def _prepare_spec(spec):
     # If no 'servers' (likely OpenAPI v2), synthesize one
     if "servers" not in spec:
         host = spec.get("host")
@@ -38,8 +156,101 @@ def load_caldera_spec():
         for method, docs in ops.items():
             if isinstance(docs, dict):
                 docs.setdefault("responses", {})
+    return spec
+
+
+def _reduce_spec(spec_bytes):
+    spec = _prepare_spec(json.loads(spec_bytes))
+    # Dereferencing happens lazily per endpoint, see CalderaSpec.
+    reduced = reduce_openapi_spec(spec, dereference=False)
+    endpoint_meta = {
+        f"{method.upper()} {route}": {
+            "summary": docs.get("summary", ""),
+            "tags": docs.get("tags", []),
+            "parameters": [p.get("name") for p in docs.get("parameters", []) if isinstance(p, dict)],
+        }
+        for route, ops in spec["paths"].items()
+        for method, docs in ops.items()
+        if isinstance(docs, dict)
+    }
+    caldera_api_spec = CalderaSpec(
+        servers=reduced.servers,
+        description=reduced.description,
+        endpoints=[],
+        ref_root={k: spec[k] for k in ("components", "definitions") if k in spec},
+        endpoint_meta=endpoint_meta,
+        key=spec_cache_key(spec_bytes),
+    )
+    caldera_api_spec.endpoints.extend(
+        (name, description, LazyEndpointDocs(caldera_api_spec, name, docs))
+        for name, description, docs in reduced.endpoints
+    )
+    return caldera_api_spec
+
+
+def spec_cache_key(spec_bytes):
+    # The synthesized server url depends on CALDERA_WEB_URL for specs without 'servers'.
+    h = hashlib.sha256(spec_bytes)
+    h.update(f"\0{REDUCER_VERSION}\0{os.getenv('CALDERA_WEB_URL', '')}".encode())
+    return h.hexdigest()
+
+
+def _read_cache(path):
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+
+def _write_cache(path, caldera_api_spec):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(caldera_api_spec, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # Atomic so a concurrent start never reads a half written cache.
+    os.replace(tmp_path, path)
+    # Drop caches of older spec versions.
+    for name in os.listdir(os.path.dirname(path)):
+        stale = os.path.join(os.path.dirname(path), name)
+        if name.endswith(".pickle") and stale != path:
+            os.remove(stale)
+
+
+def load_caldera_spec(spec_file=SPEC_FILE, cache_dir=SPEC_CACHE_DIR, use_cache=True):
+    # Reading URL
+
+    # resp = requests.get(
+    #     f"{os.getenv('CALDERA_WEB_URL')}/api/docs/swagger.json",
+    #     headers={"KEY": os.getenv("CALDERA_API_TOKEN")}
+    # )
+    # resp.raise_for_status()
+
+    # Reading File
+
+    with open(spec_file, "rb") as f:
+        spec_bytes = f.read()
+
+    return load_spec_bytes(spec_bytes, cache_dir=cache_dir, use_cache=use_cache)
+
+
+def load_spec_bytes(spec_bytes, cache_dir=SPEC_CACHE_DIR, use_cache=True):
+    """Reduced CalderaSpec of a raw swagger/openapi document."""
+    if not use_cache:
+        return _reduce_spec(spec_bytes)
+
+    # The reduced spec is keyed on the spec bytes, so editing or replacing the
+    # spec file (or bumping REDUCER_VERSION) transparently rebuilds it.
+    cache_path = os.path.join(cache_dir, f"{spec_cache_key(spec_bytes)}.pickle")
+    caldera_api_spec = _read_cache(cache_path)
+    if isinstance(caldera_api_spec, CalderaSpec):
+        return caldera_api_spec
 
-    caldera_api_spec = reduce_openapi_spec(spec)
+    caldera_api_spec = _reduce_spec(spec_bytes)
+    try:
+        _write_cache(cache_path, caldera_api_spec)
+    except OSError:
+        pass  # read-only checkout, just run uncached
     return caldera_api_spec
 
-# print(load_caldera_spec())
\ No newline at end of file
+# print(load_caldera_spec())
@@ -1,18 +1,23 @@
 # pip install -qU langchain "langchain[anthropic]"
-from langchain.agents import create_agent, AgentState
 from langgraph.checkpoint.memory import InMemorySaver
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_ollama import ChatOllama
-from load_spec import load_caldera_spec
-from langchain_community.agent_toolkits.openapi import planner
-from langchain_community.utilities.requests import RequestsWrapper
-from langchain.agents import create_agent
+from spec_provider import SpecProvider
+from endpoint_retriever import EndpointRetriever
+from bm25_index import BM25EndpointRetriever, create_search_tool
+from intent_router import IntentRouter, describe
+from answer_cache import AnswerCache
+from caldera_client import get_client
+from async_client import AsyncCalderaClient, create_fan_out_tool
+from batch_call import create_batch_tool
+from result_pager import Pager, create_pager_tool
+from tool_agent import create_tool_calling_agent
+from prefetcher import Prefetcher
+from chat_repl import ainput, run_turn
+import caldera_planner
 from dotenv import load_dotenv
 import os
+import asyncio
 import datetime
-import tools
-# OpenAI imports
-from langchain_openai import ChatOpenAI
 
 import logging
 
@@ -35,10 +40,11 @@ Do exactly what the user asks you to do nothing else. If subsequent API calls ar
 If you are having error make use of "tools.api_call" to make the API calls.
 """
 
-from langchain_core.rate_limiters import InMemoryRateLimiter
+from metrics import TimedRateLimiter, TurnMetrics
 
-rate_limiter = InMemoryRateLimiter(
-    requests_per_second=0.01,  # 1 request every 60s
+# Gemini's free tier allows 15 requests a minute; CALDERA_LLM_REQUESTS_PER_SECOND for other quotas
+rate_limiter = TimedRateLimiter(
+    requests_per_second=float(os.getenv("CALDERA_LLM_REQUESTS_PER_SECOND", 0.25)),
     check_every_n_seconds=0.1,  # Check every 100ms whether allowed to make a request
     max_bucket_size=10,  # Controls the maximum burst size.
 )
@@ -48,6 +54,7 @@ llm = ChatGoogleGenerativeAI(
     temperature=0,
     max_tokens=65536,
     timeout=None,
+    rate_limiter=rate_limiter,  # its waits are what TurnMetrics reports as rate_limit_wait_s
     # state_schema=CustomAgentState,  
     checkpointer=InMemorySaver(),
     # base_url="http://10.0.0.10:11434",  # Replace with your Ollama server URL
@@ -55,19 +62,76 @@ llm = ChatGoogleGenerativeAI(
 
 # llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, max_tokens=16384,)
 
-requests_wrapper = RequestsWrapper(headers={"KEY": f"{os.getenv('CALDERA_API_TOKEN')}"})
+# One pooled keep-alive session (sync and aiohttp) for every Caldera call the agent makes
+caldera_client = get_client()
+# HEAD /api/v2/health in the background: while the server is down, calls fail fast and
+# the chat loop says so without calling the LLM; the breaker closes once it answers again.
+caldera_client.start_health_probe()
+requests_wrapper = caldera_client.requests_wrapper()
 ALLOW_DANGEROUS_REQUEST = True
 
-caldera_agent = planner.create_openapi_agent(
-    llm=llm,
-    api_spec=load_caldera_spec(),
-    system_prompt=SYSTEM_PROMPT,
-    verbose=True,
-    allow_dangerous_requests=ALLOW_DANGEROUS_REQUEST,
-    requests_wrapper=requests_wrapper,
-    allowed_operations=["GET", "POST", "PUT", "DELETE", "PATCH"],
-    # context_schema=Context,
-)
+# Cached spec now, live spec as soon as the background revalidation sees a change.
+spec_provider = SpecProvider().start()
+
+# Only show the planner the endpoints relevant to the query (embeddings from context.py).
+# CALDERA_ENDPOINT_RETRIEVAL=off lists every endpoint like before, =bm25 uses the
+# offline keyword index instead of the embeddings server.
+endpoint_retrieval = os.getenv("CALDERA_ENDPOINT_RETRIEVAL")
+if endpoint_retrieval == "off":
+    endpoint_retriever = None
+elif endpoint_retrieval == "bm25":
+    endpoint_retriever = BM25EndpointRetriever()
+else:
+    endpoint_retriever = EndpointRetriever()
+
+async_caldera_client = AsyncCalderaClient(spec_provider, caldera_client)
+
+# "for every running operation, ..." as one concurrent fan-out instead of a call per item,
+# and several known requests as one batch instead of a controller run each
+extra_tools = [
+    create_fan_out_tool(async_caldera_client),
+    create_batch_tool(async_caldera_client, {"GET", "POST", "PUT", "DELETE", "PATCH"}),
+    # abilities / facts / links fetched once, then paged, filtered and counted client-side
+    create_pager_tool(Pager(spec_provider, caldera_client)),
+    # "which endpoint ...?" answered offline by the BM25 index of the live spec
+    create_search_tool(spec_provider, endpoint_retriever if endpoint_retrieval == "bm25" else None),
+]
+
+# One agent loop on the model's native tool calling; CALDERA_AGENT_ENGINE=planner brings back
+# the orchestrator / planner / controller ReAct stack.
+agent_engine = os.getenv("CALDERA_AGENT_ENGINE", "tools")
+if agent_engine == "planner":
+    caldera_agent = caldera_planner.create_openapi_agent(
+        llm=llm,
+        api_spec=spec_provider,
+        system_prompt=SYSTEM_PROMPT,
+        verbose=True,
+        allow_dangerous_requests=ALLOW_DANGEROUS_REQUEST,
+        requests_wrapper=requests_wrapper,
+        allowed_operations=["GET", "POST", "PUT", "DELETE", "PATCH"],
+        endpoint_retriever=endpoint_retriever,
+        # Plan steps' output_instructions applied to responses locally, the parsing LLM call only
+        # when they can't be; CALDERA_PARSE_MODE=llm parses every response with the LLM again.
+        parse_mode=os.getenv("CALDERA_PARSE_MODE", "extract"),
+        extra_tools=extra_tools,
+        # the plan's independent GETs go out together before the controller's first turn
+        async_client=async_caldera_client,
+        # context_schema=Context,
+    )
+else:
+    caldera_agent = create_tool_calling_agent(
+        spec_provider,
+        llm,
+        caldera_client,
+        system_prompt=SYSTEM_PROMPT,
+        allowed_operations=["GET", "POST", "PUT", "DELETE", "PATCH"],
+        allow_dangerous_requests=ALLOW_DANGEROUS_REQUEST,
+        endpoint_retriever=endpoint_retriever,
+        extra_tools=extra_tools,
+        verbose=True,
+        # caldera_request on the chat loop's event loop, see chat_repl
+        async_client=async_caldera_client,
+    )
 
 
 # user_query = (
@@ -76,16 +140,43 @@ caldera_agent = planner.create_openapi_agent(
 # caldera_agent.invoke(user_query)
 
 
-# # Run the agent
-import datetime
+# "list agents", "health", "show operation X links"... go straight to the API, no LLM call.
+intent_router = IntentRouter(
+    spec_provider, base_url=spec_provider.base_url, headers=spec_provider.headers, get=caldera_client.get
+)
+
+
+# Repeated read-only questions are answered from the cache while the GETs behind the
+# answer are unchanged; the agent's POST/PUT/PATCH/DELETE calls invalidate it.
+# CALDERA_ANSWER_CACHE=off disables it. No embeddings server in bm25 mode: exact matches only.
+answer_cache = None if os.getenv("CALDERA_ANSWER_CACHE") == "off" else AnswerCache(
+    spec_provider,
+    caldera_client,
+    embeddings=False if endpoint_retrieval == "bm25" else None,
+)
 
-def chat_loop():
 
-    config = {"configurable": {"thread_id": "1"}}
+# While the model thinks, the GETs the turn will probably make (named collections, the
+# operation / agent the conversation is about) are warmed into the HTTP cache, within a
+# budget per turn. CALDERA_PREFETCH=off disables it.
+prefetcher = None if os.getenv("CALDERA_PREFETCH") == "off" else Prefetcher(
+    spec_provider, caldera_client, endpoint_retriever
+)
+
+
+# Per-stage token / latency accounting, appended to caldera_metrics.jsonl after every answer
+turn_metrics = TurnMetrics(rate_limiter=rate_limiter)
+
+
+# Turns run on the event loop: the model's tokens and tool calls are printed as they come,
+# and Ctrl-C cancels the turn in flight, not the session (caches, memory, pooled connections).
+async def achat_loop():
+
+    config = {"configurable": {"thread_id": "1"}, "callbacks": [turn_metrics]}
 
     current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    user_query = input("User: ")
+    user_query = await ainput("User: ")
 
     while user_query.lower() not in ["exit", "quit"]:
         # Support multi-line markdown input
@@ -94,7 +185,7 @@ def chat_loop():
             lines = [user_query]
             print("(Enter markdown block, end with ``` on a new line)")
             while True:
-                line = input()
+                line = await ainput()
                 lines.append(line)
                 if line.strip() == "```":
                     break
@@ -111,26 +202,63 @@ def chat_loop():
 **Session**: chat_loop
 """
         
-        response = caldera_agent.invoke(
-            {"input": formatted_query}, 
-            config=config,
-            tools=[tools.api_call]
-        )
-        
-        # Extract and format agent output
-        agent_output = response.get('output') or response.get('structured_response')
+        turn_metrics.start_turn(user_query)
+        breaker = caldera_client.breaker
+        fast = cached = down = turn = None
+        if not breaker.available:
+            down = agent_output = breaker.unavailable_message()
+            served_by = "🔌 circuit breaker (no LLM call)"
+        elif fast := intent_router.handle(user_query):
+            agent_output = fast.output
+            served_by = describe(fast)
+        elif answer_cache is not None and (cached := answer_cache.lookup(user_query)) is not None:
+            agent_output = cached
+            served_by = "♻️ answer cache (dependencies revalidated, no LLM call)"
+        else:
+            if prefetcher is not None:
+                prefetcher.start(user_query)
+            try:
+                turn = await run_turn(caldera_agent, {"input": formatted_query}, config=config)
+            finally:
+                prefetch = prefetcher.finish() if prefetcher is not None else None
+            
+            # Extract and format agent output
+            agent_output = "(cancelled)" if turn.cancelled else turn.output
+            served_by = f"**Model**: {llm.model}"
+            if answer_cache is not None and not turn.cancelled:
+                answer_cache.store(user_query, agent_output)
         
-        # Format response with markdown
-        formatted_response = f"""
+        # Format response with markdown; a streamed answer is already on screen
+        if turn is not None and (turn.cancelled or turn.answer_shown):
+            formatted_response = f"""
+---
+{served_by} | **Timestamp**: {current_time}
+"""
+        else:
+            formatted_response = f"""
 ## Agent Response
 
 {agent_output}
 
 ---
-**Model**: {llm.model} | **Timestamp**: {current_time}
+{served_by} | **Timestamp**: {current_time}
 """
         
         print(formatted_response)
+        if prefetcher is not None and not (turn is not None and turn.cancelled):
+            prefetcher.observe(user_query)
+            prefetcher.observe(agent_output)
+        if down:
+            turn_metrics.end_turn(served_by="circuit-breaker", breaker=breaker.stats())
+        elif fast:
+            turn_metrics.end_turn(served_by=fast.served_by, intent=fast.intent, endpoint=fast.endpoint)
+        elif cached is not None:
+            turn_metrics.end_turn(served_by="answer-cache")
+        else:
+            print(TurnMetrics.summary(turn_metrics.end_turn(model=llm.model, engine=agent_engine,
+                                                            http_cache=caldera_client.cache_stats(),
+                                                            http_transfer=caldera_client.transfer_stats(),
+                                                            prefetch=prefetch, **turn.timings())))
 
         # Write to log file with markdown formatting
         with open("caldera_agent.log", "a") as log_file:
@@ -139,12 +267,16 @@ def chat_loop():
             log_file.write(f"### Agent Response\n```\n{agent_output}\n```\n\n")
             log_file.write("---\n\n")
         
-        user_query = input("\nUser: ")
+        user_query = await ainput("\nUser: ")
     else:
         print("Exiting chat loop.")
         with open("caldera_agent.log", "a") as log_file:
             log_file.write(f"[{current_time}] User exited the chat loop.\n\n")
-        exit()
+        await caldera_client.aclose()
+
+
+def chat_loop():
+    asyncio.run(achat_loop())
 
 if __name__ == "__main__":
     chat_loop()
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""Per-turn token and latency accounting for the planner agent.
+
+One caldera_agent.invoke hides several LLM stages: the orchestrator
+ZeroShotAgent, the api_planner chain, the api_controller agent, and one
+PARSING_*_PROMPT chain per HTTP call. TurnMetrics is a callback handler that
+attributes every LLM call to one of those stages, from the tool it runs
+under, and records prompt/completion tokens, LLM time and time spent
+waiting on the rate limiter (the model's rate_limiter, taken out of the
+LLM time). end_turn() appends a row to a JSONL file.
+"""
+import json
+import time
+import datetime
+import threading
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_community.agent_toolkits.openapi.planner_prompt import (
+    API_CONTROLLER_TOOL_NAME,
+    API_PLANNER_TOOL_NAME,
+)
+from doc_render import count_tokens
+
+METRICS_FILE = "caldera_metrics.jsonl"
+
+STAGES = ("orchestrator", "planner", "controller", "parser")
+
+# Tool name -> stage of every LLM call made underneath it.
+TOOL_STAGES = {
+    API_PLANNER_TOOL_NAME: "planner",
+    API_CONTROLLER_TOOL_NAME: "controller",
+    "requests_get": "parser",
+    "requests_post": "parser",
+    "requests_put": "parser",
+    "requests_patch": "parser",
+    "requests_delete": "parser",
+}
+
+
+class TimedRateLimiter(InMemoryRateLimiter):
+    """InMemoryRateLimiter that remembers how long each acquire() blocked."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._waits_lock = threading.Lock()
+        self.waits = []  # (start, end) perf_counter pairs
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        start = time.perf_counter()
+        try:
+            return super().acquire(blocking=blocking)
+        finally:
+            self._record(start, time.perf_counter())
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        start = time.perf_counter()
+        try:
+            return await super().aacquire(blocking=blocking)
+        finally:
+            self._record(start, time.perf_counter())
+
+    def _record(self, start, end):
+        with self._waits_lock:
+            self.waits.append((start, end))
+            del self.waits[:-256]
+
+    def waited_between(self, start, end):
+        """Seconds spent blocked in acquire() within [start, end]."""
+        with self._waits_lock:
+            return sum(max(0.0, min(e, end) - max(s, start)) for s, e in self.waits)
+
+
+def _new_stage():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "llm_s": 0.0, "rate_limit_wait_s": 0.0}
+
+
+class TurnMetrics(BaseCallbackHandler):
+    """Callback handler accumulating per-stage LLM usage for the current turn."""
+
+    raise_error = False
+
+    def __init__(self, path: Optional[str] = METRICS_FILE, rate_limiter: Optional[TimedRateLimiter] = None):
+        self.path = path
+        self.rate_limiter = rate_limiter
+        self.turn = 0
+        self._lock = threading.Lock()
+        self._run_stage: Dict[UUID, str] = {}
+        self._llm_runs: Dict[UUID, Dict[str, Any]] = {}
+        self._reset("")
+
+    def start_turn(self, query: str = ""):
+        with self._lock:
+            self.turn += 1
+            self._reset(query)
+
+    def _reset(self, query):
+        self.query = query
+        self.started = time.perf_counter()
+        self.stages = {stage: _new_stage() for stage in STAGES}
+        self._run_stage.clear()
+        self._llm_runs.clear()
+
+    def end_turn(self, **extra) -> Dict[str, Any]:
+        """Close the turn, append it to the metrics file and return the row."""
+        with self._lock:
+            row = {
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "turn": self.turn,
+                "query_chars": len(self.query),
+                "wall_s": round(time.perf_counter() - self.started, 3),
+                "stages": {
+                    stage: {k: round(v, 3) if isinstance(v, float) else v for k, v in values.items()}
+                    for stage, values in self.stages.items() if values["calls"]
+                },
+                **extra,
+            }
+        totals = _new_stage()
+        for values in row["stages"].values():
+            for k in totals:
+                totals[k] += values[k]
+        row["totals"] = {k: round(v, 3) if isinstance(v, float) else v for k, v in totals.items()}
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(row) + "\n")
+        return row
+
+    @staticmethod
+    def summary(row: Dict[str, Any]) -> str:
+        """One-line summary of an end_turn() row."""
+        totals = row["totals"]
+        parts = [
+            f"{stage} {v['calls']}×/{v['prompt_tokens']}+{v['completion_tokens']}tok/{v['llm_s']:.1f}s"
+            for stage, v in row["stages"].items()
+        ]
+        line = (
+            f"⏱ {row['wall_s']:.1f}s | {totals['calls']} LLM calls | "
+            f"{totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion tokens"
+        )
+        if totals["rate_limit_wait_s"]:
+            line += f" | rate limit {totals['rate_limit_wait_s']:.1f}s"
+        if row.get("ttft_s") is not None:
+            line += f" | first token {row['ttft_s']:.1f}s"
+        if row.get("first_tool_result_s") is not None:
+            line += f" | first tool result {row['first_tool_result_s']:.1f}s"
+        if row.get("cancelled"):
+            line += " | cancelled"
+        return line + (" | " + ", ".join(parts) if parts else "")
+
+    # Stage attribution: a run inherits its parent's stage unless it is one of
+    # the tools in TOOL_STAGES; top-level runs belong to the orchestrator.
+    def _inherit(self, run_id, parent_run_id, stage=None):
+        with self._lock:
+            if stage is None:
+                stage = self._run_stage.get(parent_run_id, "orchestrator")
+            self._run_stage[run_id] = stage
+        return stage
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._inherit(run_id, parent_run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name")
+        self._inherit(run_id, parent_run_id, TOOL_STAGES.get(name))
+
+    def on_llm_start(self, serialized, prompts: List[str], *, run_id, parent_run_id=None, **kwargs):
+        self._start_llm(run_id, parent_run_id, sum(count_tokens(p) for p in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        # Native tool calling: the bound tool schemas and earlier tool calls are prompt too.
+        text = "\n".join(_message_text(m) for batch in messages for m in batch)
+        tools = (kwargs.get("invocation_params") or {}).get("tools")
+        if tools:
+            text += "\n" + json.dumps(tools, default=str)
+        self._start_llm(run_id, parent_run_id, count_tokens(text))
+
+    def _start_llm(self, run_id, parent_run_id, estimated_prompt_tokens):
+        stage = self._inherit(run_id, parent_run_id)
+        with self._lock:
+            self._llm_runs[run_id] = {
+                "stage": stage,
+                "start": time.perf_counter(),
+                "estimated_prompt_tokens": estimated_prompt_tokens,
+            }
+
+    def on_llm_end(self, response: LLMResult, *, run_id, parent_run_id=None, **kwargs):
+        self._end_llm(run_id, response)
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end_llm(run_id, None)
+
+    def _end_llm(self, run_id, response):
+        end = time.perf_counter()
+        with self._lock:
+            run = self._llm_runs.pop(run_id, None)
+        if run is None:
+            return
+        prompt_tokens, completion_tokens = _usage(response)
+        if prompt_tokens is None:
+            prompt_tokens = run["estimated_prompt_tokens"]
+        if completion_tokens is None:
+            completion_tokens = sum(
+                count_tokens(_message_text(g.message) if hasattr(g, "message") else g.text)
+                for gens in (response.generations if response else []) for g in gens
+            )
+        waited = self.rate_limiter.waited_between(run["start"], end) if self.rate_limiter else 0.0
+        with self._lock:
+            stage = self.stages.setdefault(run["stage"], _new_stage())
+            stage["calls"] += 1
+            stage["prompt_tokens"] += prompt_tokens
+            stage["completion_tokens"] += completion_tokens
+            stage["llm_s"] += max(0.0, end - run["start"] - waited)  # the model's own time, not the queue's
+            stage["rate_limit_wait_s"] += waited
+
+
+def _message_text(message):
+    tool_calls = getattr(message, "tool_calls", None)
+    if not tool_calls:
+        return str(message.content)
+    return f"{message.content}\n" + json.dumps([{"name": c["name"], "args": c["args"]} for c in tool_calls],
+                                                default=str)
+
+
+def _usage(response):
+    """(prompt, completion) tokens reported by the provider, None where missing."""
+    if response is None:
+        return 0, 0
+    prompt = completion = None
+    for gens in response.generations:
+        for g in gens:
+            usage = getattr(getattr(g, "message", None), "usage_metadata", None)
+            if usage:
+                prompt = (prompt or 0) + usage.get("input_tokens", 0)
+                completion = (completion or 0) + usage.get("output_tokens", 0)
+    if prompt is None and response.llm_output:
+        usage = response.llm_output.get("token_usage") or response.llm_output.get("usage") or {}
+        if usage:
+            prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+            completion = usage.get("completion_tokens", usage.get("output_tokens"))
+    return prompt, completion
@@ -0,0 +1,422 @@
+"""Deterministic extraction of what a plan step asks for from an API response.
+
+Every requests_* tool of langchain's controller sends the response through a
+PARSING_*_PROMPT chain to pull out what output_instructions asks for
+("the id and name of each agent", "the paw of agents whose platform is
+linux", "how many operations are there"). That is a second LLM call per
+HTTP call for what mostly is a field selection. compile_instructions()
+turns such instructions into an Extraction:
+
+- an explicit JSONPath ($[*].paw, $.chain[*].id) if the instructions carry one;
+- otherwise the words of the instructions as candidate fields ("last seen"
+  -> last_seen, "adversary name" -> adversary.name, plurals singular),
+  a where filter ("whose state is running", "named X") and a count.
+
+Candidates are only matched against the keys the response actually has,
+so unrelated words select nothing. Instructions that need judgement
+(summarize, latest, whether...) don't compile, nor do conditions the
+grammar can't read whole: negations ("not trusted", "other than linux"),
+an unquoted value of several words ("named Super Spy", quote it), a
+condition word left over once the conditions were read ("and group is
+red"), a field and value after on / in / at / from ("on host ws-02", "in
+group red"). An Extraction that selects nothing from the response, or whose
+filter matches no item, doesn't apply either; the tools then fall back to
+the LLM chain.
+"""
+import re
+import json
+import itertools
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, ClassVar, Dict, NamedTuple, Optional, Tuple
+from langchain_community.agent_toolkits.openapi.planner import (
+    RequestsDeleteToolWithParsing,
+    RequestsGetToolWithParsing,
+    RequestsPatchToolWithParsing,
+    RequestsPostToolWithParsing,
+    RequestsPutToolWithParsing,
+)
+from json_stream import project_response, response_text
+
+# Items read when extracting; only the selected fields of each are kept.
+EXTRACT_LIMIT = 1000
+
+# "extracted": answered locally, "llm": parsing chain ran. Across all tools of the process.
+stats = Counter()
+
+_JSONPATH = re.compile(r"\$(?:\.[\w-]+|\.\*|\[\*\]|\[\d+\])*")
+_PATH_STEP = re.compile(r"\.([\w-]+)|\.(\*)|\[(\*)\]|\[(\d+)\]")
+_COUNT = re.compile(r"\b(how many|number of|count)\b")
+_NEEDS_LLM = re.compile(
+    r"\b(summar\w*|explain\w*|describe|whether|if|why|compare\w*|latest|most|least|newest|oldest|first|"
+    r"last(?! seen)|sort\w*|order\w*|average|sum|longest|shortest|best|which of)\b"
+)
+_NEGATION = re.compile(r"\b(not|no|non|except|excluding|without|other than|neither|nor)\b|n't\b")
+# A quoted value is taken whole; an unquoted one is a single word that has to end the clause.
+_QUOTED = r"""(?:"(?P<dq>[^"]+)"|'(?P<sq>[^']+)'|`(?P<bq>[^`]+)`)"""
+_VALUE = r"(?:" + _QUOTED + r"""|(?P<word>[^\s"'`,;()?!]+?)(?=[.?!]?$|[,;)]))"""
+_WHERE = [
+    # whose / where / with <field> is|= <value>
+    re.compile(r"\b(?:whose|where|with)\s+(?:the\s+|its\s+)?(?P<field>[a-z][\w.]*(?:\s[a-z]\w*)?)\s+"
+               r"(?:is|=|==|equals?|of)\s+" + _VALUE, re.I),
+    # named X / called X
+    re.compile(r"\b(?:named|called)\s+" + _VALUE, re.I),
+    # with <field> <value>
+    re.compile(r"\bwith\s+(?:the\s+)?(?!(?:their|its|all|each|every|a|an)\b)(?P<field>[a-z][\w.]*)\s+" + _VALUE, re.I),
+    # <field>: "value" / <field> 'value'
+    re.compile(r"\b(?P<field>[a-z][\w.]*)\s*(?:=|:)?\s*" + _QUOTED, re.I),
+]
+# Still there once the conditions were taken out: a condition the grammar didn't read,
+# "on host ws-02" / "in group red" included (not "in the operation", "from each agent").
+_UNPARSED = re.compile(
+    r"\b(?:whose|where|named|called|equals?|is)\b|=|\bwith\s+(?!(?:their|its)\b)"
+    r"|\b(?:on|in|at|from)\s+(?:the\s+|an?\s+)?(?!(?:each|every|all|any|the|an?)\b)[a-z][\w.-]*\s+"
+    r"(?!(?:of|and|or|to|for|that|which|who|with|after|before)\b)[^\s,;.?!()]"
+)
+_WORD = re.compile(r"[a-z][a-z0-9_-]*")
+# Words that filter on their own: "the running operations", "untrusted agents".
+FILTER_WORDS = {
+    "running": ("state", "running"),
+    "finished": ("state", "finished"),
+    "paused": ("state", "paused"),
+    "cleanup": ("state", "cleanup"),
+    "trusted": ("trusted", "true"),
+    "untrusted": ("trusted", "false"),
+    "linux": ("platform", "linux"),
+    "windows": ("platform", "windows"),
+    "darwin": ("platform", "darwin"),
+}
+_IRREGULAR = {"statuses": "status", "aliases": "alias", "indices": "index", "abilities": "ability",
+              "adversaries": "adversary", "entries": "entry", "executors": "executor"}
+
+
+class Extraction(NamedTuple):
+    path: Optional[str]  # explicit JSONPath
+    fields: Tuple[str, ...]  # candidate field names, matched against the response's keys
+    where: Dict[str, str]  # field -> value (case-insensitive)
+    count: bool
+    id_aliases: Tuple[str, ...] = ()  # adversary_id, ability_id...: what "id" may be called
+
+    @property
+    def projection_fields(self):
+        """Fields json_stream has to keep for this extraction (None: everything)."""
+        if self.path:
+            names = [n for n, *_ in _PATH_STEP.findall(self.path) if n]
+            return (".".join(names),) if names else None
+        return tuple(dict.fromkeys(self.fields + tuple(self.where) + self.id_aliases)) or None
+
+    def filter(self, items) -> Optional[list]:
+        """The items matching `where`, None when the items don't have those fields."""
+        keys = _keys(items)
+        if not all(field in keys or "." in field for field in self.where):
+            return None
+        return [i for i in items if _matches(i, self.where)]
+
+    def apply(self, data, total=None, max_chars=None) -> Optional[str]:
+        """Text of the extracted values, None when nothing in `data` matches."""
+        if self.path:
+            values = select(data, self.path)
+            return None if values is None else _render(values, max_chars)
+        items = data if isinstance(data, list) else [data] if isinstance(data, dict) else None
+        if items is None:
+            return None
+        if self.where:
+            items = self.filter(items)
+            if not items:  # no field to filter on, or a filter nothing passes: the LLM may read it otherwise
+                return None
+            condition = ", ".join(f"{k}={v}" for k, v in self.where.items())
+        if self.count:
+            if isinstance(data, dict) and not self.where:  # "how many links does the operation have"
+                lists = [f for f in self.fields if isinstance(_get(data, f), list)]
+                return f"{lists[0]}: {len(_get(data, lists[0]))} items" if lists else None
+            if self.where:
+                return f"count: {len(items)} where {condition}"
+            return f"count: {total if total is not None else len(items)}"
+        fields = [f for f in self.fields if any(_get(i, f) is not _MISSING for i in items)]
+        if "id" in self.fields and "id" not in fields:  # the id under its Caldera name
+            fields += [f for f in self.id_aliases if any(_get(i, f) is not _MISSING for i in items)][:1]
+        # "adversary name" is adversary.name, not also the whole adversary and the item's own name
+        parts = {p for f in fields for p in re.split(r"[._]", f) if p != f}
+        fields = [f for f in fields if f not in parts]
+        if not fields:
+            return None
+        rows = [_pick(i, fields) for i in items]
+        if isinstance(data, dict) and len(rows) == 1:
+            return _render(rows[0], max_chars)
+        if len(fields) == 1:
+            return _render({fields[0]: [row.get(fields[0]) for row in rows]}, max_chars)
+        return _render(rows, max_chars)
+
+
+def _singular(word):
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 2:
+        return word[:-1]
+    return word
+
+
+def _conditions(text):
+    """field -> value of the conditions in `text` ("name" for named X), and the text without
+    them; None when there is a condition this grammar can't read whole."""
+    where, spans = {}, []
+    for pattern in _WHERE:
+        for m in pattern.finditer(text):
+            if any(m.start() < end and start < m.end() for start, end in spans):
+                continue
+            field = (m.groupdict().get("field") or "name").lower()
+            if field in ("named", "called", "is"):
+                continue
+            value = next(v for k, v in m.groupdict().items() if k != "field" and v is not None)
+            where.setdefault(_singular(field.replace(" ", "_").replace("-", "_")), value.strip())
+            spans.append(m.span())
+    rest = text
+    for start, end in sorted(spans, reverse=True):
+        rest = rest[:start] + " " + rest[end:]
+    if _UNPARSED.search(rest.lower()):
+        return None
+    return where, rest
+
+
+def compile_instructions(instructions: str) -> Optional[Extraction]:
+    """Extraction for an output_instructions text, None when it needs the LLM."""
+    text = " ".join((instructions or "").split())
+    if not text:
+        return None
+    m = _JSONPATH.search(text)
+    if m and m.group() != "$":
+        return Extraction(m.group(), (), {}, False)
+    lower = text.lower()
+    if _NEEDS_LLM.search(lower.replace("last_seen", "")) or _NEGATION.search(lower):
+        return None
+    conditions = _conditions(text)
+    if conditions is None:
+        return None
+    where, rest = conditions
+    words = [w.replace("-", "_") for w in _WORD.findall(lower)]
+    if "or" not in words:  # "running or paused" is a question, not a filter
+        for word in _WORD.findall(rest.lower()):  # not the words of a quoted name
+            if word in FILTER_WORDS:
+                where.setdefault(*FILTER_WORDS[word])
+    candidates = []
+    for i, word in enumerate(words):
+        candidates += [_singular(word), word]
+        if i + 1 < len(words):
+            candidates += [f"{word}_{_singular(words[i + 1])}", f"{word}.{_singular(words[i + 1])}"]
+    values = {v.lower() for v in where.values()}
+    fields = tuple(dict.fromkeys(c for c in candidates if c not in values))
+    id_aliases = tuple(dict.fromkeys(f"{_singular(w)}_id" for w in words)) if "id" in fields else ()
+    return Extraction(None, fields, where, bool(_COUNT.search(lower)), id_aliases)
+
+
+_MISSING = object()
+
+
+def _get(item, dotted):
+    for part in dotted.split("."):
+        if not isinstance(item, dict) or part not in item:
+            return _MISSING
+        item = item[part]
+    return item
+
+
+def _keys(items):
+    keys = set()
+    for item in items[:50]:
+        if isinstance(item, dict):
+            keys.update(item)
+    return keys
+
+
+def _matches(item, where):
+    for field, value in where.items():
+        actual = _get(item, field)
+        if actual is _MISSING or str(actual).lower() != value.lower():
+            return False
+    return True
+
+
+def _pick(item, fields):
+    row = {}
+    for field in fields:
+        value = _get(item, field)
+        if value is not _MISSING:
+            row[field] = value
+    return row
+
+
+def select(data, path) -> Optional[Any]:
+    """Minimal JSONPath: $, .name, .*, [*], [n]. None when the path selects nothing."""
+    current, fanned = [data], False
+    for name, star, bracket_star, index in _PATH_STEP.findall(path):
+        nxt = []
+        for value in current:
+            if name:
+                if isinstance(value, dict) and name in value:
+                    nxt.append(value[name])
+            elif star or bracket_star:
+                fanned = True
+                if isinstance(value, list):
+                    nxt.extend(value)
+                elif isinstance(value, dict):
+                    nxt.extend(value.values())
+            elif isinstance(value, list) and int(index) < len(value):
+                nxt.append(value[int(index)])
+        current = nxt
+    if not current:
+        return None
+    return current if fanned else current[0]
+
+
+def _render(value, max_chars=None):
+    text = json.dumps(value, separators=(",", ":"), default=str, ensure_ascii=False)
+    if not max_chars or len(text) <= max_chars:
+        return text
+    if isinstance(value, dict) and len(value) == 1 and isinstance(next(iter(value.values())), list):
+        (key, items), = value.items()
+        shown = _fit(items, max_chars - len(key) - 8)
+        return json.dumps({key: items[:shown]}, separators=(",", ":"), default=str, ensure_ascii=False) + \
+            f"\n({shown} of {len(items)} shown)"
+    if isinstance(value, list):
+        shown = _fit(value, max_chars)
+        return json.dumps(value[:shown], separators=(",", ":"), default=str, ensure_ascii=False) + \
+            f"\n({shown} of {len(value)} shown)"
+    return text[:max_chars] + "…"
+
+
+def _fit(items, max_chars):
+    size = 2
+    for n, item in enumerate(items):
+        size += len(json.dumps(item, separators=(",", ":"), default=str, ensure_ascii=False)) + 1
+        if size > max_chars:
+            return max(n, 1)
+    return len(items)
+
+
+def extract_response(response, extraction: Extraction, max_chars=None) -> Optional[str]:
+    """Run `extraction` on a requests.Response (streamed or not); None if it doesn't apply."""
+    if response.status_code >= 400:
+        return f"HTTP {response.status_code}: {response_text(response, max_chars=1000)}"
+    if "json" not in response.headers.get("Content-Type", ""):
+        if response.status_code == 204 or not response.content:
+            return f"HTTP {response.status_code}, no content"
+        return None
+    try:
+        projection = project_response(response, extraction.projection_fields, EXTRACT_LIMIT)
+    except ValueError:
+        return None
+    result = extraction.apply(projection.data, projection.total, max_chars)
+    if result is not None and isinstance(projection.data, list) and projection.omitted and not extraction.count:
+        result += f"\n(first {len(projection.data)} of {projection.total} items read)"
+    return result
+
+
+class _Rereadable:
+    """A streamed response read twice: the chunks the first iter_content() took are kept and
+    replayed to the second, which then goes on with the rest of the stream. close() is left to
+    the owner (release()), so the first reader closing it doesn't end the body for the second."""
+
+    def __init__(self, response):
+        self._response = response
+        self._read = []
+        self._rest = None
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        if self._rest is None:
+            self._rest = self._response.iter_content(chunk_size, decode_unicode)
+            return self._keep()
+        return itertools.chain(list(self._read), self._rest)
+
+    def _keep(self):
+        for chunk in self._rest:
+            self._read.append(chunk)
+            yield chunk
+
+    def close(self):
+        pass
+
+    def release(self):
+        self._read = []
+        self._response.close()
+
+
+class _Extracting(ABC):
+    """requests_* tool that applies output_instructions locally when they compile,
+    and only runs its LLM chain when they don't (or select nothing)."""
+
+    streamed: ClassVar[bool] = False  # body read piecewise, kept for the LLM only as far as extraction read it
+
+    @abstractmethod
+    def _send(self, data):
+        """The tool's request for its parsed input."""
+
+    def _run(self, text: str) -> str:
+        from langchain_classic.output_parsers.json import parse_json_markdown
+
+        data = parse_json_markdown(text)
+        extraction = compile_instructions(data.get("output_instructions", ""))
+        response = self._send(data)
+        if self.streamed:
+            response = _Rereadable(response)
+        try:
+            if extraction is not None:
+                result = extract_response(response, extraction, self.response_length)
+                if result is not None:
+                    stats["extracted"] += 1
+                    return result
+            stats["llm"] += 1
+            body = response_text(response, max_chars=self.response_length)
+        finally:
+            if self.streamed:
+                response.release()
+        return self.llm_chain.predict(
+            response=body[: self.response_length], instructions=data["output_instructions"]
+        ).strip()
+
+
+class ExtractingGetTool(_Extracting, RequestsGetToolWithParsing):
+    streamed: ClassVar[bool] = True
+
+    def _send(self, data):
+        return self.requests_wrapper.requests.get(data["url"], params=data.get("params"), stream=True)
+
+
+class ExtractingPostTool(_Extracting, RequestsPostToolWithParsing):
+    def _send(self, data):
+        return self.requests_wrapper.requests.post(data["url"], data["data"])
+
+
+class ExtractingPutTool(_Extracting, RequestsPutToolWithParsing):
+    def _send(self, data):
+        return self.requests_wrapper.requests.put(data["url"], data["data"])
+
+
+class ExtractingPatchTool(_Extracting, RequestsPatchToolWithParsing):
+    def _send(self, data):
+        return self.requests_wrapper.requests.patch(data["url"], data["data"])
+
+
+class ExtractingDeleteTool(_Extracting, RequestsDeleteToolWithParsing):
+    def _send(self, data):
+        return self.requests_wrapper.requests.delete(data["url"])
+
+
+EXTRACTING_TOOLS = {
+    "requests_get": ExtractingGetTool,
+    "requests_post": ExtractingPostTool,
+    "requests_put": ExtractingPutTool,
+    "requests_patch": ExtractingPatchTool,
+    "requests_delete": ExtractingDeleteTool,
+}
+
+
+def extracting(tool):
+    """The extracting version of one of langchain's requests_*ToolWithParsing (same chain, wrapper)."""
+    cls = EXTRACTING_TOOLS.get(tool.name)
+    if cls is None:
+        return tool
+    return cls(requests_wrapper=tool.requests_wrapper, llm_chain=tool.llm_chain,
+               allow_dangerous_requests=tool.allow_dangerous_requests, response_length=tool.response_length)
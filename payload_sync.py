@@ -0,0 +1,306 @@
+"""Upload a directory of payloads to Caldera: streamed, deduplicated, resumable.
+
+Usage: python payload_sync.py DIR [--workers N] [--replace] [--dry-run]
+
+api_call uploaded a payload with files={'file': open(path, 'rb')}: the file
+was never closed and requests built the whole multipart body in memory
+before sending. sync_payloads() instead:
+
+- streams each multipart body from disk in CHUNK_SIZE pieces
+  (MultipartFile), so memory stays flat whatever the payload size;
+- hashes files (sha256) in a thread pool, reusing the manifest's hash
+  when size and mtime are unchanged;
+- skips names GET /api/v2/payloads already lists, and files whose name and
+  content appeared twice in the directory;
+- uploads up to `workers` files at a time through the shared client,
+  with a progress line on stderr;
+- records every finished upload in a manifest next to the payloads
+  (MANIFEST_NAME), so an interrupted sync resumes with the files not yet
+  done.
+
+Caldera only lists payload names, no hashes. A name on the server whose
+local file changed since the manifest recorded it is reported, and with
+replace=True deleted and uploaded again. The delete has to come first
+(Caldera renames a duplicate upload instead of overwriting), so when the
+upload then fails the server has neither copy: the summary lists those
+names as lost.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import requests
+from caldera_client import get_client
+
+CHUNK_SIZE = 1024 * 1024
+HASH_WORKERS = 4
+UPLOAD_WORKERS = 4
+UPLOAD_ATTEMPTS = 3
+MANIFEST_NAME = ".caldera_payloads.json"
+PAYLOADS_PATH = "/api/v2/payloads"
+
+
+class MultipartFile:
+    """multipart/form-data body with one file part, read from disk as it is sent.
+
+    requests streams an iterable body with a known length as is (with a
+    Content-Length), so iterating reopens the file: a retried request
+    sends the whole body again.
+    """
+
+    def __init__(self, path, field="file", filename=None, chunk_size=CHUNK_SIZE, on_chunk=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk  # called with the size of every file chunk sent
+        boundary = uuid.uuid4().hex
+        filename = (filename or os.path.basename(path)).replace('"', "%22")
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        self._tail = f"\r\n--{boundary}--\r\n".encode()
+        self._size = os.path.getsize(path)
+
+    def __len__(self):
+        return len(self._head) + self._size + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                if self.on_chunk:
+                    self.on_chunk(len(chunk))
+                yield chunk
+        yield self._tail
+
+
+def upload_file(client, path, name=None, on_chunk=None):
+    """POST one payload, streamed; the requests.Response."""
+    body = MultipartFile(path, filename=name, on_chunk=on_chunk)
+    return client.post(PAYLOADS_PATH, data=body, headers={"Content-Type": body.content_type})
+
+
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def server_payloads(client) -> set:
+    """Names of the payloads Caldera has now (the listing is never served from the cache)."""
+    client.invalidate(client.url(PAYLOADS_PATH))
+    resp = client.get(PAYLOADS_PATH)
+    resp.raise_for_status()
+    data = resp.json()
+    names = data.get("payloads", []) if isinstance(data, dict) else data
+    return {os.path.basename(str(n)) for n in names}
+
+
+class LocalFile(NamedTuple):
+    path: str
+    name: str
+    size: int
+    mtime: float
+
+
+class SyncResult(NamedTuple):
+    uploaded: List[str]
+    skipped: Dict[str, str]  # name -> why
+    failed: Dict[str, str]  # name -> error
+    bytes_sent: int
+    elapsed_s: float
+    lost: Tuple[str, ...] = ()  # replaced: deleted on the server, then the upload failed
+
+    def summary(self):
+        parts = [f"{len(self.uploaded)} uploaded ({self.bytes_sent / 1e6:.1f} MB)", f"{len(self.skipped)} skipped"]
+        if self.failed:
+            parts.append(f"{len(self.failed)} failed: " + ", ".join(f"{n} ({e})" for n, e in list(self.failed.items())[:5]))
+        if self.lost:
+            parts.append(f"{len(self.lost)} deleted on the server and not uploaded again: " + ", ".join(self.lost))
+        return ", ".join(parts) + f" in {self.elapsed_s:.1f} s"
+
+
+class Manifest:
+    """name -> {sha256, size, mtime, uploaded_as} of finished uploads, saved after each one."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def record(self, name, sha256, size, mtime, uploaded_as):
+        with self._lock:
+            self.entries[name] = {"sha256": sha256, "size": size, "mtime": mtime, "uploaded_as": uploaded_as}
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)  # never a half-written manifest
+
+
+class _Progress:
+    """One self-overwriting stderr line: files, bytes, throughput."""
+
+    def __init__(self, files, total_bytes, stream=sys.stderr, interval=0.2):
+        self.files, self.total = files, total_bytes
+        self.done_files = self.sent = 0
+        self.stream = stream if stream is not None and stream.isatty() else None
+        self.interval = interval
+        self.start = self._last = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, nbytes=0, files=0):
+        with self._lock:
+            self.sent += nbytes
+            self.done_files += files
+            now = time.perf_counter()
+            if self.stream is None or (now - self._last < self.interval and not files):
+                return
+            self._last = now
+            rate = self.sent / max(now - self.start, 1e-6) / 1e6
+            self.stream.write(f"\r  {self.done_files}/{self.files} files  {self.sent / 1e6:,.0f}/"
+                              f"{self.total / 1e6:,.0f} MB  {rate:.1f} MB/s ")
+            self.stream.flush()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.write("\n")
+
+
+def scan(directory) -> List[LocalFile]:
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            files.append(LocalFile(path, name, st.st_size, st.st_mtime))
+    return files
+
+
+def sync_payloads(directory, client=None, workers=UPLOAD_WORKERS, hash_workers=HASH_WORKERS, replace=False,
+                  dry_run=False, manifest_path=None, progress: Optional[Callable] = None) -> SyncResult:
+    """Upload the payloads of `directory` Caldera doesn't have yet. See the module docstring."""
+    client = client or get_client()
+    start = time.perf_counter()
+    manifest = Manifest(manifest_path or os.path.join(directory, MANIFEST_NAME))
+    files = scan(directory)
+    on_server = server_payloads(client)
+
+    def digest(f):
+        known = manifest.get(f.name)
+        if known and known["size"] == f.size and known["mtime"] == f.mtime:
+            return known["sha256"]
+        return file_sha256(f.path)
+
+    with ThreadPoolExecutor(hash_workers) as pool:
+        hashes = dict(zip(files, pool.map(digest, files)))
+
+    todo, skipped, seen = [], {}, {}
+    for f in files:
+        sha = hashes[f]
+        if f.name in seen:
+            skipped[f.path] = "same file twice" if seen[f.name] == sha else "name taken by another file here"
+            continue
+        seen[f.name] = sha
+        known = manifest.get(f.name)
+        if f.name in on_server:
+            if known is None:
+                skipped[f.name] = "on the server"
+                continue
+            if known["sha256"] == sha:
+                skipped[f.name] = "up to date"
+                continue
+            if not replace:
+                skipped[f.name] = "changed locally, on the server (replace to upload)"
+                continue
+        todo.append(f)
+
+    if dry_run:
+        return SyncResult([f.name for f in todo], skipped, {}, 0, time.perf_counter() - start)
+
+    display = _Progress(len(todo), sum(f.size for f in todo)) if progress is None else None
+    report = progress or display.add
+    uploaded, failed, deleted = [], {}, set()
+
+    def upload(f):
+        if f.name in on_server:  # replace: Caldera renames a duplicate upload instead of overwriting
+            client.delete(f"{PAYLOADS_PATH}/{f.name}").raise_for_status()
+            deleted.add(f.name)
+        for attempt in range(UPLOAD_ATTEMPTS):
+            sent = [0]
+
+            def on_chunk(n):
+                sent[0] += n
+                report(n)
+            last = attempt == UPLOAD_ATTEMPTS - 1
+            try:
+                resp = upload_file(client, f.path, f.name, on_chunk)
+                if resp.status_code < 500 or last:  # 4xx won't get better by sending it again
+                    resp.raise_for_status()
+                    break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last:
+                    raise
+            report(-sent[0])
+            time.sleep(0.5 * 2 ** attempt)
+        data = resp.json() if resp.content else None
+        names = data.get("payloads", []) if isinstance(data, dict) else data or []
+        manifest.record(f.name, hashes[f], f.size, f.mtime, names[0] if names else f.name)
+        report(0, files=1)
+
+    with ThreadPoolExecutor(workers) as pool:
+        futures = {pool.submit(upload, f): f for f in todo}
+        for future in as_completed(futures):
+            f = futures[future]
+            try:
+                future.result()
+                uploaded.append(f.name)
+            except (requests.exceptions.RequestException, OSError, ValueError) as e:
+                failed[f.name] = f"{type(e).__name__}: {e}"
+    if display is not None:
+        display.close()
+    sent = sum(f.size for f in todo if f.name in set(uploaded))
+    lost = tuple(sorted(deleted.intersection(failed)))
+    return SyncResult(uploaded, skipped, failed, sent, time.perf_counter() - start, lost)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload a directory of payloads to Caldera")
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS)
+    parser.add_argument("--replace", action="store_true", help="re-upload payloads changed since the last sync")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    result = sync_payloads(args.directory, workers=args.workers, replace=args.replace, dry_run=args.dry_run)
+    print(("would upload: " + ", ".join(result.uploaded)) if args.dry_run else result.summary())
+    for name, why in result.skipped.items():
+        print(f"  skipped {name}: {why}")
+
+
+if __name__ == "__main__":
+    main()
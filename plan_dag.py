@@ -0,0 +1,179 @@
+"""Plan steps as a dependency DAG, so the steps that need nothing run at once.
+
+The controller works through a plan ("1. GET /api/v2/agents ... 2. GET
+/api/v2/operations ... 3. POST /api/v2/operations ...") one ReAct turn per
+step: an LLM call, then the HTTP call, then the next step. PlanDAG splits
+the plan into steps and works out what each one waits for:
+
+- a step whose path still has a placeholder ({id}, <paw>) or whose text
+  uses earlier output ("with that adversary", "from step 1") waits for the
+  step it names, else the latest earlier step on the same collection,
+  else every step before it;
+- a POST / PUT / PATCH / DELETE waits for every step before it, and every
+  later step waits for it, on its collection or not (a new operation
+  changes what /api/v2/agents/{paw} or a report returns too).
+
+prefetch() sends the ready steps (GETs with a concrete path and nothing to
+wait for) concurrently on the async client before the controller starts.
+The controller gets their results with the plan and only has to make the
+dependent calls; when every step was prefetched it isn't run at all.
+Only reads are run ahead of the LLM, so a dependency the text doesn't
+give away costs at most a repeated GET.
+"""
+import re
+import json
+from typing import Dict, List, NamedTuple, Tuple
+from async_client import Result, run_sync
+from caldera_client import MUTATING, collection_path
+from json_stream import DEFAULT_LIMIT, DEFAULT_MAX_CHARS, project
+from output_extractor import compile_instructions
+from route_index import PLAN_CALL_PATTERN
+
+PREFETCHED_NOTE = ("These plan steps were already executed, do not call them again; "
+                   "use their results and only make the remaining calls:")
+
+_PLACEHOLDER = re.compile(r"\{[^}]*\}|<[^>]*>|/:\w+")
+_STEP_REF = re.compile(r"\bsteps?\s+(\d+)", re.I)
+_REFERS = re.compile(
+    r"\b(previous|above|earlier|returned|result of|response of|from (it|them|the list|the response|the result)|"
+    r"with (it|them|that|those)|(each|every|all) of (them|those)|"
+    r"(that|those|these|the same|the found|the new|the created) (\w+ )?(ids?|paws?|names?|values?|operations?|"
+    r"agents?|adversar(y|ies)|abilit(y|ies)|links?|sources?|planners?|objectives?|facts?))\b",
+    re.I,
+)
+
+
+class PlanStep(NamedTuple):
+    number: int  # 1-based, in plan order
+    method: str
+    path: str  # as written in the plan, query string included
+    text: str  # the step's whole text
+    deps: Tuple[int, ...]  # numbers of the steps it waits for
+    needs_input: bool  # placeholder or reference to earlier output
+
+    @property
+    def purpose(self):
+        """What the step is for: "to list the agents whose platform is linux"."""
+        return self.text.split(self.path, 1)[-1].strip()
+
+    @property
+    def ready(self):
+        """Can be sent right away, without the controller LLM."""
+        return self.method == "GET" and not self.deps and not self.needs_input
+
+
+class PlanDAG:
+    """Steps of one plan with their dependencies."""
+
+    def __init__(self, steps: List[PlanStep]):
+        self.steps = steps
+        self._by_number = {step.number: step for step in steps}
+
+    @classmethod
+    def from_plan(cls, plan_str) -> "PlanDAG":
+        calls = list(PLAN_CALL_PATTERN.finditer(plan_str))
+        steps = []
+        last_on = {}  # collection -> number of the latest step on it
+        last_mutation = None  # number of the latest mutation, on any collection
+        for i, m in enumerate(calls):
+            method, path = m.group(1), m.group(2).rstrip(".,;")
+            end = calls[i + 1].start() if i + 1 < len(calls) else len(plan_str)
+            text = plan_str[m.start():end].strip()
+            text = re.sub(r"\s*\d+\.\s*$", "", text)  # the next step's "2." ends up here
+            number = i + 1
+            collection = collection_path(path.split("?")[0])
+            needs_input = bool(_PLACEHOLDER.search(path) or _REFERS.search(text) or _STEP_REF.search(text))
+            earlier = tuple(range(1, number))
+            if method in MUTATING:
+                deps = earlier
+            elif needs_input:
+                named = tuple(int(n) for n in _STEP_REF.findall(text) if 0 < int(n) < number)
+                deps = named or ((last_on[collection],) if collection in last_on else earlier)
+            else:
+                deps = ()
+            if last_mutation is not None and last_mutation not in deps:
+                deps = tuple(sorted(deps + (last_mutation,)))
+            steps.append(PlanStep(number, method, path, text, deps, needs_input))
+            last_on[collection] = number
+            if method in MUTATING:
+                last_mutation = number
+        return cls(steps)
+
+    def step(self, number) -> PlanStep:
+        return self._by_number[number]
+
+    def waves(self) -> List[List[int]]:
+        """Step numbers grouped by how many dependency levels come before them."""
+        level = {}
+        for step in self.steps:
+            level[step.number] = 1 + max((level[d] for d in step.deps), default=-1)
+        waves = [[] for _ in range(max(level.values(), default=-1) + 1)]
+        for number, n in level.items():
+            waves[n].append(number)
+        return waves
+
+    def critical_path(self, cost: Dict[int, float]) -> float:
+        """Time to finish every step with unlimited concurrency, `cost` per step number."""
+        finish = {}
+        for step in self.steps:
+            finish[step.number] = cost[step.number] + max((finish[d] for d in step.deps), default=0.0)
+        return max(finish.values(), default=0.0)
+
+    def sequential(self, cost: Dict[int, float]) -> float:
+        return sum(cost[step.number] for step in self.steps)
+
+    def describe(self) -> str:
+        return " | ".join(
+            " ".join(f"{n}:{self.step(n).method} {self.step(n).path}" for n in wave) for wave in self.waves()
+        )
+
+
+def prefetch(async_client, dag: PlanDAG) -> Dict[int, Result]:
+    """Send every ready step concurrently; results by step number."""
+    route_index = async_client.route_index()
+    ready = [step for step in dag.steps
+             if step.ready and route_index.match("GET", async_client.client.url(step.path)) is not None]
+    if not ready:
+        return {}
+
+    async def run():
+        try:
+            return await async_client.gather(async_client.request(step.method, step.path) for step in ready)
+        finally:
+            await async_client.client.aclose()  # run_sync's loop ends here, and its session with it
+    return {step.number: result for step, result in zip(ready, run_sync(run()))}
+
+
+def result_text(step: PlanStep, result: Result, limit=DEFAULT_LIMIT, max_chars=DEFAULT_MAX_CHARS) -> str:
+    """A prefetched response the way the model sees responses elsewhere (json_stream projection),
+    narrowed to the step's "whose ... is ..." filter or count when output_extractor can read one."""
+    if not result.ok:
+        return f"failed: {result.error}"
+    data = result.data
+    if data is None:
+        return f"HTTP {result.status}, no content"
+    if isinstance(data, str):
+        return data[:max_chars]
+    note = ""
+    extraction = compile_instructions(step.purpose)
+    if extraction is not None and isinstance(data, list) and not extraction.path:
+        if extraction.count:
+            counted = extraction.apply(data)
+            if counted is not None:
+                return counted
+        elif extraction.where:
+            kept = extraction.filter(data)
+            if kept:  # a filter nothing passes is more likely misread than the answer
+                condition = ", ".join(f"{k}={v}" for k, v in extraction.where.items())
+                note = f" ({len(kept)} of {len(data)} items where {condition})"
+                data = kept
+    return project([json.dumps(data, default=str)], limit=limit, max_chars=max_chars).to_text() + note
+
+
+def prefetched_text(dag: PlanDAG, results: Dict[int, Result], max_chars=DEFAULT_MAX_CHARS) -> str:
+    per_step = max(max_chars // max(len(results), 1), 500)
+    lines = []
+    for number, result in sorted(results.items()):
+        step = dag.step(number)
+        lines.append(f"{number}. {step.method} {step.path} -> {result_text(step, result, max_chars=per_step)}")
+    return "\n".join(lines)
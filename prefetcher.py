@@ -0,0 +1,274 @@
+"""Speculative GETs into the response cache while the LLM is thinking.
+
+A planner call on the self-hosted model takes seconds, and the HTTP side
+sits idle until the model says what to fetch. The Prefetcher guesses those
+GETs when the turn starts and warms them into the CalderaClient's
+ResponseCache in the background, so that the agent's own requests are
+cache hits. Predictions, most likely first:
+
+- the collections the message names ("agents", "which abilities ...",
+  KEYWORD_HINTS);
+- the operation or agent the conversation was last about (observe() reads
+  every message and answer), for "show its links" or "is it finished?";
+- the GET endpoints the endpoint retriever picks for the message.
+
+Only GETs the spec has and the cache keeps (ttl > 0) are predicted. Each
+turn has a strict budget: at most max_concurrent requests at a time,
+max_requests in all and max_bytes of bodies read; a response that would
+go over it is dropped. Entries that expire before the model gets to them
+(agents, operations: 5 s) are fetched again, within the same budget,
+until finish(). finish() also tells how many prefetches served at least
+one cache hit (used) and how many didn't (wasted).
+"""
+import re
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import requests
+from caldera_client import cache_key, get_client
+from caldera_planner import current_spec
+from route_index import RouteIndex
+
+MAX_CONCURRENT = 4  # of the client's pool of 16, the agent's requests need the rest
+MAX_REQUESTS = 12  # per turn, refreshes included
+MAX_BYTES = 8 * 1024 * 1024  # per turn, decoded body bytes
+MAX_PREDICTIONS = 6
+CHUNK_SIZE = 64 * 1024
+FINISH_JOIN_S = 0.5  # finish() waits this long for the turn's thread to notice it was stopped
+
+# Words of the message -> the collection the agent is about to list.
+KEYWORD_HINTS = (
+    (re.compile(r"\b(agents?|paws?|implants?|beacons?|hosts?)\b", re.I), "/api/v2/agents"),
+    (re.compile(r"\b(operations?|ops?|campaigns?)\b", re.I), "/api/v2/operations"),
+    (re.compile(r"\b(adversar(y|ies)|profiles?)\b", re.I), "/api/v2/adversaries"),
+    (re.compile(r"\b(abilit(y|ies)|tactics?|techniques?|T1\d{3}(\.\d{3})?)\b", re.I), "/api/v2/abilities"),
+    (re.compile(r"\bplanners?\b", re.I), "/api/v2/planners"),
+    (re.compile(r"\bobjectives?\b", re.I), "/api/v2/objectives"),
+    (re.compile(r"\b(sources?|facts?)\b", re.I), "/api/v2/sources"),
+    (re.compile(r"\bschedules?\b", re.I), "/api/v2/schedules"),
+    (re.compile(r"\bplugins?\b", re.I), "/api/v2/plugins"),
+    (re.compile(r"\bobfuscators?\b", re.I), "/api/v2/obfuscators"),
+)
+
+_UUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+_OPERATION_ID = re.compile(rf"\b(?:operations?|op)\b[^\n]{{0,60}}?\b({_UUID})\b|\"(?:operation_)?id\"\s*:\s*\"({_UUID})\"",
+                           re.I)
+_PAW = re.compile(r"\bpaw\b[\"'`]?\s*[:=]?\s*[\"'`]?([a-z0-9]{4,12})\b", re.I)
+# "show its links", "is it finished yet", "what about that operation"
+_FOLLOW_UP = re.compile(r"\b(it|its|that|this|same|again|there|them|those|now|still|yet)\b", re.I)
+_LINKS = re.compile(r"\b(links?|results?|commands?|outputs?|steps?|ran|runs?|executed|progress)\b", re.I)
+
+
+class Prefetcher:
+    """Warms the response cache with the GETs a turn is likely to make."""
+
+    def __init__(self, api_spec, client=None, endpoint_retriever=None, max_concurrent=MAX_CONCURRENT,
+                 max_requests=MAX_REQUESTS, max_bytes=MAX_BYTES, max_predictions=MAX_PREDICTIONS, refresh=True):
+        self.api_spec = api_spec
+        self.client = client or get_client()
+        self.cache = self.client.cache
+        self.endpoint_retriever = endpoint_retriever
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.max_predictions = max_predictions
+        self.refresh = refresh
+        self.last_operation = None
+        self.last_paw = None
+        self.last_subject = None  # "operation" or "agent", whichever was mentioned last
+        self.totals = Counter()
+        self._pool = ThreadPoolExecutor(max_concurrent, thread_name_prefix="prefetch")
+        self._spec = None
+        self._route_index = None
+        self._lock = threading.Lock()
+        # the running turn's counts; a thread only ever counts into the ones it was started with
+        self._turn = Counter()
+        self._warmed: Dict[int, list] = {}  # id(entry) -> [entry, used]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _routes(self):
+        spec = current_spec(self.api_spec)
+        if spec is not self._spec:
+            self._route_index = RouteIndex.from_spec(spec)
+            self._spec = spec
+        return self._route_index
+
+    def observe(self, text):
+        """Remember the operation / agent a message or an answer was about."""
+        text = str(text or "")
+        found = []
+        for m in _OPERATION_ID.finditer(text):
+            found.append((m.start(), "operation", (m.group(1) or m.group(2)).lower()))
+        for m in _PAW.finditer(text):
+            found.append((m.start(), "agent", m.group(1)))
+        for _, subject, value in sorted(found):
+            if subject == "operation":
+                self.last_operation = value
+            else:
+                self.last_paw = value
+            self.last_subject = subject
+
+    def predict(self, message) -> List[str]:
+        """Paths of the GETs `message` will most likely need, most likely first."""
+        self.observe(message)
+        paths = [path for pattern, path in KEYWORD_HINTS if pattern.search(message)]
+        follow_up = bool(_FOLLOW_UP.search(message))
+        if self.last_operation and (self.last_subject == "operation" and follow_up
+                                    or re.search(r"\b(operation|op)\b", message, re.I)):
+            paths.append(f"/api/v2/operations/{self.last_operation}")
+            if _LINKS.search(message):
+                paths.append(f"/api/v2/operations/{self.last_operation}/links")
+        if self.last_paw and (self.last_subject == "agent" and follow_up
+                              or re.search(r"\b(agent|paw)\b", message, re.I)):
+            paths.append(f"/api/v2/agents/{self.last_paw}")
+        if self.endpoint_retriever is not None:
+            paths += self._retrieved(message)
+        return [p for p in dict.fromkeys(paths) if self._worth_fetching(p)][: self.max_predictions]
+
+    def _retrieved(self, message):
+        try:
+            endpoints = self.endpoint_retriever.retrieve(current_spec(self.api_spec), message)
+        except Exception:
+            return []
+        paths = []
+        for name, _, _ in endpoints or ():
+            method, path = name.split(" ", 1)
+            if method != "GET":
+                continue
+            params = re.findall(r"\{(\w+)\}", path)
+            if not params:
+                paths.append(path)
+            elif len(params) == 1 and path.startswith("/api/v2/operations/") and self.last_operation:
+                paths.append(path.replace(f"{{{params[0]}}}", self.last_operation))
+            elif len(params) == 1 and path.startswith("/api/v2/agents/") and self.last_paw:
+                paths.append(path.replace(f"{{{params[0]}}}", self.last_paw))
+        return paths
+
+    def _worth_fetching(self, path):
+        url = self.client.url(path)
+        return self.cache is not None and self.cache.ttl_for(url) > 0 and \
+            self._routes().match("GET", url) is not None
+
+    def start(self, message) -> "Prefetcher":
+        """Predict (the message is observe()d too) and prefetch for this turn in the background;
+        call finish() when the turn is over."""
+        self.finish()
+        if self.cache is None:
+            return self
+        turn, warmed = Counter(), {}
+        with self._lock:
+            self._turn, self._warmed = turn, warmed
+        self._stop = threading.Event()
+        self.cache.listeners.append(self._on_hit)
+        self._thread = threading.Thread(target=self._run, args=(message, self._stop, turn, warmed), daemon=True,
+                                        name="prefetcher")
+        self._thread.start()
+        return self
+
+    def finish(self) -> Dict[str, int]:
+        """Stop prefetching (downloads in flight are dropped) and return the turn's counts."""
+        if self._thread is None:
+            return {}
+        self._stop.set()
+        if self._on_hit in self.cache.listeners:
+            self.cache.listeners.remove(self._on_hit)
+        # a download in flight stops at its next chunk; one stuck longer than this still only
+        # counts into its own turn's counts, not the next turn's
+        self._thread.join(FINISH_JOIN_S)
+        self._thread = None
+        with self._lock:
+            turn = Counter(self._turn)
+            turn["used"] = sum(used for _, used in self._warmed.values())
+            turn["wasted"] = turn["fetched"] - turn["used"]
+        self.totals.update(turn)
+        return dict(turn)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.totals)
+
+    def _on_hit(self, key, entry):
+        with self._lock:
+            warmed = self._warmed.get(id(entry))
+            if warmed is not None and warmed[0] is entry:
+                warmed[1] = True
+
+    def _run(self, message, stop, turn, warmed):
+        if not self.client.breaker.available:
+            return
+        pending = self.predict(message)  # the retriever's embedding call happens here, off the turn's path
+        due = [path for path in pending if self.cache.peek(cache_key(self.client.url(path))) is None]
+        with self._lock:
+            turn["predicted"] = len(pending)
+            turn["already_cached"] = len(pending) - len(due)
+        while due and not stop.is_set():
+            failed = {path for path, ok in zip(due, self._pool.map(
+                lambda path: self._fetch(path, stop, turn, warmed), due)) if not ok}
+            if not self.refresh or self._spent(turn):
+                return
+            # fetch again what expires before the agent got to it
+            entries = {path: self.cache.peek(cache_key(self.client.url(path))) for path in pending
+                       if path not in failed}
+            pending = [path for path, entry in entries.items() if entry is not None and not self._used(entry, warmed)]
+            if not pending:
+                return
+            stop.wait(max(min(entries[path].expires for path in pending) - time.monotonic(), 0) + 0.05)
+            due = [path for path in pending if self.cache.peek(cache_key(self.client.url(path))) is None]
+
+    def _spent(self, turn):
+        with self._lock:
+            return turn["requests"] >= self.max_requests or turn["bytes"] >= self.max_bytes
+
+    def _used(self, entry, warmed):
+        with self._lock:
+            state = warmed.get(id(entry))
+            return state is not None and state[1]
+
+    def _fetch(self, path, stop, turn, warmed) -> bool:
+        """Warm one GET into `turn`'s budget; False when it shouldn't be tried again this turn."""
+        url = self.client.url(path)
+        key = cache_key(url)
+        with self._lock:
+            if stop.is_set():  # queued in the pool when the turn ended
+                return False
+            if turn["requests"] >= self.max_requests or turn["bytes"] >= self.max_bytes:
+                turn["over_budget"] += 1
+                return False
+            turn["requests"] += 1
+        try:
+            with self.client.untracked():  # a guess, not something the turn read
+                resp = self.client.get(url, stream=True)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                turn["failed"] += 1
+            return False
+        with resp:
+            if resp.status_code != 200:
+                with self._lock:
+                    turn["failed"] += 1
+                return False
+            # wire size, the decoded body is no smaller
+            if int(resp.headers.get("Content-Length") or 0) > self.max_bytes:
+                with self._lock:
+                    turn["over_budget"] += 1
+                return False
+            body = bytearray()
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                with self._lock:
+                    if stop.is_set():
+                        turn["cancelled"] += 1
+                        return False
+                    if turn["bytes"] + len(chunk) > self.max_bytes:
+                        turn["over_budget"] += 1
+                        return False
+                    turn["bytes"] += len(chunk)
+                body += chunk
+        self.cache.put(key, resp.status_code, resp.headers, bytes(body), url, resp.encoding)
+        entry = self.cache.peek(key)
+        if entry is None:  # bigger than the whole cache
+            return False
+        with self._lock:
+            warmed[id(entry)] = [entry, False]
+            turn["fetched"] += 1
+        return True
@@ -0,0 +1,288 @@
+"""Client-side paging over Caldera's unpaged collections.
+
+/api/v2/abilities, /api/v2/facts and /api/v2/operations/{id}/links come
+back as one array of thousands of items, which the agent can neither read
+whole nor ask for a second page of. Pager.open() fetches such a collection
+once, streams it into a ResultSet (each item kept as its compact JSON
+bytes, not as dicts) and returns a handle with the first page.
+next_page / filter / count then work on the stored items without another
+request. filter() makes a view (item indices into the same storage) with
+its own handle. Result sets are evicted least recently used once all of
+them together exceed max_bytes; a collection stays while a view of it does.
+"""
+import os
+import re
+import json
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from typing import List, NamedTuple, Union
+from langchain_core.tools import Tool
+from caldera_client import get_client
+from caldera_planner import current_spec
+from json_stream import iter_elements, parse_fields, project_item
+from route_index import RouteIndex
+
+PAGE_SIZE = 20
+PAGE_CHARS = 4000
+MAX_BYTES = int(os.getenv("CALDERA_PAGER_MB", 64)) * 1024 * 1024
+ITEM_OVERHEAD = 41  # bytes object header + list slot, per stored item
+
+_CONDITION = re.compile(r"\s*([\w.-]+)\s*(!=|>=|<=|=|~|>|<)\s*(.+?)\s*$")
+# Not "and" or ",": they are in values ("name=Search and Destroy", "description~foo, bar").
+CONDITION_SEPARATOR = ";"
+
+
+class PagerError(ValueError):
+    pass
+
+
+class Condition(NamedTuple):
+    field: str
+    op: str
+    value: str
+
+    def test(self, item):
+        actual = _get(item, self.field)
+        if actual is None:
+            return self.op == "!="
+        if self.op in (">", "<", ">=", "<="):
+            try:
+                a, b = float(actual), float(self.value)
+            except (TypeError, ValueError):
+                a, b = str(actual), self.value
+            return {">": a > b, "<": a < b, ">=": a >= b, "<=": a <= b}[self.op]
+        text = str(actual).lower()
+        value = self.value.lower()
+        if self.op == "~":
+            return value in text
+        return (text == value) == (self.op == "=")
+
+
+def parse_expr(expr: Union[str, List[str]]) -> List[Condition]:
+    """'tactic=discovery; name~dump' (or the list of conditions) -> [Condition(...), ...];
+    = != ~ (contains) > < >= <=."""
+    parts = expr.split(CONDITION_SEPARATOR) if isinstance(expr, str) else expr or []
+    conditions = []
+    for part in parts:
+        if not part.strip():
+            continue
+        m = _CONDITION.match(part)
+        if m is None:
+            raise PagerError(f"can't read condition {part!r}, use field=value, field!=value, field~text, field>n")
+        conditions.append(Condition(m.group(1), m.group(2), m.group(3).strip("\"'")))
+    if not conditions:
+        raise PagerError("empty filter expression")
+    return conditions
+
+
+def _get(item, dotted):
+    for part in dotted.split("."):
+        if not isinstance(item, dict):
+            return None
+        item = item.get(part)
+    return item
+
+
+class ResultSet:
+    """Items of one fetched collection, or a filtered view of one."""
+
+    def __init__(self, handle, label, items, rows=None, parent=None, fields=None, truncated=False):
+        self.handle = handle
+        self.label = label  # "GET /api/v2/abilities", "GET /api/v2/abilities | tactic=discovery"
+        self.items: List[bytes] = items  # shared with views
+        self.rows = rows  # array of item indices for a view, None for all items
+        self.parent = parent
+        self.fields = fields
+        self.truncated = truncated
+        self.cursor = 0
+
+    def __len__(self):
+        return len(self.items) if self.rows is None else len(self.rows)
+
+    @property
+    def nbytes(self):
+        if self.rows is not None:
+            return self.rows.itemsize * len(self.rows)
+        return sum(len(i) for i in self.items) + ITEM_OVERHEAD * len(self.items)
+
+    def item(self, n):
+        return json.loads(self.items[n if self.rows is None else self.rows[n]])
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self.item(n)
+
+
+class Pager:
+    """Result sets by handle, LRU under a memory cap."""
+
+    def __init__(self, api_spec, client=None, max_bytes=MAX_BYTES, page_size=PAGE_SIZE, page_chars=PAGE_CHARS):
+        self.api_spec = api_spec
+        self.client = client or get_client()
+        self.max_bytes = max_bytes
+        self.page_size = page_size
+        self.page_chars = page_chars
+        self._sets: "OrderedDict[str, ResultSet]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next = 0
+        self._spec = None
+        self._route_index = None
+
+    def _routes(self):
+        spec = current_spec(self.api_spec)
+        if spec is not self._spec:
+            self._route_index = RouteIndex.from_spec(spec)
+            self._spec = spec
+        return self._route_index
+
+    def _handle(self):
+        with self._lock:
+            self._next += 1
+            return f"rs{self._next}"
+
+    def get(self, handle) -> ResultSet:
+        with self._lock:
+            result_set = self._sets.get(str(handle).strip())
+            if result_set is None:
+                raise PagerError(f"unknown or expired handle {handle!r}, open the collection again")
+            self._sets.move_to_end(result_set.handle)
+            return result_set
+
+    def _add(self, result_set):
+        with self._lock:
+            self._sets[result_set.handle] = result_set
+            total = sum(s.nbytes for s in self._sets.values())
+            while total > self.max_bytes:
+                # the views share their collection's items: it is pinned while one of them is alive
+                pinned = {result_set.handle} | {s.parent for s in self._sets.values() if s.parent}
+                handle = next((h for h in self._sets if h not in pinned), None)
+                if handle is None:
+                    break
+                total -= self._sets.pop(handle).nbytes
+
+    def stats(self):
+        with self._lock:
+            return {"sets": len(self._sets), "bytes": sum(s.nbytes for s in self._sets.values())}
+
+    # -- operations ---------------------------------------------------------
+
+    def open(self, path, params=None, fields=None) -> str:
+        """Fetch a collection once; its handle and first page."""
+        url = self.client.url(path)
+        if self._routes().match("GET", url) is None:
+            raise PagerError(f"GET {path} endpoint does not exist.")
+        response = self.client.get(url, params=params, stream=True)
+        try:
+            if response.status_code >= 400:
+                raise PagerError(f"GET {path} -> HTTP {response.status_code}: {response.text[:300]}")
+            items, size, truncated = [], 0, False
+            for text in iter_elements(response.iter_content(64 * 1024)):
+                data = text.strip().encode()
+                size += len(data) + ITEM_OVERHEAD
+                if size > self.max_bytes:
+                    truncated = True
+                    break
+                items.append(data)
+        finally:
+            response.close()
+        result_set = ResultSet(self._handle(), f"GET {path}", items, fields=parse_fields(fields), truncated=truncated)
+        self._add(result_set)
+        return self._page(result_set)
+
+    def next_page(self, handle, fields=None) -> str:
+        result_set = self.get(handle)
+        if result_set.cursor >= len(result_set):
+            return f"{handle}: no more items ({len(result_set)} in total)"
+        return self._page(result_set, parse_fields(fields))
+
+    def filter(self, handle, expr, fields=None) -> str:
+        """New view of the items matching `expr` (conditions separated by ';', or a list of them),
+        its handle and first page."""
+        source = self.get(handle)
+        conditions = parse_expr(expr)
+        base = source.rows if source.rows is not None else range(len(source.items))
+        rows = array("I", (i for i in base if all(c.test(json.loads(source.items[i])) for c in conditions)))
+        label = "; ".join(f"{c.field}{c.op}{c.value}" for c in conditions)
+        view = ResultSet(self._handle(), f"{source.label} | {label}", source.items, rows,
+                         parent=source.parent or source.handle, fields=parse_fields(fields) or source.fields,
+                         truncated=source.truncated)
+        self._add(view)
+        return self._page(view)
+
+    def count(self, handle, group_by=None, top=30) -> str:
+        result_set = self.get(handle)
+        if not group_by:
+            return f"{handle}: {len(result_set)} items{_cut(result_set)}"
+        counts = Counter(_group_key(_get(item, group_by)) for item in result_set)
+        shown = dict(counts.most_common(top))
+        text = f"{handle}: {len(result_set)} items by {group_by}: " + json.dumps(shown, ensure_ascii=False)
+        if len(counts) > top:
+            text += f" (and {len(counts) - top} more values)"
+        return text + _cut(result_set)
+
+    def _page(self, result_set, fields=None) -> str:
+        fields = fields or result_set.fields
+        start, page, chars = result_set.cursor, [], 2
+        while result_set.cursor < len(result_set) and len(page) < self.page_size:
+            item = project_item(result_set.item(result_set.cursor), fields)
+            size = len(json.dumps(item, separators=(",", ":"), default=str, ensure_ascii=False)) + 1
+            if page and chars + size > self.page_chars:
+                break
+            page.append(item)
+            chars += size
+            result_set.cursor += 1
+        end, total = result_set.cursor, len(result_set)
+        text = json.dumps(page, separators=(",", ":"), default=str, ensure_ascii=False)
+        note = f"{result_set.handle}: {result_set.label}, items {start + 1}-{end} of {total}" if page else \
+            f"{result_set.handle}: {result_set.label}, no items"
+        if end < total:
+            note += ", next_page for more"
+        return f"{text}\n({note}{_cut(result_set)})"
+
+
+def _cut(result_set):
+    return ", collection cut at the pager memory cap" if result_set.truncated else ""
+
+
+def _group_key(value):
+    if isinstance(value, (dict, list, bool)) or value is None:
+        return json.dumps(value, sort_keys=True, default=str)
+    return str(value)
+
+
+def pager_text(pager, request):
+    """Run one pager operation from the tool's json (str or dict)."""
+    if isinstance(request, str):
+        request = json.loads(request.strip().strip("`").removeprefix("json"))
+    if "open" in request:
+        return pager.open(request["open"], request.get("params"), request.get("fields"))
+    if "next_page" in request:
+        return pager.next_page(request["next_page"], request.get("fields"))
+    if "filter" in request:
+        return pager.filter(request["filter"], request.get("expr", ""), request.get("fields"))
+    if "count" in request:
+        return pager.count(request["count"], request.get("group_by"))
+    raise PagerError("expected one of open, next_page, filter, count")
+
+
+PAGER_TOOL_NAME = "api_pager"
+PAGER_TOOL_DESCRIPTION = (
+    "Use this for large collections (abilities, facts, an operation's links): fetch once, then page, filter "
+    "and count without re-fetching. Input is json, one of: {\"open\": \"/api/v2/abilities\", \"fields\": "
+    "\"ability_id,name,tactic\"} -> handle and first page; {\"next_page\": \"rs1\"}; {\"filter\": \"rs1\", "
+    "\"expr\": \"tactic=discovery; name~dump\"} -> new handle (conditions separated by ;, ops = != ~ > <); "
+    "{\"count\": \"rs1\", \"group_by\": \"tactic\"}."
+)
+
+
+def create_pager_tool(pager) -> Tool:
+    """Single string input tool, usable by the planner's ZeroShotAgent orchestrator."""
+
+    def _run(request: str) -> str:
+        try:
+            return pager_text(pager, request)
+        except (PagerError, ValueError, KeyError) as e:
+            return f"Pager error: {e}"
+
+    return Tool(name=PAGER_TOOL_NAME, description=PAGER_TOOL_DESCRIPTION, func=_run)
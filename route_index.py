@@ -0,0 +1,135 @@
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+# Same shape the langchain controller extracts from a plan: "GET /api/v2/agents".
+PLAN_CALL_PATTERN = re.compile(r"\b(GET|POST|PATCH|DELETE|PUT)\s+(/\S+)")
+
+
+class RouteMatch(NamedTuple):
+    name: str  # "GET /api/v2/agents/{paw}", as in ReducedOpenAPISpec.endpoints
+    method: str
+    template: str
+    params: Dict[str, str]
+
+
+class _Node:
+    __slots__ = ("literals", "param", "param_name", "endpoint")
+
+    def __init__(self):
+        self.literals = {}
+        self.param = None
+        self.param_name = None
+        self.endpoint = None
+
+
+def split_path(path):
+    """'/api/v2/agents/abc/?x=1' -> ['api', 'v2', 'agents', 'abc']"""
+    path = path.split("?", 1)[0].split("#", 1)[0]
+    # Plans write calls inline in prose ("GET /api/v2/agents."), drop the punctuation.
+    path = path.rstrip(".,;:)]'\"`")
+    while path.endswith("}") and path.count("}") > path.count("{"):
+        path = path[:-1].rstrip(".,;:)]'\"`")
+    if "://" in path:
+        path = "/" + path.split("://", 1)[1].partition("/")[2]
+    return [segment for segment in path.split("/") if segment]
+
+
+class RouteIndex:
+    """Method-keyed path trie over the spec endpoints.
+
+    Lookups walk one segment at a time, preferring a literal segment over a
+    templated one, so "GET /api/v2/operations/summary" resolves to the summary
+    endpoint and never to "/api/v2/operations/{id}". Each lookup returns at
+    most one endpoint.
+    """
+
+    def __init__(self, endpoint_names=()):
+        self._roots: Dict[str, _Node] = {}
+        self.names: List[str] = []
+        for name in endpoint_names:
+            self.add(name)
+
+    @classmethod
+    def from_spec(cls, api_spec):
+        return cls(name for name, _, _ in api_spec.endpoints)
+
+    def add(self, name):
+        method, template = name.split(" ", 1)
+        node = self._roots.setdefault(method.upper(), _Node())
+        for segment in split_path(template):
+            if segment.startswith("{") and segment.endswith("}"):
+                if node.param is None:
+                    node.param = _Node()
+                    node.param_name = segment[1:-1]
+                node = node.param
+            else:
+                node = node.literals.setdefault(segment, _Node())
+        node.endpoint = name
+        self.names.append(name)
+
+    def match(self, method, path) -> Optional[RouteMatch]:
+        root = self._roots.get(method.upper())
+        if root is None:
+            return None
+        segments = split_path(path)
+        params = {}
+        name = self._walk(root, segments, 0, params)
+        if name is None:
+            return None
+        return RouteMatch(name, method.upper(), name.split(" ", 1)[1], params)
+
+    def match_name(self, endpoint_name) -> Optional[RouteMatch]:
+        method, _, path = endpoint_name.strip().partition(" ")
+        return self.match(method, path.strip())
+
+    def _walk(self, node, segments, i, params):
+        if i == len(segments):
+            return node.endpoint
+        child = node.literals.get(segments[i])
+        if child is not None:
+            found = self._walk(child, segments, i + 1, params)
+            if found is not None:
+                return found
+        if node.param is not None:
+            params[node.param_name] = segments[i]
+            found = self._walk(node.param, segments, i + 1, params)
+            if found is not None:
+                return found
+            del params[node.param_name]
+        return None
+
+    def match_plan(self, plan_str) -> List[RouteMatch]:
+        """Endpoints referenced by a planner plan, in order, without duplicates.
+
+        Raises ValueError for a call that matches no endpoint, like the
+        langchain controller does.
+        """
+        matches, seen = [], set()
+        for method, path in PLAN_CALL_PATTERN.findall(plan_str):
+            match = self.match(method, path)
+            if match is None:
+                raise ValueError(f"{method} {path.split('?')[0]} endpoint does not exist.")
+            if match.name not in seen:
+                seen.add(match.name)
+                matches.append(match)
+        return matches
+
+
+def _route_path(name):
+    return name.split(" ", 1)[1].rstrip("/")
+
+
+def related_routes(names, hits):
+    """`hits` plus every endpoint on the parent or a direct child path of a hit."""
+    by_path = {}
+    for name in names:
+        by_path.setdefault(_route_path(name), []).append(name)
+    selected = dict.fromkeys(hits)
+    for hit in hits:
+        path = _route_path(hit)
+        parent = path.rsplit("/", 1)[0]
+        for other_path, others in by_path.items():
+            if other_path == parent or other_path.rsplit("/", 1)[0] == path:
+                selected.update(dict.fromkeys(others))
+    # Keep the spec's ordering, the planner prompt reads better grouped by route.
+    return [name for name in names if name in selected]
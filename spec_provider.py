@@ -0,0 +1,188 @@
+import os
+import json
+import logging
+import threading
+import requests
+from load_spec import SPEC_FILE, SPEC_CACHE_DIR, load_spec_bytes, spec_cache_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CALDERA_URL = "http://12.1.0.15:8888"
+SPEC_PATH = "/api/docs/swagger.json"
+HEALTH_PATH = "/api/v2/health"
+LIVE_SPEC_FILE = "live_swagger.json"
+LIVE_META_FILE = "live_swagger.meta.json"
+
+
+class SpecProvider:
+    """Serves the reduced Caldera spec and keeps it in sync with the server.
+
+    The spec is available immediately from disk (last live spec fetched, else
+    the bundled SPEC_FILE). A background thread then revalidates it against
+    the server: /api/v2/health's version and plugin list are checked first,
+    and the swagger document is only fetched with If-None-Match /
+    If-Modified-Since when those changed. A new reduced spec is swapped in
+    atomically, and only when the document bytes actually differ.
+
+    Quacks like a ReducedOpenAPISpec (servers / description / endpoints /
+    docs / render_docs all read the current spec), so it can be handed to
+    caldera_planner.create_openapi_agent directly.
+    """
+
+    def __init__(self, base_url=None, token=None, spec_file=SPEC_FILE, cache_dir=SPEC_CACHE_DIR,
+                 interval=None, timeout=10):
+        self.base_url = (base_url or os.getenv("CALDERA_WEB_URL") or DEFAULT_CALDERA_URL).rstrip("/")
+        self.headers = {"KEY": f"{token or os.getenv('CALDERA_API_TOKEN')}"}
+        self.cache_dir = cache_dir
+        self.interval = interval if interval is not None else float(os.getenv("CALDERA_SPEC_REFRESH_SECONDS", 300))
+        self.timeout = timeout
+        self.version = 0  # bumped on every swap
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+        self._meta = self._read_meta()
+        live_path = os.path.join(cache_dir, LIVE_SPEC_FILE)
+        path = live_path if os.path.exists(live_path) and self._meta else spec_file
+        with open(path, "rb") as f:
+            spec_bytes = f.read()
+        self._swap(spec_bytes)
+
+    # ReducedOpenAPISpec interface, always against the current spec.
+    def current(self):
+        return self._spec
+
+    @property
+    def servers(self):
+        return self._spec.servers
+
+    @property
+    def description(self):
+        return self._spec.description
+
+    @property
+    def endpoints(self):
+        return self._spec.endpoints
+
+    @property
+    def raw_spec(self):
+        """The un-reduced swagger document of the current spec."""
+        return self._raw_spec
+
+    def docs(self, name):
+        return self._spec.docs(name)
+
+    def render_docs(self, name):
+        return self._spec.render_docs(name)
+
+    def on_change(self, callback):
+        """Call `callback(reduced_spec)` after every swap."""
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="caldera-spec-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving what we have, the server may just be restarting.
+                logger.warning("Caldera spec revalidation failed: %s", e)
+            if self._stop.wait(self.interval):
+                return
+
+    def refresh(self):
+        """Revalidate once against the server. Returns True if the spec was swapped."""
+        fingerprint = self._health_fingerprint()
+        if fingerprint is not None and fingerprint == self._meta.get("fingerprint"):
+            return False
+
+        headers = dict(self.headers)
+        if self._meta.get("etag"):
+            headers["If-None-Match"] = self._meta["etag"]
+        if self._meta.get("last_modified"):
+            headers["If-Modified-Since"] = self._meta["last_modified"]
+        resp = requests.get(f"{self.base_url}{SPEC_PATH}", headers=headers, timeout=self.timeout)
+        if resp.status_code == 304:
+            self._save_meta(fingerprint=fingerprint)
+            return False
+        resp.raise_for_status()
+
+        spec_bytes = resp.content
+        validators = {
+            "fingerprint": fingerprint,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+        }
+        changed = spec_cache_key(spec_bytes) != self._key
+        # The validators only go to disk with the spec they belong to: saved after a failed
+        # write, the next check would get a 304 and the new spec would never be written.
+        written = self._write_live_spec(spec_bytes)
+        if changed:
+            self._swap(spec_bytes)
+            logger.info("Caldera spec changed on the server, reloaded (v%s)", self.version)
+        if written:
+            self._save_meta(**validators)
+        return changed
+
+    def _health_fingerprint(self):
+        try:
+            resp = requests.get(f"{self.base_url}{HEALTH_PATH}", headers=self.headers, timeout=self.timeout)
+            resp.raise_for_status()
+            health = resp.json()
+        except (requests.RequestException, ValueError):
+            return None
+        # Plugin upgrades change the API without bumping Caldera's version.
+        plugins = sorted(
+            f"{p.get('name')}:{p.get('enabled')}" for p in health.get("plugins", []) if isinstance(p, dict)
+        )
+        return json.dumps([health.get("version"), plugins])
+
+    def _swap(self, spec_bytes):
+        # Build outside the lock, readers keep using the old spec meanwhile.
+        reduced = load_spec_bytes(spec_bytes, cache_dir=self.cache_dir)
+        raw_spec = json.loads(spec_bytes)
+        with self._lock:
+            self._spec = reduced
+            self._raw_spec = raw_spec
+            self._key = spec_cache_key(spec_bytes)
+            self.version += 1
+        for callback in list(self._listeners):
+            callback(reduced)
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.cache_dir, LIVE_META_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_meta(self, **meta):
+        self._meta.update(meta)
+        self._write_atomic(LIVE_META_FILE, json.dumps(self._meta).encode())
+
+    def _write_live_spec(self, spec_bytes):
+        return self._write_atomic(LIVE_SPEC_FILE, spec_bytes)
+
+    def _write_atomic(self, name, data):
+        """True once `data` is in place."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, name)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            logger.warning("Could not persist %s: %s", name, e)
+            return False
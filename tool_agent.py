@@ -0,0 +1,306 @@
+"""Caldera agent on the model's native tool calling: one loop, typed tools.
+
+caldera_planner.create_openapi_agent stacks an orchestrator ZeroShotAgent,
+a planner LLMChain and a controller ZeroShotAgent per plan. Each of them
+writes "Action: / Action Input:" text that has to parse, and every hop
+between them is another LLM call. create_tool_calling_agent binds typed
+tools to the model instead (bind_tools; Gemini, OpenAI and Ollama all
+support it) and loops: the model answers with tool calls, they run
+(concurrently when it asks for several at once) and go back as
+ToolMessages, until it answers without one. astream() is the same loop on
+the event loop: the model's tokens, each tool call and each result as they
+come, requests through the AsyncCalderaClient when there is one.
+
+The system prompt carries the compact docs of the endpoints the endpoint
+retriever picks for the query, or the endpoint list without one, so most
+requests need no docs lookup first; endpoint_docs is there for the rest.
+"""
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Literal, NamedTuple, Optional, Sequence
+from pydantic import BaseModel, Field
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage, message_chunk_to_message
+from langchain_core.tools import BaseTool, StructuredTool
+from caldera_client import get_client
+from caldera_planner import CONTROLLER_DOCS_TOKEN_BUDGET, current_spec, endpoint_docs
+from circuit_breaker import CircuitOpenError
+from json_stream import DEFAULT_LIMIT, DEFAULT_MAX_CHARS, project, response_text
+from route_index import RouteIndex
+
+REQUEST_TOOL_NAME = "caldera_request"
+DOCS_TOOL_NAME = "endpoint_docs"
+MAX_STEPS = 15  # model turns per query
+MAX_PARALLEL = 8  # tool calls of one model turn run at the same time
+MUTATING = ("POST", "PUT", "PATCH", "DELETE")
+
+ENGINE_PROMPT = """You work through the Caldera REST API with the tools you are given.
+- caldera_request calls one endpoint. Fill path parameters in yourself (/api/v2/operations/<id>/links),
+  ask for the fields you need (fields="paw,host") and raise limit only when you need more items.
+- Make independent requests in the same turn, they run at the same time.
+- endpoint_docs shows the parameters and body of an endpoint not documented below.
+- Once you have what the user asked for, answer in plain text without calling a tool.
+"""
+
+
+class RequestArgs(BaseModel):
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"] = Field(description="HTTP method")
+    path: str = Field(description="API path with parameters filled in, e.g. /api/v2/agents/abc123")
+    params: Optional[Dict[str, Any]] = Field(default=None, description="Query parameters")
+    body: Optional[Dict[str, Any]] = Field(default=None, description="JSON body for POST / PUT / PATCH")
+    fields: str = Field(default="", description="Comma-separated fields to keep from each item, e.g. 'paw,host'")
+    limit: int = Field(default=DEFAULT_LIMIT, description="Maximum number of list items to return")
+
+
+class DocsArgs(BaseModel):
+    endpoint: str = Field(description="Endpoint as listed, e.g. 'POST /api/v2/operations'")
+
+
+class AgentEvent(NamedTuple):
+    kind: str  # "token", "tool_call", "tool_result" or "answer"
+    text: str = ""
+    call: Optional[Dict[str, Any]] = None  # {"name", "args", "id"} of tool_call / tool_result
+
+
+class CalderaTools:
+    """caldera_request and endpoint_docs over the shared client, checked against the spec."""
+
+    def __init__(self, api_spec, client=None, allowed_operations: Sequence[str] = ("GET", "POST"),
+                 allow_dangerous_requests=False, docs_token_budget=CONTROLLER_DOCS_TOKEN_BUDGET, async_client=None):
+        self.api_spec = api_spec
+        self.client = client or get_client()
+        self.async_client = async_client
+        self.allowed = {m.upper() for m in allowed_operations}
+        self.allow_dangerous_requests = allow_dangerous_requests
+        self.docs_token_budget = docs_token_budget
+        self._spec = None
+        self._route_index = None
+
+    def _routes(self):
+        spec = current_spec(self.api_spec)
+        if spec is not self._spec:
+            self._route_index = RouteIndex.from_spec(spec)
+            self._spec = spec
+        return self._route_index
+
+    def _refused(self, method, path) -> Optional[str]:
+        if method not in self.allowed or (method in MUTATING and not self.allow_dangerous_requests):
+            return f"{method} requests are not allowed here."
+        if self._routes().match(method, self.client.url(path)) is None:
+            return f"{method} {path} endpoint does not exist, check the endpoint list."
+        return None
+
+    def request(self, method, path, params=None, body=None, fields="", limit=DEFAULT_LIMIT) -> str:
+        method = method.upper()
+        refused = self._refused(method, path)
+        if refused:
+            return refused
+        url = self.client.url(path)
+        try:
+            response = self.client.request(method, url, params=params, json=body if method in MUTATING else None,
+                                           stream=True)
+        except CircuitOpenError as e:
+            return f"Not sent, {e}. Stop and tell the user the Caldera server is down."
+        status = response.status_code
+        text = response_text(response, fields=fields, limit=limit)
+        return f"HTTP {status}\n{text}" if text else f"HTTP {status} (no content)"
+
+    async def arequest(self, method, path, params=None, body=None, fields="", limit=DEFAULT_LIMIT) -> str:
+        """request() on the event loop: through the async client, else in a worker thread."""
+        if self.async_client is None:
+            return await asyncio.to_thread(self.request, method, path, params, body, fields, limit)
+        method = method.upper()
+        refused = self._refused(method, path)
+        if refused:
+            return refused
+        result = await self.async_client.request(method, path, params=params,
+                                                 body=body if method in MUTATING else None)
+        if result.status == 0:
+            if (result.error or "").startswith("CircuitOpenError"):
+                return f"Not sent, {result.error}. Stop and tell the user the Caldera server is down."
+            return f"Request failed: {result.error}"
+        data = result.data
+        if data is None:
+            return f"HTTP {result.status} (no content)"
+        if isinstance(data, str):
+            text = data if len(data) <= DEFAULT_MAX_CHARS else \
+                data[:DEFAULT_MAX_CHARS] + f"\n({len(data) - DEFAULT_MAX_CHARS} more characters omitted)"
+        else:
+            text = project([json.dumps(data, default=str)], fields, limit, DEFAULT_MAX_CHARS).to_text()
+        return f"HTTP {result.status}\n{text}"
+
+    def docs(self, endpoint) -> str:
+        spec = current_spec(self.api_spec)
+        name = " ".join(endpoint.split())
+        method, _, path = name.partition(" ")
+        match = self._routes().match(method.upper(), self.client.url(path)) if path else None
+        if match is None:
+            return f"Unknown endpoint {endpoint!r}, use 'METHOD /api/v2/...' as listed."
+        return endpoint_docs(spec, match.name, "compact", self.docs_token_budget)
+
+    def tools(self) -> List[BaseTool]:
+        return [
+            StructuredTool.from_function(
+                func=self.request, coroutine=self.arequest, name=REQUEST_TOOL_NAME, args_schema=RequestArgs,
+                description="Call one Caldera API endpoint; JSON responses come back projected to `fields`.",
+            ),
+            StructuredTool.from_function(
+                func=self.docs, name=DOCS_TOOL_NAME, args_schema=DocsArgs,
+                description="Parameters and request body of one Caldera API endpoint.",
+            ),
+        ]
+
+
+def _text(content):
+    """Message content as text (Gemini and Anthropic may return a list of parts)."""
+    if isinstance(content, str):
+        return content
+    return "".join(p if isinstance(p, str) else p.get("text", "") for p in content or [])
+
+
+class ToolCallingAgent:
+    """invoke({"input": ...}) -> {"output": ...} like the planner's AgentExecutor."""
+
+    def __init__(self, llm: BaseChatModel, api_spec, tools: Sequence[BaseTool], system_prompt="",
+                 endpoint_retriever=None, docs_token_budget=CONTROLLER_DOCS_TOKEN_BUDGET, max_steps=MAX_STEPS,
+                 verbose=False):
+        self.llm = llm
+        self.api_spec = api_spec
+        self.tools = list(tools)
+        self.system_prompt = system_prompt
+        self.endpoint_retriever = endpoint_retriever
+        self.docs_token_budget = docs_token_budget
+        self.max_steps = max_steps
+        self.verbose = verbose
+        self._by_name = {tool.name: tool for tool in self.tools}
+        self._model = None
+
+    def endpoints_section(self, query) -> str:
+        spec = current_spec(self.api_spec)
+        endpoints = self.endpoint_retriever.retrieve(spec, query) if self.endpoint_retriever is not None else None
+        if endpoints is None:
+            lines = [f"- {name}: {(description or '').splitlines()[0][:100]}" if description else f"- {name}"
+                     for name, description, _ in spec.endpoints]
+            return "Endpoints:\n" + "\n".join(lines)
+        budget = self.docs_token_budget // len(endpoints) if self.docs_token_budget and endpoints else None
+        return "Endpoints for this request:\n" + "\n".join(
+            endpoint_docs(spec, name, "compact", budget) for name, _, _ in endpoints
+        )
+
+    def _messages(self, query):
+        if self._model is None:
+            self._model = self.llm.bind_tools(self.tools)
+        system = "\n\n".join(p for p in (self.system_prompt.strip(), ENGINE_PROMPT, self.endpoints_section(query)) if p)
+        return [SystemMessage(system), HumanMessage(query)]
+
+    def invoke(self, inputs, config=None, **kwargs) -> Dict[str, Any]:
+        query = inputs["input"] if isinstance(inputs, dict) else str(inputs)
+        messages = self._messages(query)
+        steps = []
+        for _ in range(self.max_steps):
+            reply = self._model.invoke(messages, config=config)
+            messages.append(reply)
+            if not reply.tool_calls:
+                return {"input": query, "output": _text(reply.content), "intermediate_steps": steps}
+            results = self._run_tools(reply.tool_calls, config)
+            messages.extend(results)
+            steps.extend((call, result.content) for call, result in zip(reply.tool_calls, results))
+        return {"input": query, "intermediate_steps": steps,
+                "output": f"Stopped after {self.max_steps} steps without an answer. Last result: "
+                          f"{steps[-1][1][:500] if steps else ''}"}
+
+    async def astream(self, inputs, config=None, **kwargs) -> AsyncIterator[AgentEvent]:
+        """invoke() as it happens, ending with an "answer" event. Cancelling the consumer
+        cancels the model call or the tool calls in flight."""
+        query = inputs["input"] if isinstance(inputs, dict) else str(inputs)
+        messages = self._messages(query)
+        last = ""
+        for _ in range(self.max_steps):
+            reply = None
+            async for chunk in self._model.astream(messages, config=config):
+                reply = chunk if reply is None else reply + chunk
+                text = _text(chunk.content)
+                if text:
+                    yield AgentEvent("token", text)
+            reply = message_chunk_to_message(reply) if reply is not None else AIMessage("")
+            messages.append(reply)
+            if not reply.tool_calls:
+                yield AgentEvent("answer", _text(reply.content))
+                return
+            for call in reply.tool_calls:
+                yield AgentEvent("tool_call", call=call)
+            results = [None] * len(reply.tool_calls)
+            async for i, result in self._arun_tools(reply.tool_calls, config):
+                results[i] = result
+                last = result.content
+                yield AgentEvent("tool_result", str(result.content), reply.tool_calls[i])
+            messages.extend(results)
+        yield AgentEvent("answer", f"Stopped after {self.max_steps} steps without an answer. Last result: "
+                                   f"{str(last)[:500]}")
+
+    async def _arun_tools(self, calls, config):
+        """(index, ToolMessage) of each call as it finishes, MAX_PARALLEL at a time."""
+        limit = asyncio.Semaphore(MAX_PARALLEL)
+
+        async def run(i, call):
+            async with limit:
+                tool = self._by_name.get(call["name"])
+                if tool is None:
+                    return i, self._unknown(call)
+                try:
+                    return i, await tool.ainvoke({**call, "type": "tool_call"}, config=config)
+                except Exception as e:
+                    return i, ToolMessage(f"{type(e).__name__}: {e}", tool_call_id=call["id"], status="error")
+
+        tasks = [asyncio.ensure_future(run(i, call)) for i, call in enumerate(calls)]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _unknown(self, call):
+        return ToolMessage(f"Unknown tool {call['name']}, use one of {', '.join(self._by_name)}",
+                           tool_call_id=call["id"], status="error")
+
+    def _run_tools(self, calls, config) -> List[ToolMessage]:
+        def run(call):
+            if self.verbose:
+                print(f"→ {call['name']} {json.dumps(call['args'], default=str)}")
+            tool = self._by_name.get(call["name"])
+            if tool is None:
+                return self._unknown(call)
+            try:
+                return tool.invoke({**call, "type": "tool_call"}, config=config)
+            except Exception as e:
+                return ToolMessage(f"{type(e).__name__}: {e}", tool_call_id=call["id"], status="error")
+
+        if len(calls) == 1:
+            return [run(calls[0])]
+        with ThreadPoolExecutor(min(len(calls), MAX_PARALLEL)) as pool:
+            return list(pool.map(run, calls))
+
+
+def create_tool_calling_agent(
+    api_spec,
+    llm: BaseChatModel,
+    client=None,
+    system_prompt: str = "",
+    allowed_operations: Sequence[str] = ("GET", "POST"),
+    allow_dangerous_requests: bool = False,
+    endpoint_retriever: Optional[Any] = None,
+    extra_tools: Sequence[BaseTool] = (),
+    docs_token_budget: Optional[int] = CONTROLLER_DOCS_TOKEN_BUDGET,
+    max_steps: int = MAX_STEPS,
+    verbose: bool = False,
+    async_client: Optional[Any] = None,
+) -> ToolCallingAgent:
+    """Native tool-calling counterpart of caldera_planner.create_openapi_agent (same api_spec,
+    endpoint_retriever and extra_tools). With an AsyncCalderaClient, astream() sends
+    caldera_request on it."""
+    caldera_tools = CalderaTools(api_spec, client, allowed_operations, allow_dangerous_requests, docs_token_budget,
+                                 async_client)
+    return ToolCallingAgent(llm, api_spec, [*caldera_tools.tools(), *extra_tools], system_prompt,
+                            endpoint_retriever, docs_token_budget, max_steps, verbose)
@@ -1,9 +1,13 @@
 from dataclasses import dataclass
 from langchain.tools import tool, ToolRuntime
-import requests
+from caldera_client import get_client
+from circuit_breaker import CircuitOpenError
+from json_stream import DEFAULT_LIMIT, response_text
+from payload_sync import MultipartFile
 
 @tool
-def api_call(runtime: ToolRuntime, api_path: str, req_type: str, params: dict, payload: str, body: dict) -> str:
+def api_call(runtime: ToolRuntime, api_path: str, req_type: str, params: dict, payload: str, body: dict,
+             fields: str = "", limit: int = DEFAULT_LIMIT) -> str:
     """Make an API call to a specified endpoint. Depending on the req_type, it might include a payload or body which is json text.
 
     Args:
@@ -11,35 +15,46 @@ def api_call(runtime: ToolRuntime, api_path: str, req_type: str, params: dict, p
         api_path: Specific API path to call
         req_type: Type of HTTP request (GET, POST, PUT, DELETE, PATCH, HEAD)
         params: Query parameters for the API call
-        payload: File path for payload (if applicable)
+        payload: File path of a payload to upload (POST only)
         body: JSON body for the API call (if applicable)
+        fields: Comma-separated fields to keep from each returned item, e.g. 'paw,host,platform' (if applicable)
+        limit: Maximum number of list items to return; the rest are counted
     """
     req_type = req_type.lower()
-    url = "http://12.1.0.15:8888".strip()
     api_path = api_path.strip()
-    full_url = f"{url}/{api_path}"
-    auth = {"KEY": f"{os.getenv('CALDERA_API_TOKEN')}"}
 
-    payload = {'file': open(f"{payload}", "rb")} if payload else None
+    if payload and req_type != "post":
+        return f"Not sent: a payload file is only uploaded with POST, not {req_type.upper()}."
+    try:
+        upload = MultipartFile(payload) if payload else None
+    except OSError as e:
+        return f"Not sent: payload {payload!r} can't be read ({type(e).__name__}: {e})."
 
     body = runtime.state["body"]
 
-    if req_type == "get":
-        response = requests.get(full_url, params=params, headers=auth)
-    elif req_type == "post":
-        response = requests.post(full_url, files=payload, json=body, params=params, headers=auth)
-    elif req_type == "put":
-        response = requests.put(full_url, json=body, params=params, headers=auth)
-    elif req_type == "delete":
-        response = requests.delete(full_url, params=params, headers=auth)
-    elif req_type == "patch":
-        response = requests.patch(full_url, json=body, params=params, headers=auth)
-    elif req_type == "head":
-        response = requests.head(full_url, params=params, headers=auth)
-    else:
-        return f"Unsupported request type: {req_type}"
+    client = get_client()
+    try:
+        if req_type == "get":
+            response = client.get(api_path, params=params, stream=True)
+        elif req_type == "post":
+            if upload:  # streamed from disk, not read into memory first
+                response = client.post(api_path, data=upload, headers={"Content-Type": upload.content_type}, params=params)
+            else:
+                response = client.post(api_path, json=body, params=params)
+        elif req_type == "put":
+            response = client.put(api_path, json=body, params=params)
+        elif req_type == "delete":
+            response = client.delete(api_path, params=params)
+        elif req_type == "patch":
+            response = client.patch(api_path, json=body, params=params)
+        elif req_type == "head":
+            response = client.head(api_path, params=params)
+        else:
+            return f"Unsupported request type: {req_type}"
+    except CircuitOpenError as e:
+        return f"Not sent, {e}. Stop and tell the user the Caldera server is down."
     
-    return response.text
+    return response_text(response, fields=fields, limit=limit)
 
 @dataclass
 class Context: